@@ -0,0 +1,147 @@
+from granular_vis.benchmarks.synthetic_dump import write_dump
+from granular_vis.sim_tools import SimParams
+from time import perf_counter
+import argparse
+import json
+import os
+import tempfile
+import tracemalloc
+import numpy as np
+
+
+class BenchResult:
+    """
+    Timing, throughput and peak memory of a single benchmark
+    """
+
+    def __init__(self, name: str, seconds: float, peak_bytes: int, frames: int, particles: int) -> None:
+        self.name = name
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+        self.frames = frames
+        self.particles = particles
+
+    @property
+    def frames_per_s(self) -> float:
+        return self.frames / self.seconds if self.seconds > 0 else float("inf")
+
+    @property
+    def particles_per_s(self) -> float:
+        return self.frames * self.particles / self.seconds if self.seconds > 0 else float("inf")
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "peak_mb": self.peak_bytes / 2 ** 20,
+            "frames_per_s": self.frames_per_s,
+            "particles_per_s": self.particles_per_s,
+        }
+
+    def __str__(self) -> str:
+        return (f"{self.name:30s} {self.seconds:10.4f} s {self.frames_per_s:12.1f} frames/s "
+                f"{self.particles_per_s:14.4g} particles/s {self.peak_bytes / 2 ** 20:10.1f} MB peak")
+
+
+def measure(name: str, func, frames: int, particles: int, repeat: int = 3, setup=None):  # -> tuple[BenchResult, Any]:
+    """
+    Function to time `func`, keeping the best of `repeat` runs and the peak memory
+    allocated by the last one (as seen by `tracemalloc`, i.e. in this process only)
+        - `setup` : called before every run, outside of the timing
+    """
+    best = float("inf")
+    peak = 0
+    value = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        start = perf_counter()
+        value = func()
+        best = min(best, perf_counter() - start)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return BenchResult(name, best, peak, frames, particles), value
+
+
+def run(num_particles: int = 2000, num_frames: int = 50, repeat: int = 3, workers: int = None,
+        directory: str = None, shuffle: bool = True) -> list[BenchResult]:
+    """
+    Function to write a synthetic dump and time the loading and analysis hot paths on it
+    """
+    results = []
+    with tempfile.TemporaryDirectory(dir=directory) as tmp:
+        filepath = os.path.join(tmp, "bench.dump")
+        write_dump(filepath, num_particles=num_particles, num_frames=num_frames, shuffle=shuffle)
+        n, f = num_particles, num_frames
+
+        def __add(name, func, frames=1, **kwargs):
+            result, value = measure(name, func, frames, n, repeat=repeat, **kwargs)
+            results.append(result)
+            return value
+
+        # loading
+        sim = __add("SimParams (index scan)", lambda: SimParams(filepath, cache=False), frames=f)
+        SimParams(filepath, cache=True).render_bed_single()
+        __add("SimParams (cached index)", lambda: SimParams(filepath, cache=True), frames=f)
+        __add("get_bed_static", lambda: sim.get_bed_static(f // 2))
+        __add("render_bed_single", sim.render_bed_single, frames=f)
+        __add("render_bed_multi", lambda: sim.render_bed_multi(workers=workers), frames=f)
+        subset = sim.initial_state.ids[::max(1, n // 100)]
+        __add("render_bed_single (1% ids)", lambda: sim.render_bed_single(ids=subset, fields=['x', 'y']), frames=f)
+        cached = SimParams(filepath, cache=True)
+        __add("render_bed_single (cached)", cached.render_bed_single, frames=f)
+
+        # analysis
+        sim.render_bed_single()
+        __add("differentiate", sim.differentiate, frames=f)
+        __add("differentiate (savgol)", lambda: sim.differentiate(method="savgol", window=min(7, f - f % 2 - 1)),
+              frames=f)
+        __add("get_surface_masks", sim.get_surface_masks, frames=f)
+
+        bed = sim.get_bed_static(f // 2)
+        __add("Bed.get_surface", bed.get_surface)
+        __add("Bed.get_surface (columns)", lambda: bed.get_surface(method="columns"))
+        x = bed.get_data('x', as_array=True)
+        y = bed.get_data('y', as_array=True)
+        mesh = (np.linspace(x.min(), x.max(), 50), np.linspace(y.min(), y.max(), 50))
+        __add("Bed.is_mesh (50 x 50)", lambda: bed.is_mesh(*mesh))
+        __add("Bed.is_mesh (unique)", lambda: bed.is_mesh(*mesh, unique=True))
+
+        profile = bed.make_profile()
+        __add("BedProfile.p_circle_count_all", lambda: profile.p_circle_count_all(2.5))
+        __add("BedProfile.p_nearest_all", profile.p_nearest_all)
+        __add("BedProfile.p_is_surface_all", profile.p_is_surface_all)
+
+    return results
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks of the granular bed loading and analysis paths")
+    parser.add_argument("--particles", type=int, default=2000, help="number of bed particles")
+    parser.add_argument("--frames", type=int, default=50, help="number of frames")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark, the best one is kept")
+    parser.add_argument("--workers", type=int, default=None, help="processes for render_bed_multi")
+    parser.add_argument("--sorted", action="store_true", help="write the rows of every frame sorted by ID")
+    parser.add_argument("--dir", default=None, help="where to write the synthetic dump")
+    parser.add_argument("--json", default=None, help="also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = run(args.particles, args.frames, repeat=args.repeat, workers=args.workers,
+                  directory=args.dir, shuffle=not args.sorted)
+
+    print(f"\n{args.particles} particles, {args.frames} frames")
+    for result in results:
+        print(result)
+
+    if args.json is not None:
+        with open(args.json, 'w') as output_file:
+            json.dump({
+                "particles": args.particles,
+                "frames": args.frames,
+                "results": [result.as_dict() for result in results],
+            }, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
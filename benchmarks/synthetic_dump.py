@@ -0,0 +1,57 @@
+import numpy as np
+
+
+def write_dump(filepath: str, num_particles: int = 2000, num_frames: int = 50,
+               fields=("id", "type", "xs", "ys", "radius"), shuffle: bool = False,
+               seed: int = 0, box: tuple[float, float] = (0.3, 0.3),
+               timestep_stride: int = 1000) -> None:
+    """
+    Function to write a synthetic LAMMPS dump of a settled granular bed struck by a disc
+        - Arguments:
+            - `filepath` : where to write the dump
+            - `num_particles` : the number of bed particles, the disc comes on top
+            - `num_frames` : the number of frames (timesteps) to write
+            - `fields` : the columns of the `ITEM: ATOMS` line, out of
+              `id`, `type`, `x`, `y`, `xs`, `ys`, `radius`, `vx`, `vy`
+            - `shuffle` : write the rows of every frame in a random order, like an unsorted dump
+            - `timestep_stride` : the timestep difference between two frames
+
+    The bed is a jittered lattice filling the lower half of the box. Every particle drifts
+    with a small random velocity and the disc, which has the largest ID, falls into the bed.
+    """
+    rng = np.random.default_rng(seed)
+    box_w, box_h = box
+
+    # bed particles on a jittered lattice
+    mean_radius = np.sqrt(box_w * box_h / 2 / num_particles / np.pi) * 0.9
+    columns = max(1, int(box_w / (2 * mean_radius)))
+    ids = np.arange(1, num_particles + 2)
+    x = (np.arange(num_particles) % columns + 0.5) * 2 * mean_radius
+    y = (np.arange(num_particles) // columns + 0.5) * 2 * mean_radius
+    x = np.append(x + rng.normal(0, 0.05 * mean_radius, num_particles), box_w / 2)
+    y = np.append(y + rng.normal(0, 0.05 * mean_radius, num_particles), 0.9 * box_h)
+    radius = np.append(rng.uniform(0.8, 1.0, num_particles) * mean_radius, 10 * mean_radius)
+    types = np.append(np.ones(num_particles), 2)
+
+    velocity = rng.normal(0, 0.01 * mean_radius, (2, num_particles + 1))
+    velocity[:, -1] = [0, -0.4 * box_h / max(1, num_frames)]
+
+    with open(filepath, 'w') as output_file:
+        for frame in range(num_frames):
+            px = np.clip(x + velocity[0] * frame, 0, box_w)
+            py = np.clip(y + velocity[1] * frame, 0, box_h)
+            data = {
+                "id": ids, "type": types, "radius": radius,
+                "x": px, "y": py, "xs": px / box_w, "ys": py / box_h,
+                "vx": velocity[0], "vy": velocity[1],
+            }
+            rows = np.column_stack([data[field] for field in fields])
+            if shuffle:
+                rows = rows[rng.permutation(len(rows))]
+
+            output_file.write(f"ITEM: TIMESTEP\n{frame * timestep_stride}\n"
+                              f"ITEM: NUMBER OF ATOMS\n{len(rows)}\n"
+                              f"ITEM: BOX BOUNDS pp pp pp\n0 {box_w}\n0 {box_h}\n-0.001 0.001\n"
+                              f"ITEM: ATOMS {' '.join(fields)}\n")
+            formats = ["%d" if field in ("id", "type") else "%.8g" for field in fields]
+            np.savetxt(output_file, rows, fmt=formats)
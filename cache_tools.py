@@ -0,0 +1,302 @@
+from granular_vis.traj_tools import Trajectory
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import numpy as np
+
+
+class SidecarCache:
+    """
+    Binary cache of a parsed dump file, kept in a `<dump file>.cache` directory next to it
+
+    The cache holds the frame index and the parsed trajectory arrays as `.npy` files, so
+    they can be memory-mapped instead of parsing the dump again. It is keyed on the size,
+    modification time and a content hash of the dump file, and is never used once any of
+    them changes.
+    """
+
+    VERSION = 3
+
+    # blocks of the file that go into the content hash
+    HASH_BLOCK = 1 << 16
+    HASH_SAMPLES = 64
+
+    def __init__(self, filepath: str, directory: str = None, full_hash: bool = False) -> None:
+        """
+            - Arguments:
+                - `filepath` : path to the dump file
+                - `directory` : where to keep the cache, `<filepath>.cache` by default
+                - `full_hash` : hash the whole file instead of evenly spaced blocks of it
+        """
+        self.filepath = filepath
+        self.directory = directory if directory is not None else f"{filepath}.cache"
+        self.full_hash = full_hash
+
+        self.__key = None
+
+    def file_key(self) -> dict:
+        """
+        Method to get the size, modification time and content hash of the dump file
+        """
+        if self.__key is not None:
+            return self.__key
+
+        stat = os.stat(self.filepath)
+        digest = hashlib.blake2b(digest_size=16)
+        with open(self.filepath, 'rb') as input_file:
+            if self.full_hash or stat.st_size <= self.HASH_BLOCK * self.HASH_SAMPLES:
+                for block in iter(lambda: input_file.read(1 << 20), b""):
+                    digest.update(block)
+            else:
+                # the first and last blocks always go in, since appends and headers change there
+                last = stat.st_size - self.HASH_BLOCK
+                for offset in np.linspace(0, last, self.HASH_SAMPLES).astype(np.int64):
+                    input_file.seek(offset)
+                    digest.update(input_file.read(self.HASH_BLOCK))
+
+        self.__key = {
+            "version": self.VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "hash": digest.hexdigest(),
+            "full_hash": self.full_hash or stat.st_size <= self.HASH_BLOCK * self.HASH_SAMPLES,
+        }
+        return self.__key
+
+    def refresh_key(self) -> None:
+        """
+        Method to forget the stored key, e.g. after the dump file was appended to
+        """
+        self.__key = None
+
+    def __path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def __read_meta(self):  # -> dict | None:
+        try:
+            with open(self.__path("meta.json"), 'r') as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+        if meta.get("key") != self.file_key():
+            return None
+        return meta
+
+    def __write_meta(self, meta: dict) -> None:
+        meta["key"] = self.file_key()
+        tmp = self.__path("meta.json.tmp")
+        with open(tmp, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp, self.__path("meta.json"))
+
+    def __save_array(self, name: str, values) -> None:
+        tmp = self.__path(f"{name}.tmp.npy")
+        np.save(tmp, np.asarray(values))
+        os.replace(tmp, self.__path(f"{name}.npy"))
+
+    def is_valid(self) -> bool:
+        """
+        Method to check whether the cache exists and matches the current dump file
+        """
+        return self.__read_meta() is not None
+
+    def clear(self) -> None:
+        """
+        Method to remove every file in the cache directory
+        """
+        if not os.path.isdir(self.directory):
+            return
+        # the meta file goes first so a half removed cache is never valid
+        names = sorted(os.listdir(self.directory), key=lambda name: name != "meta.json")
+        for name in names:
+            os.remove(self.__path(name))
+
+    def save_index(self, arrays: dict, info: dict) -> None:
+        """
+        Method to store the frame index, invalidating anything cached before
+            - Arguments:
+                - `arrays` : the per-frame arrays of the index
+                - `info` : the JSON serializable part of the index
+        """
+        self.clear()
+        os.makedirs(self.directory, exist_ok=True)
+        for name, values in arrays.items():
+            self.__save_array(f"index_{name}", values)
+        self.__write_meta({"index": {"arrays": list(arrays), "info": info}})
+
+    def load_index(self):  # -> tuple[dict, dict] | None:
+        """
+        Method to load the frame index
+            - Returns : the (arrays, info) passed to `save_index`, or None if the cache is not valid
+        """
+        meta = self.__read_meta()
+        if meta is None or "index" not in meta:
+            return None
+        arrays = {
+            name: np.load(self.__path(f"index_{name}.npy"))
+            for name in meta["index"]["arrays"]
+        }
+        return arrays, meta["index"]["info"]
+
+    def save_trajectory(self, traj: Trajectory, name: str = "trajectory") -> None:
+        """
+        Method to store the parsed arrays of a trajectory
+        """
+        meta = self.__read_meta()
+        if meta is None:
+            raise ValueError(f"The cache in {self.directory} has to hold a valid index first.")
+
+        self.__save_array(f"{name}_ids", traj.ids)
+        self.__save_array(f"{name}_timesteps", traj.timesteps)
+        for i, field in enumerate(traj.fields):
+            self.__save_array(f"{name}_field{i}", traj.get_field(field))
+
+        meta[name] = {"fields": traj.fields}
+        self.__write_meta(meta)
+
+    def load_trajectory(self, name: str = "trajectory", mmap: bool = True):  # -> Trajectory | None:
+        """
+        Method to load a stored trajectory, memory-mapping the field arrays by default
+            - Returns : the `Trajectory`, or None if it is not in the cache
+        """
+        meta = self.__read_meta()
+        if meta is None or name not in meta:
+            return None
+
+        mmap_mode = 'r' if mmap else None
+        return Trajectory(
+            np.load(self.__path(f"{name}_ids.npy")),
+            np.load(self.__path(f"{name}_timesteps.npy")),
+            {
+                field: np.load(self.__path(f"{name}_field{i}.npy"), mmap_mode=mmap_mode)
+                for i, field in enumerate(meta[name]["fields"])
+            }
+        )
+
+
+class FrameCache:
+    """
+    In-memory least recently used cache of parsed frames and the products derived from
+    them (beds, profiles, surface masks), bounded by a byte budget
+
+    The keys are tuples starting with the kind of product and the frame index, e.g.
+    `("bed", idx, absolute_coords, ids)`, so every product of a frame can be evicted at
+    once. The values are shared by every caller and should not be modified.
+    """
+
+    DEFAULT_BYTES = 256 << 20
+
+    def __init__(self, max_bytes: int = DEFAULT_BYTES) -> None:
+        """
+            - `max_bytes` : the memory budget, the least recently used entries are evicted
+              to stay under it. Values larger than the budget are never stored.
+        """
+        self.max_bytes = max_bytes
+        self.__entries: OrderedDict = OrderedDict()
+        self.num_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key) -> bool:
+        return key in self.__entries
+
+    def get(self, key, default=None):
+        """
+        Method to get a cached value, marking it as the most recently used
+        """
+        if key not in self.__entries:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.__entries.move_to_end(key)
+        return self.__entries[key][0]
+
+    def put(self, key, value, num_bytes: int = None) -> None:
+        """
+        Method to store a value, evicting the least recently used ones to make room for it
+            - `num_bytes` : the size of the value, estimated from its arrays by default
+        """
+        if num_bytes is None:
+            num_bytes = _size_of(value)
+        self.evict(key)
+        if num_bytes > self.max_bytes:
+            return
+        self.__entries[key] = (value, num_bytes)
+        self.num_bytes += num_bytes
+        while self.num_bytes > self.max_bytes:
+            _, (_, size) = self.__entries.popitem(last=False)
+            self.num_bytes -= size
+            self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """
+        Method to get a cached value, or create it with `factory()` and store it
+        """
+        if key in self.__entries:
+            return self.get(key)
+        self.misses += 1
+        value = factory()
+        self.put(key, value)
+        return value
+
+    def evict(self, key) -> bool:
+        """
+        Method to remove a single entry, returns whether it was cached
+        """
+        entry = self.__entries.pop(key, None)
+        if entry is None:
+            return False
+        self.num_bytes -= entry[1]
+        return True
+
+    def evict_frames(self, frames) -> int:
+        """
+        Method to remove every product of the frames passed in, returns the number of entries removed
+        """
+        frames = set(int(idx) for idx in frames)
+        keys = [key for key in self.__entries if key[1] in frames]
+        for key in keys:
+            self.evict(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        self.__entries.clear()
+        self.num_bytes = 0
+
+    def get_stats(self) -> dict:
+        return {
+            "entries": len(self.__entries),
+            "bytes": self.num_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def _size_of(value, seen: set = None) -> int:
+    """
+    Function to estimate the memory held by a value from the numpy arrays it holds,
+    looking into containers and object attributes
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(_size_of(item, seen) for item in value.values()) + 64 * len(value)
+    if isinstance(value, (list, tuple, set)):
+        return sum(_size_of(item, seen) for item in value) + 8 * len(value)
+    if hasattr(value, "__dict__"):
+        return _size_of(vars(value), seen)
+    return 64
@@ -0,0 +1,93 @@
+from functools import lru_cache
+import numpy as np
+
+
+# the axes of the simulation box, in the order of the `BOX BOUNDS` lines
+AXES = ("x", "y", "z")
+
+
+@lru_cache(maxsize=None)
+def coordinate_plan(header: tuple, absolute_coords=True, unwrap=False) -> tuple:
+    """
+    Function to work out how the columns of a frame become the fields of a `Trajectory`
+        - Arguments:
+            - `header` : the column names of the `ITEM: ATOMS` line
+            - `absolute_coords` : turn the position of every axis into box units, named
+              `x`, `y` and `z`, from the first of `x`, `xu`, `xs`, `xsu` found (the unwrapped
+              ones first with `unwrap`). The other position columns are kept as they are,
+              but for a raw `x` left out for `xu` (or `xsu`), which would take the same name.
+            - `unwrap` : add the image flags (`ix`, `iy`, `iz`) to the wrapped positions, so
+              the particles crossing a periodic boundary don't jump across the box
+        - Returns : a tuple of (field, column, axis, from scaled, image column, in box units)
+          for every column but `id`, see `transform`. The axis and image column are -1
+          when they don't apply.
+    """
+    header = list(header)
+    chosen = {}
+    if absolute_coords:
+        for axis, name in enumerate(AXES):
+            order = ("u", "su", "", "s") if unwrap else ("", "u", "s", "su")
+            for suffix in order:
+                if name + suffix in header:
+                    chosen[header.index(name + suffix)] = (axis, suffix)
+                    break
+
+    # the axis fields made from the chosen columns
+    taken = {AXES[axis] for axis, _ in chosen.values()}
+
+    plan = []
+    for col, field in enumerate(header):
+        if field == "id":
+            continue
+        axis, suffix = chosen.get(col, (-1, None))
+        if axis < 0:
+            if field in taken:
+                continue
+            # the positions kept as they are can still be unwrapped
+            for a, name in enumerate(AXES):
+                if field in (name, name + "s"):
+                    axis, suffix = a, field[1:]
+            if axis < 0 or not unwrap:
+                plan.append((field, col, -1, False, -1, False))
+                continue
+            out_field = field
+        else:
+            out_field = AXES[axis]
+
+        image = "i" + AXES[axis]
+        image_col = header.index(image) if unwrap and suffix in ("", "s") and image in header else -1
+        from_scaled = absolute_coords and suffix in ("s", "su") and col in chosen
+        in_box_units = suffix in ("", "u") or from_scaled
+        plan.append((out_field, col, axis, from_scaled, image_col, in_box_units))
+    return tuple(plan)
+
+
+def output_fields(header, absolute_coords=True, unwrap=False) -> list[str]:
+    """
+    Function to get the names of the fields a frame is turned into, see `coordinate_plan`
+    """
+    return [field for field, *_ in coordinate_plan(tuple(header), absolute_coords, unwrap)]
+
+
+def transform(values, header, bounds, absolute_coords=True, unwrap=False) -> dict[str, np.ndarray]:
+    """
+    Function to turn the parsed atom rows of a frame into fields, for every row at once
+        - Arguments:
+            - `values` : the <rows> x <columns> array of the frame
+            - `bounds` : the 3 x 2 (lo, hi) box bounds of the frame
+            - see `coordinate_plan` for the others
+        - Returns : the 1D array of every field by name
+    """
+    bounds = np.asarray(bounds, dtype=np.float64)
+    out = {}
+    for field, col, axis, from_scaled, image_col, in_box_units in coordinate_plan(
+            tuple(header), absolute_coords, unwrap):
+        column = values[:, col]
+        if axis >= 0:
+            lo, hi = bounds[axis]
+            if from_scaled:
+                column = lo + column * (hi - lo)
+            if image_col >= 0:
+                column = column + values[:, image_col] * ((hi - lo) if in_box_units else 1.0)
+        out[field] = column
+    return out
@@ -0,0 +1,477 @@
+from granular_vis.granular_bed.bed_tools import Bed
+from granular_vis.traj_tools import Frame, Trajectory
+import json
+import os
+import numpy as np
+
+
+# the file formats by extension
+FORMATS = {".h5": "hdf5", ".hdf5": "hdf5", ".zarr": "zarr", ".parquet": "parquet", ".pq": "parquet"}
+
+# the version of the layout of the exported files
+VERSION = 1
+
+# the key of the layout description in the Parquet schema metadata
+PARQUET_KEY = b"granular_vis"
+
+# the key of the frames and timesteps written in the Parquet file metadata
+PARQUET_FRAMES_KEY = b"granular_vis_frames"
+
+
+def get_format(filepath: str, file_format: str = None) -> str:
+    """
+    Function to get the format of an export from its extension, unless it is passed in
+    """
+    if file_format is None:
+        file_format = FORMATS.get(os.path.splitext(filepath.rstrip("/"))[1].lower())
+        if file_format is None:
+            raise ValueError(f"Can't tell the export format of {filepath} from its extension, "
+                             f"expected one of {sorted(FORMATS)}.")
+    if file_format not in FORMATS.values():
+        raise ValueError(f"Unknown export format \"{file_format}\".")
+    return file_format
+
+
+def export_frames(filepath: str, frames, num_frames: int, dt: float = 1.0, file_format: str = None,
+                  chunk_frames: int = 64, chunk_particles: int = None, compression: str = None,
+                  source: str = None, progress=None) -> int:
+    """
+    Function to write a stream of frames holding the same particles and fields to a file,
+    `chunk_frames` frames at a time, so the memory used does not depend on the number of frames
+        - Arguments:
+            - `frames` : an iterable of `Frame`, e.g. from `SimParams.iter_kinematics`
+            - `num_frames` : the number of frames in the stream
+            - `dt` : the simulation time of a timestep, stored with the data
+            - `file_format` : `'hdf5'`, `'zarr'` or `'parquet'`, from the extension by default
+                - `'hdf5'`, `'zarr'` : one <frames> x <particles> array per field, chunked
+                  by `chunk_frames` x `chunk_particles` (every particle by default)
+                - `'parquet'` : a long-form table with one row per particle and frame, and
+                  a row group per chunk of frames
+            - `compression` : the name of the codec, `'gzip'` for HDF5, the default of the
+              installed `zarr` for Zarr (e.g. `'zstd'`, `'gzip'` or `'blosc'` otherwise) and
+              `'zstd'` for Parquet by default
+            - `source` : the path of the dump file, stored with the data
+            - `progress` : called as `progress(done, total)` every time a chunk is written
+        - Returns : the number of frames written
+    """
+    file_format = get_format(filepath, file_format)
+    writer = None
+    done = 0
+    try:
+        for frame in frames:
+            if writer is None:
+                writer = _WRITERS[file_format](filepath, frame.ids, frame.fields, num_frames, dt, chunk_frames,
+                                          chunk_particles, compression, source)
+            writer.add(frame)
+            done += 1
+            if writer.is_full():
+                writer.flush()
+                if progress is not None:
+                    progress(done, num_frames)
+        if writer is not None:
+            writer.flush()
+            if progress is not None:
+                progress(done, num_frames)
+    finally:
+        if writer is not None:
+            writer.close()
+    return done
+
+
+class _ChunkWriter:
+    """
+    Buffer of a chunk of frames, written out by the subclasses once full
+    """
+
+    def __init__(self, ids, fields, num_frames: int, dt: float, chunk_frames: int) -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.fields = list(fields)
+        self.num_frames = num_frames
+        self.dt = dt
+        self.chunk_frames = chunk_frames
+
+        # the rows of the chunk being filled, and the number of frames written before it
+        self.__frames = np.empty(chunk_frames, dtype=np.int64)
+        self.__timesteps = np.empty(chunk_frames, dtype=np.int64)
+        self.__columns = {field: np.empty((chunk_frames, len(self.ids))) for field in self.fields}
+        self.__rows = 0
+        self.written = 0
+
+    def add(self, frame: Frame) -> None:
+        if not np.array_equal(frame.ids, self.ids):
+            raise ValueError(f"Frame {frame.idx} does not hold the particles of the first frame.")
+        row = self.__rows
+        self.__frames[row] = frame.idx
+        self.__timesteps[row] = frame.timestep
+        for field in self.fields:
+            self.__columns[field][row] = frame.get_field(field)
+        self.__rows += 1
+
+    def is_full(self) -> bool:
+        return self.__rows == self.chunk_frames
+
+    def flush(self) -> None:
+        rows = self.__rows
+        if rows == 0:
+            return
+        self.write(self.written, self.__frames[:rows], self.__timesteps[:rows],
+                   {field: values[:rows] for field, values in self.__columns.items()})
+        self.written += rows
+        self.__rows = 0
+
+    def write(self, start: int, frames, timesteps, columns: dict) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class _ArrayWriter(_ChunkWriter):
+    """
+    Writer of the HDF5 and Zarr exports, laid out as:
+        - `ids` : the particle IDs, one per column of the field arrays
+        - `frames`, `timesteps` : the frame index in the dump file and the timestep value
+          of every row of the field arrays
+        - `fields/<field>` : a <frames> x <particles> float64 array per field
+        - the attributes `format`, `version`, `dt`, `source` and `fields` (in order)
+    """
+
+    def __init__(self, filepath, ids, fields, num_frames, dt, chunk_frames, chunk_particles,
+                 compression, source) -> None:
+        super().__init__(ids, fields, num_frames, dt, chunk_frames)
+        self.root = self.open(filepath)
+        shape = (num_frames, len(self.ids))
+        chunks = (max(1, min(chunk_frames, num_frames)),
+                  max(1, min(chunk_particles or len(self.ids), len(self.ids))))
+        self.create(self.root, "ids", data=self.ids)
+        self.frames = self.create(self.root, "frames", shape=(num_frames,), dtype=np.int64)
+        self.timesteps = self.create(self.root, "timesteps", shape=(num_frames,), dtype=np.int64)
+        group = self.root.require_group("fields")
+        self.arrays = {
+            field: self.create(group, field, shape=shape, chunks=chunks, dtype=np.float64, compression=compression)
+            for field in self.fields
+        }
+        self.root.attrs.update({"format": "granular_vis", "version": VERSION, "dt": dt,
+                                "source": source or "", "fields": self.fields})
+
+    def open(self, filepath):
+        raise NotImplementedError
+
+    def create(self, group, name, data=None, shape=None, chunks=None, dtype=None, compression=None):
+        raise NotImplementedError
+
+    def write(self, start, frames, timesteps, columns) -> None:
+        end = start + len(frames)
+        self.frames[start:end] = frames
+        self.timesteps[start:end] = timesteps
+        for field, values in columns.items():
+            self.arrays[field][start:end] = values
+
+    def close(self) -> None:
+        # a stream shorter than announced leaves no empty rows behind
+        if self.written < self.num_frames:
+            for array in [self.frames, self.timesteps] + list(self.arrays.values()):
+                array.resize((self.written,) + tuple(array.shape[1:]))
+
+
+class _Hdf5Writer(_ArrayWriter):
+
+    def open(self, filepath):
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("Exporting to HDF5 needs the `h5py` package.") from None
+        return h5py.File(filepath, "w")
+
+    def create(self, group, name, data=None, shape=None, chunks=None, dtype=None, compression=None):
+        if data is not None:
+            return group.create_dataset(name, data=data)
+        return group.create_dataset(name, shape=shape, dtype=dtype, chunks=chunks or True,
+                                    maxshape=(None,) + tuple(shape[1:]),
+                                    fillvalue=np.nan if dtype == np.float64 else 0,
+                                    compression=compression or "gzip")
+
+    def close(self) -> None:
+        super().close()
+        self.root.close()
+
+
+class _ZarrWriter(_ArrayWriter):
+
+    def open(self, filepath):
+        try:
+            import zarr
+        except ImportError:
+            raise ImportError("Exporting to Zarr needs the `zarr` package.") from None
+        return zarr.open_group(filepath, mode="w")
+
+    def create(self, group, name, data=None, shape=None, chunks=None, dtype=None, compression=None):
+        # `create_array` and `compressors` in zarr 3, `create_dataset` and `compressor` before
+        if hasattr(group, "create_array"):
+            create = group.create_array
+            codec = {"compressors": {"name": compression, "configuration": {}}} if compression else {}
+        else:
+            import numcodecs
+            create = group.create_dataset
+            codec = {"compressor": numcodecs.get_codec({"id": compression})} if compression else {}
+        if data is not None:
+            return create(name, data=data)
+        return create(name, shape=shape, dtype=dtype, chunks=chunks or shape,
+                      fill_value=np.nan if dtype == np.float64 else 0, **codec)
+
+
+class _ParquetWriter(_ChunkWriter):
+    """
+    Writer of the long-form Parquet export, with the columns `frame`, `timestep`, `time`,
+    `id` and one per field. The rows of the particles missing from a frame are left out.
+    The particle IDs, fields and `dt` are kept in the schema metadata, and the frames and
+    timesteps in the file metadata, so the frames without any particle are kept too.
+    """
+
+    def __init__(self, filepath, ids, fields, num_frames, dt, chunk_frames, chunk_particles,
+                 compression, source) -> None:
+        super().__init__(ids, fields, num_frames, dt, chunk_frames)
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Exporting to Parquet needs the `pyarrow` package.") from None
+        self.pa = pa
+        layout = {"version": VERSION, "dt": dt, "source": source or "", "fields": self.fields,
+                  "ids": self.ids.tolist()}
+        self.schema = pa.schema(
+            [("frame", pa.int64()), ("timestep", pa.int64()), ("time", pa.float64()), ("id", pa.int64())]
+            + [(field, pa.float64()) for field in self.fields],
+            metadata={PARQUET_KEY: json.dumps(layout).encode()}
+        )
+        self.writer = pq.ParquetWriter(filepath, self.schema, compression=compression or "zstd")
+        self.frames, self.timesteps = [], []
+
+    def write(self, start, frames, timesteps, columns) -> None:
+        num_particles = len(self.ids)
+        values = np.stack([columns[field] for field in self.fields])
+        present = ~np.isnan(values).all(axis=0).ravel()
+        data = {
+            "frame": np.repeat(frames, num_particles)[present],
+            "timestep": np.repeat(timesteps, num_particles)[present],
+            "time": np.repeat(timesteps * self.dt, num_particles)[present],
+            "id": np.tile(self.ids, len(frames))[present],
+        }
+        for i, field in enumerate(self.fields):
+            data[field] = values[i].ravel()[present]
+        table = self.pa.table(data, schema=self.schema)
+        # a chunk without any particle has no row group, its frames are in the file metadata
+        if len(table):
+            self.writer.write_table(table, row_group_size=len(table))
+        self.frames.extend(frames.tolist())
+        self.timesteps.extend(timesteps.tolist())
+
+    def close(self) -> None:
+        self.writer.add_key_value_metadata(
+            {PARQUET_FRAMES_KEY: json.dumps({"frames": self.frames, "timesteps": self.timesteps})})
+        self.writer.close()
+
+
+_WRITERS = {"hdf5": _Hdf5Writer, "zarr": _ZarrWriter, "parquet": _ParquetWriter}
+
+
+def open_export(filepath: str, file_format: str = None):  # -> StoredTrajectory:
+    """
+    Function to open a file written by `export_frames` for random access to its frames
+    """
+    file_format = get_format(filepath, file_format)
+    if file_format == "parquet":
+        return _ParquetStore(filepath)
+    if file_format == "hdf5":
+        try:
+            import h5py
+        except ImportError:
+            raise ImportError("Reading HDF5 exports needs the `h5py` package.") from None
+        return _ArrayStore(h5py.File(filepath, "r"))
+    try:
+        import zarr
+    except ImportError:
+        raise ImportError("Reading Zarr exports needs the `zarr` package.") from None
+    return _ArrayStore(zarr.open_group(filepath, mode="r"))
+
+
+class StoredTrajectory:
+    """
+    Trajectory read back from an export, with the API of `Trajectory` but reading the
+    frames from the file only when they are asked for
+
+        - `ids` : sorted array of particle IDs
+        - `frames` : the frame index in the dump file of every stored frame
+        - `timesteps` : the timestep value of every stored frame
+        - `fields` : the stored fields, in order
+        - `dt` : the simulation time of a timestep
+    """
+
+    def __init__(self, ids, frames, timesteps, fields, dt: float = 1.0, source: str = "") -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.frames = np.asarray(frames, dtype=np.int64)
+        self.timesteps = np.asarray(timesteps, dtype=np.int64)
+        self.fields = list(fields)
+        self.dt = dt
+        self.source = source
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.timesteps)
+
+    @property
+    def num_particles(self) -> int:
+        return len(self.ids)
+
+    def get_block(self, start: int, stop: int, fields=None) -> dict[str, np.ndarray]:
+        """
+        Method to read the <frames> x <particles> arrays of the stored frames `start` to `stop`
+        """
+        raise NotImplementedError
+
+    def get_field(self, field: str):  # -> np.ndarray:
+        """
+        Method to get the <frames> x <particles> values of a single field
+        """
+        if field not in self.fields:
+            raise KeyError(f"Input parameter \"{field}\" was not found.")
+        return self.get_block(0, self.num_frames, [field])[field]
+
+    def get_frame(self, idx: int, fields=None) -> dict[str, np.ndarray]:
+        """
+        Method to get the data of every particle at a single stored frame, by field name
+        """
+        idx = range(self.num_frames)[idx]
+        return {field: values[0] for field, values in self.get_block(idx, idx + 1, fields).items()}
+
+    def get_bed_static(self, idx: int = 0, include_only=None) -> Bed:
+        """
+        Method to get the bed at a single stored frame
+        """
+        columns = self.get_frame(idx)
+        if include_only is None:
+            return Bed.from_arrays(self.ids, columns)
+        keep = np.isin(self.ids, np.fromiter(include_only, dtype=np.int64))
+        return Bed.from_arrays(self.ids[keep], {field: values[keep] for field, values in columns.items()})
+
+    def iter_frames(self, start: int = 0, stop: int = None, step: int = 1, fields=None,
+                    block_frames: int = 64):  # -> Generator[Frame]:
+        """
+        Generator over the stored frames, reading `block_frames` consecutive frames at a time
+        """
+        rows = range(*slice(start, stop, step).indices(self.num_frames))
+        for first in range(0, len(rows), block_frames):
+            block = rows[first:first + block_frames]
+            values = self.get_block(block.start, block[-1] + 1, fields)
+            for row in block:
+                yield Frame(int(self.frames[row]), int(self.timesteps[row]), self.ids,
+                            {field: array[row - block.start] for field, array in values.items()})
+
+    def to_trajectory(self, start: int = 0, stop: int = None, fields=None) -> Trajectory:
+        """
+        Method to load a range of stored frames into memory
+        """
+        start, stop, _ = slice(start, stop).indices(self.num_frames)
+        return Trajectory(self.ids, self.timesteps[start:stop], self.get_block(start, stop, fields))
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):  # -> StoredTrajectory:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+class _ArrayStore(StoredTrajectory):
+    """
+    HDF5 or Zarr export, whose field arrays are read lazily chunk by chunk
+    """
+
+    def __init__(self, root) -> None:
+        attrs = dict(root.attrs)
+        if attrs.get("format") != "granular_vis":
+            raise ValueError("The file was not written by `export_frames`.")
+        super().__init__(root["ids"][:], root["frames"][:], root["timesteps"][:], list(attrs["fields"]),
+                         float(attrs["dt"]), str(attrs.get("source", "")))
+        self.root = root
+
+    def get_field(self, field: str):  # -> h5py.Dataset | zarr.Array:
+        """
+        Method to get the stored array of a single field, read only when it is sliced
+        """
+        if field not in self.fields:
+            raise KeyError(f"Input parameter \"{field}\" was not found.")
+        return self.root["fields"][field]
+
+    def get_block(self, start: int, stop: int, fields=None) -> dict[str, np.ndarray]:
+        fields = self.fields if fields is None else fields
+        return {field: np.asarray(self.get_field(field)[start:stop]) for field in fields}
+
+    def close(self) -> None:
+        if hasattr(self.root, "close"):
+            self.root.close()
+
+
+class _ParquetStore(StoredTrajectory):
+    """
+    Long-form Parquet export, whose frames are read from the row groups holding them, picked
+    by the frame statistics of every row group
+    """
+
+    def __init__(self, filepath: str) -> None:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet exports needs the `pyarrow` package.") from None
+        self.file = pq.ParquetFile(filepath)
+        metadata = self.file.schema_arrow.metadata or {}
+        if PARQUET_KEY not in metadata:
+            raise ValueError(f"{filepath} was not written by `export_frames`.")
+        layout = json.loads(metadata[PARQUET_KEY])
+
+        # the frames stored, in order, from the file metadata, or from the two frame columns
+        # of the files written without it
+        stored = self.file.metadata.metadata or {}
+        if PARQUET_FRAMES_KEY in stored:
+            written = json.loads(stored[PARQUET_FRAMES_KEY])
+            frames, timesteps = written["frames"], written["timesteps"]
+        else:
+            table = self.file.read(columns=["frame", "timestep"])
+            frames, first = np.unique(table.column("frame").to_numpy(), return_index=True)
+            order = np.argsort(first)
+            frames, timesteps = frames[order], table.column("timestep").to_numpy()[first[order]]
+        super().__init__(layout["ids"], frames, timesteps, layout["fields"], float(layout["dt"]),
+                         layout.get("source", ""))
+
+        # the range of frames of every row group
+        column = self.file.schema_arrow.get_field_index("frame")
+        self.__group_ranges = np.array([
+            (self.file.metadata.row_group(i).column(column).statistics.min,
+             self.file.metadata.row_group(i).column(column).statistics.max)
+            for i in range(self.file.num_row_groups)
+        ], dtype=np.int64).reshape(-1, 2)
+
+    def get_block(self, start: int, stop: int, fields=None) -> dict[str, np.ndarray]:
+        fields = self.fields if fields is None else list(fields)
+        for field in fields:
+            if field not in self.fields:
+                raise KeyError(f"Input parameter \"{field}\" was not found.")
+        wanted = self.frames[start:stop]
+        out = {field: np.full((len(wanted), self.num_particles), np.nan) for field in fields}
+        if len(wanted) == 0:
+            return out
+
+        order = np.argsort(wanted)
+        lo, hi = wanted.min(), wanted.max()
+        groups = np.flatnonzero((self.__group_ranges[:, 1] >= lo) & (self.__group_ranges[:, 0] <= hi))
+        for group in groups:
+            table = self.file.read_row_group(int(group), columns=["frame", "id"] + fields)
+            frame_col = table.column("frame").to_numpy()
+            keep = np.isin(frame_col, wanted)
+            rows = order[np.searchsorted(wanted[order], frame_col[keep])]
+            cols = np.searchsorted(self.ids, table.column("id").to_numpy()[keep])
+            for field in fields:
+                out[field][rows, cols] = table.column(field).to_numpy()[keep]
+        return out
@@ -1,18 +1,139 @@
-import math
 import numpy as np
+from granular_vis.granular_bed.contacts import ContactNetwork
 from granular_vis.granular_bed.profiles import BedProfile
+from granular_vis.granular_bed.spatial import CellList
+from granular_vis.granular_bed.surface import surface_height, surface_mask
+
+
+class Selection:
+    """
+    Particle IDs picked out of a `Bed` by a condition, kept as a boolean mask over the
+    particles of the bed
+
+    It behaves like the list of IDs it holds (iteration, `len`, `in`, indexing) and
+    selections of the same bed can be combined with `&` (AND), `|` (OR), `^` (XOR)
+    and `~` (NOT).
+    """
+
+    def __init__(self, bed_ids: np.ndarray, mask: np.ndarray) -> None:
+        self.bed_ids = bed_ids
+        self.mask = np.asarray(mask, dtype=bool)
+        self.__ids = None
+
+    @property
+    def ids(self) -> np.ndarray:
+        # picked out once, so that indexing and iterating do not go over the whole bed again
+        if self.__ids is None:
+            self.__ids = self.bed_ids[self.mask]
+        return self.__ids
+
+    def __combine(self, other, operator):  # -> Selection:
+        if not isinstance(other, Selection):
+            return NotImplemented
+        if other.bed_ids is not self.bed_ids and not np.array_equal(other.bed_ids, self.bed_ids):
+            raise ValueError("Only selections of the same bed can be combined.")
+        return Selection(self.bed_ids, operator(self.mask, other.mask))
+
+    def __and__(self, other):
+        return self.__combine(other, np.logical_and)
+
+    def __or__(self, other):
+        return self.__combine(other, np.logical_or)
+
+    def __xor__(self, other):
+        return self.__combine(other, np.logical_xor)
+
+    def __invert__(self):
+        return Selection(self.bed_ids, ~self.mask)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.mask))
+
+    def __getitem__(self, item):
+        ids = self.ids[item]
+        return ids.tolist() if isinstance(ids, np.ndarray) else int(ids)
+
+    def __contains__(self, p_ID) -> bool:
+        pos = np.searchsorted(self.bed_ids, p_ID)
+        return bool(pos < len(self.bed_ids) and self.bed_ids[pos] == p_ID and self.mask[pos])
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Selection):
+            return np.array_equal(self.ids, other.ids)
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return f"Selection({list(self)})"
 
 
 class Bed:
     """
     Class to apply conditions on the initial particle bed
+
+    The particle data is kept as one NumPy array per field, with the particle IDs in a
+    sorted array. A `p_ID : { field : value }` dictionary can still be passed in.
     """
 
-    def __init__(self, bed_snap: dict):
+    def __init__(self, bed_snap: dict = None, ids=None, columns: dict = None):
+        """
+        get the timeDict generated by the Bed-ish class, with one value (or a one-value
+        list, as given by `array_form=True`) per field
+            - or the `ids` array and a `columns` dictionary of arrays, one value per ID
+        """
+        if bed_snap is not None:
+            ids = np.fromiter(bed_snap, dtype=np.int64, count=len(bed_snap))
+            fields = next(iter(bed_snap.values())).keys() if len(bed_snap) else []
+            columns = {
+                field: np.ravel([np.asarray(v[field]) for v in bed_snap.values()])
+                for field in fields
+            }
+        if ids is None:
+            ids, columns = [], {}
+
+        ids = np.asarray(ids, dtype=np.int64)
+        columns = {field: np.asarray(values) for field, values in columns.items()}
+        for field, values in columns.items():
+            if values.shape != ids.shape:
+                raise ValueError(f"Field \"{field}\" has {values.shape} values for {len(ids)} particles.")
+
+        # keeping the particles sorted by ID
+        if np.any(ids[1:] < ids[:-1]):
+            order = np.argsort(ids, kind="stable")
+            ids = ids[order]
+            columns = {field: values[order] for field, values in columns.items()}
+
+        self.__ids: np.ndarray = ids
+        self.__columns: dict = columns
+
+    @classmethod
+    def from_arrays(cls, ids, columns: dict):  # -> Bed:
+        """
+        Method to make a bed straight from the arrays of particle data, without copying them
+        """
+        return cls(ids=ids, columns=columns)
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self.__ids
+
+    @property
+    def fields(self) -> list[str]:
+        return list(self.__columns)
+
+    def __len__(self) -> int:
+        return len(self.__ids)
+
+    def get_contacts(self, tolerance: float = 1.0) -> ContactNetwork:
         """
-        get the timeDict generated by the Bed-ish class
+        Returns the contact network of the bed, i.e. the pairs of particles closer than
+        `tolerance` * (r_i + r_j)
         """
-        self.__bed_snap: dict = bed_snap
+        z = self.__column('z') if 'z' in self.__columns else None
+        return ContactNetwork.from_positions(self.__ids, self.__column('x'), self.__column('y'),
+                                             self.__column('radius'), z=z, tolerance=tolerance)
 
     def make_profile(self):
 
@@ -21,92 +142,143 @@ class Bed:
             - `condition_bed` : a list of indices that satisfy a certain condition
             - Returns : `P_Profile` object
         """
-        condition_bed = self.is_greater('y', 0.14)
+        condition_bed = self.is_greater('y', 0.14).mask
 
         return BedProfile(
             np.array([
-                [v for k, v in self.get_data('x').items() if k in condition_bed],
-                [v for k, v in self.get_data('y').items() if k in condition_bed],
-                [v for k, v in self.get_data('radius').items() if k in condition_bed]
+                self.__column('x')[condition_bed],
+                self.__column('y')[condition_bed],
+                self.__column('radius')[condition_bed]
             ]).T
         )
 
     def get_input(self):
         """
-        Method to get access to the input dictionary
+        Method to get the bed in the `p_ID : { field : value }` form of the input dictionary
         """
-        return self.__bed_snap
+        values = np.column_stack([self.__columns[field] for field in self.__columns]).tolist() \
+            if self.__columns else [[] for _ in self.__ids]
+        return {
+            p_ID: dict(zip(self.__columns, p_values))
+            for p_ID, p_values in zip(self.__ids.tolist(), values)
+        }
+
+    def __column(self, parameter: str) -> np.ndarray:
+        # checking if the input parameter is correct
+        if parameter not in self.__columns:
+            raise KeyError(f"Input parameter \"{parameter}\" was not found.")
+        return self.__columns[parameter]
 
     def get_data(self, parameter: str, as_array: bool = False):
         """
         Method to get a dictionary that only includes data of the parameter passed in
+            - `as_array` : get a read-only view of the array of values instead, in the order of `ids`
         """
-        # checking if the input parameter is correct
-        if parameter not in list(next(iter(self.__bed_snap.items()))[1].keys()):
-            raise KeyError(f"Input parameter \"{parameter}\" was not found.")
+        values = self.__column(parameter)
 
         if as_array:
-            return [v[parameter] for v in iter(self.__bed_snap.values())]
+            view = values.view()
+            view.flags.writeable = False
+            return view
+
+        return dict(zip(self.__ids.tolist(), values.tolist()))
+
+    def select(self, mask) -> Selection:
+        """
+        Method to turn a boolean array over the particles of the bed into a `Selection`
+        """
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != self.__ids.shape:
+            raise ValueError(f"Got a mask of shape {mask.shape} for {len(self.__ids)} particles.")
+        return Selection(self.__ids, mask)
 
-        return {k: v[parameter] for k, v in self.__bed_snap.items()}
+    def subset(self, selection):  # -> Bed:
+        """
+        Method to get a new bed with only the particles of the selection (or list of IDs) passed in
+        """
+        if isinstance(selection, Selection) and selection.bed_ids is self.__ids:
+            mask = selection.mask
+        else:
+            mask = np.isin(self.__ids, np.fromiter(selection, dtype=np.int64))
+        return Bed.from_arrays(self.__ids[mask], {f: v[mask] for f, v in self.__columns.items()})
 
-    def get_surface(self) -> list[int]:
+    def get_surface(self, method: str = "profile", width: float = None, depth: int = 1) -> Selection:
         """
         Returns a list of particle IDs for the surface particles
+            - Arguments:
+                - `method` : how the surface is found
+                    - `'profile'` : particles with less than 2 profile particles above them
+                      (see `BedProfile.p_is_surface`)
+                    - `'columns'` : the `depth` highest particles of every column of `width`
+                      along x (see `surface.surface_mask`)
         """
 
-        # * looking at the particles higher than 80% of the max height --> that is where the surface would be
+        x = self.__column('x')
+        y = self.__column('y')
 
-        profile = self.make_profile()
+        if method == "profile":
+            # * looking at the particles higher than 80% of the max height --> that is where the surface would be
+            surface = self.make_profile().p_is_surface_all(np.column_stack([x, y]))
+        elif method == "columns":
+            surface = surface_mask(x, y, self.__column('radius'), width=width, depth=depth).astype(np.int64)
+        else:
+            raise ValueError(f"Unknown surface method \"{method}\".")
 
-        # looping through the dictionary to find the surface partices
-        for key in self.__bed_snap:
-            self.__bed_snap[key]['surface'] = profile.p_is_surface(self.__bed_snap[key]['x'], self.__bed_snap[key]['y'])
+        self.__columns['surface'] = surface
 
-        return [k for k, v in self.__bed_snap.items() if v['surface'] == 1]
+        return self.select(surface == 1)
+
+    def get_surface_height(self, width: float = None, edges=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the free surface height h(x) of the bed, as the (heights, column centres)
+        arrays of `surface.surface_height`
+        """
+        return surface_height(self.__column('x'), self.__column('y'), self.__column('radius'),
+                              width=width, edges=edges)
 
     # * conditionals
-    def is_greater(self, parameter: str, val: float) -> list[int]:
+    def is_greater(self, parameter: str, val: float) -> Selection:
         """
-        Returns a list of particle IDs for which the values for the specified parameters are 
+        Returns a list of particle IDs for which the values for the specified parameters are
         greater than the value passed in
         """
-        return [k for k, v in self.__bed_snap.items() if v[parameter] > val]
+        return self.select(self.__column(parameter) > val)
 
-    def is_lesser(self, parameter: str, val: float) -> list[int]:
-        """ 
-        Returns a list of particle IDs for which the values for the specified parameters are 
+    def is_lesser(self, parameter: str, val: float) -> Selection:
+        """
+        Returns a list of particle IDs for which the values for the specified parameters are
         lesser than the value passed in
         """
-        return [k for k, v in self.__bed_snap.items() if v[parameter] < val]
+        return self.select(self.__column(parameter) < val)
 
-    def is_within(self, parameter: str, low: float, high: float) -> list[int]:
+    def is_within(self, parameter: str, low: float, high: float) -> Selection:
         """
-        Returns a list of particle IDs for which the values for the specified parameters are 
+        Returns a list of particle IDs for which the values for the specified parameters are
         within the high and the low values passed in
         """
-        return [k for k, v in self.__bed_snap.items() if (low < v[parameter] < high)]
+        values = self.__column(parameter)
+        return self.select((low < values) & (values < high))
 
-    def is_within_2d(self, left: float, right: float, down: float, up: float) -> list[int]:
+    def is_within_2d(self, left: float, right: float, down: float, up: float) -> Selection:
         """
-        Returns a list of particle IDs for which the values for the specified parameters are 
+        Returns a list of particle IDs for which the values for the specified parameters are
         within the range of values passed in
         """
 
-        return [k for k, v in self.__bed_snap.items() if ((left < v['x'] < right) and (down < v['y'] < up))]
+        return self.is_within('x', left, right) & self.is_within('y', down, up)
 
-    def is_within_circle(self, origin: tuple[float, float], radius: float) -> list[int]:
+    def is_within_circle(self, origin: tuple[float, float], radius: float) -> Selection:
         """
         Returns a list of particle IDs within a circular region defined by the arguments
             - Arguments:
                 - `origin` : the center point of the circular region. Must be in the form (x,y)
-                - `radius` : the radius of the circular region    
+                - `radius` : the radius of the circular region
         """
 
-        return [k for k, v in self.__bed_snap.items() if math.dist([v['x'], v['y']], [*origin]) < radius]
+        return self.select(self.__dist_to(origin) < radius)
 
     def is_within_circle_region(self, origin: tuple[float, float],
-                                radius_inner: float, radius_outer: float) -> list[int]:
+                                radius_inner: float, radius_outer: float) -> Selection:
         """
         Returns a list of particle IDs within a circular region defined by the arguments
             - Arguments:
@@ -115,31 +287,87 @@ class Bed:
                 - `radius_inner` : the inner radius of the circular region
         """
 
-        return [k for k, v in self.__bed_snap.items() if
-                radius_inner < math.dist([v['x'], v['y']], [*origin]) < radius_outer]
+        dist = self.__dist_to(origin)
+        return self.select((radius_inner < dist) & (dist < radius_outer))
 
-    def is_array_surface(self, array: list[float]) -> list[int]:
+    def __dist_to(self, origin: tuple[float, float]) -> np.ndarray:
+        return np.hypot(self.__column('x') - origin[0], self.__column('y') - origin[1])
+
+    def probe(self, points, candidates=None, unique: bool = False) -> np.ndarray:
+        """
+        Returns an array with the ID of the particle closest to each of the probe points,
+        found for all the points at once with a `CellList`
+            - Arguments:
+                - `points` : a <number of probes> x 2 array of (x, y) positions
+                - `candidates` : a `Selection`, boolean mask or list of IDs to search in,
+                  every particle by default
+                - `unique` : never give the same particle to two probes, the closer probe
+                  getting it first
+            - Returns : the IDs, -1 for the probes left without a particle
+        """
+        points = np.asarray(points, dtype=np.float64)
+        mask = self.__candidate_mask(candidates)
+        positions = np.column_stack([self.__column(f)[mask] for f in ('x', 'y')[:points.shape[1]]])
+        return self.__nearest_ids(points, positions, self.__ids[mask], unique)
+
+    def __candidate_mask(self, candidates) -> np.ndarray:
+        if candidates is None:
+            return np.ones(len(self.__ids), dtype=bool)
+        if isinstance(candidates, Selection) and candidates.bed_ids is self.__ids:
+            return candidates.mask
+        candidates = np.asarray(list(candidates) if not isinstance(candidates, np.ndarray) else candidates)
+        if candidates.dtype == bool:
+            return candidates
+        return np.isin(self.__ids, candidates.astype(np.int64))
+
+    def __nearest_ids(self, points, positions, ids, unique: bool) -> np.ndarray:
+        """
+        Method to get the IDs of the positions closest to every probe point
+        """
+        out = np.full(len(points), -1, dtype=np.int64)
+        if len(ids) == 0 or len(points) == 0:
+            return out
+
+        # cells about one particle wide
+        if 'radius' in self.__columns:
+            cell_size = 2 * float(np.mean(self.__columns['radius']))
+        else:
+            cell_size = float(np.ptp(positions)) / 10 or 1.0
+        cell_list = CellList(positions, cell_size)
+        if not unique:
+            nearest, _ = cell_list.nearest(points, k=1)
+            out[nearest[:, 0] >= 0] = ids[nearest[nearest[:, 0] >= 0, 0]]
+            return out
+
+        # greedy assignment from the closest (probe, particle) pairs, looking further out
+        # only when some probe finds all its nearest particles taken
+        k = min(8, len(ids))
+        while True:
+            nearest, dist = cell_list.nearest(points, k=k)
+            assigned = _assign_unique(nearest, dist)
+            if np.all(assigned >= 0) or k >= len(ids) or np.count_nonzero(assigned >= 0) == len(ids):
+                break
+            k = min(4 * k, len(ids))
+
+        out[assigned >= 0] = ids[assigned[assigned >= 0]]
+        return out
+
+    def is_array_surface(self, array: list[float], unique: bool = False) -> list[int]:
         """
         Returns a list of particle IDs for which the values of the surface particles are
         closest to the coordinates in the array passed in.
             - Arguments:
                 - `array` : a list of coordinate values that the particles should be found in on the surface
+                - `unique` : never give the same particle to two coordinates
         """
 
-        # getting a dictionary for the surface particles
-        # surfaceDict = { k:v for k,v in self.__bed_snap.items() if k in self.get_surface()}
-        surface_idx = self.get_surface()
-
-        target_idx = []
-        for point in array:
-            target_idx.append(
-                # min( self.get_surface(), key = lambda i: abs(point - self.__bed_snap[i]['x']) )
-                min(surface_idx, key=lambda i: abs(point - self.__bed_snap[i]['x']))
-            )
+        surface = self.get_surface().mask
+        points = np.asarray(array, dtype=np.float64).reshape(-1, 1)
+        positions = self.__column('x')[surface].reshape(-1, 1)
 
-        return target_idx
+        return self.__nearest_ids(points, positions, self.__ids[surface], unique).tolist()
 
-    def is_array(self, direction: str, array: list[float], hold: float) -> list[int]:
+    def is_array(self, direction: str, array: list[float], hold: float, unique: bool = False) -> list[int]:
         """
         Returns a list of particle IDs for which the values of the particles are
         closest to the coordinates in the array passed in
@@ -148,34 +376,58 @@ class Bed:
                     - `'h'` for horizontal, `'v'` for vertical
                 - `array` : list of coordinate values that the particles should be found in
                 - `hold` : the single position that the particles would share
+                - `unique` : never give the same particle to two coordinates
         """
 
-        # todo make this different for different directions
-        mins_idx = []
+        array = np.asarray(array, dtype=np.float64)
+        held = np.full(len(array), hold, dtype=np.float64)
         if direction == 'h':
             reduced_search = self.is_within('y', hold - 0.01, hold + 0.01)
-
-            for point in array:
-                mins_idx.append(
-                    min(reduced_search,
-                        key=lambda i: math.dist((point, hold), (self.__bed_snap[i]['x'], self.__bed_snap[i]['y'])))
-                )
-        if direction == 'v':
+            points = np.column_stack([array, held])
+        elif direction == 'v':
             reduced_search = self.is_within('x', hold - 0.01, hold + 0.01)
-            for point in array:
-                mins_idx.append(
-                    min(reduced_search,
-                        key=lambda i: math.dist((hold, point), (self.__bed_snap[i]['x'], self.__bed_snap[i]['y'])))
-                )
+            points = np.column_stack([held, array])
+        else:
+            return []
 
-        return mins_idx
+        return self.probe(points, candidates=reduced_search, unique=unique).tolist()
 
-    def is_mesh(self, array_x: list[float], array_y: list[float]) -> list[int]:
+    def is_mesh(self, array_x: list[float], array_y: list[float], unique: bool = False) -> list[int]:
         """
         Returns a list of particle IDs for which the values of the particles are
         closest to in the given mesh passed in
+            - Arguments:
+                - `array_x`, `array_y` : the coordinates of the mesh lines along x and y
+                - `unique` : never give the same particle to two mesh points
+            - Returns : one ID per mesh point, going along x first, then along y
         """
 
-        # todo Call the self.is_array function multiple times I guess...
+        mesh_x, mesh_y = np.meshgrid(np.asarray(array_x, dtype=np.float64),
+                                     np.asarray(array_y, dtype=np.float64))
+
+        return self.probe(np.column_stack([mesh_x.ravel(), mesh_y.ravel()]), unique=unique).tolist()
 
-        pass
+
+def _assign_unique(nearest: np.ndarray, dist: np.ndarray) -> np.ndarray:
+    """
+    Function to give every probe its closest particle not taken by a closer probe
+        - Arguments:
+            - `nearest`, `dist` : <probes> x k arrays of the closest particles of every probe
+              and their distances, as given by `CellList.nearest`
+        - Returns : the particle of every probe, -1 if all of its k particles were taken
+    """
+    probe_idx = np.repeat(np.arange(len(nearest)), nearest.shape[1])
+    particle_idx, dist = nearest.ravel(), dist.ravel()
+    found = particle_idx >= 0
+    order = np.argsort(dist[found], kind="stable")
+    probe_idx, particle_idx = probe_idx[found][order], particle_idx[found][order]
+
+    assigned = np.full(len(nearest), -1, dtype=np.int64)
+    taken = set()
+    for probe, particle in zip(probe_idx.tolist(), particle_idx.tolist()):
+        if assigned[probe] >= 0 or particle in taken:
+            continue
+        assigned[probe] = particle
+        taken.add(particle)
+
+    return assigned
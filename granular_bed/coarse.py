@@ -0,0 +1,164 @@
+from granular_vis.granular_bed.spatial import CellList
+import numpy as np
+
+
+# the Gaussian kernel is cut off at this many widths
+KERNEL_CUTOFF = 3.0
+
+
+def grid_edges(x, y, cell_size: float, bounds=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function to get the edges of a uniform grid of square cells covering the particles
+        - `bounds` : the ((x lo, x hi), (y lo, y hi)) area to cover, the extent of the
+          particle centres by default
+    """
+    if bounds is None:
+        bounds = ((np.nanmin(x), np.nanmax(x)), (np.nanmin(y), np.nanmax(y)))
+    edges = []
+    for lo, hi in bounds:
+        num_cells = max(1, int(np.ceil((hi - lo) / cell_size)))
+        edges.append(lo + cell_size * np.arange(num_cells + 1))
+    return edges[0], edges[1]
+
+
+def coarse_grain(x, y, radius, v_x=None, v_y=None, cell_size: float = None, edges=None,
+                 method: str = "bins", width: float = None, average: bool = False) -> dict[str, np.ndarray]:
+    """
+    Function to get continuum fields of the bed on a grid, from the particle data
+        - Arguments:
+            - `x`, `y`, `radius`, `v_x`, `v_y` : arrays of the particle data, either 1D for a
+              single frame or <frames> x <particles> for a range of frames. The velocity
+              fields are left out of the output without `v_x` and `v_y`.
+            - `cell_size` : the grid spacing, 2 mean particle diameters by default
+            - `edges` : the (x edges, y edges) of the grid, overrides `cell_size`
+            - `method` : how the particles are spread over the grid
+                - `'bins'` : every particle counts fully in the cell holding its centre
+                - `'gaussian'` : every particle is smeared over the grid points with a
+                  Gaussian kernel of standard deviation `width` (a mean diameter by default),
+                  cut off at `KERNEL_CUTOFF` widths
+            - `average` : pool every frame into a single set of grids, the `count`,
+              `number_density` and `area_fraction` being their mean over the frames
+        - Returns : a dictionary of grids, indexed [y cell, x cell] and with an extra leading
+          frame axis for 2D input unless `average` is set, plus the `'x_centres'` and
+          `'y_centres'` of the cells:
+            - `'count'` : the number of particles (the summed kernel weights for `'gaussian'`)
+            - `'number_density'` : particles per unit area
+            - `'area_fraction'` : the particle area per unit area, from `radius`
+            - `'v_x'`, `'v_y'` : the mean velocity, NaN where there are no particles
+            - `'temperature'` : the granular temperature, i.e. the mean squared velocity
+              fluctuation around the local mean velocity per degree of freedom
+
+    Particles with a NaN position, or outside the grid for `'bins'`, are left out.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), x.shape)
+    with_velocity = v_x is not None and v_y is not None
+    if with_velocity:
+        v_x = np.broadcast_to(np.asarray(v_x, dtype=np.float64), x.shape)
+        v_y = np.broadcast_to(np.asarray(v_y, dtype=np.float64), x.shape)
+
+    valid = ~(np.isnan(x) | np.isnan(y))
+    mean_diameter = 2 * np.nanmean(radius[valid]) if valid.any() else 1.0
+    if edges is None:
+        edges = grid_edges(x[valid], y[valid], cell_size if cell_size is not None else 2 * mean_diameter)
+    edges_x, edges_y = (np.asarray(e, dtype=np.float64) for e in edges)
+    num_frames = x.shape[0] if x.ndim == 2 and not average else 1
+    num_pooled = x.shape[0] if x.ndim == 2 and average else 1
+    shape = (num_frames, len(edges_y) - 1, len(edges_x) - 1)
+    cell_area = np.outer(np.diff(edges_y), np.diff(edges_x))
+
+    if method == "bins":
+        grid_idx, particle_idx, weight = _bin_weights(x, y, valid, edges_x, edges_y, average)
+    elif method == "gaussian":
+        grid_idx, particle_idx, weight = _kernel_weights(x, y, valid, edges_x, edges_y, average,
+                                                         width if width is not None else mean_diameter)
+        # the kernel integrates to 1, so the fields are per unit area already
+        cell_area = np.ones_like(cell_area)
+    else:
+        raise ValueError(f"Unknown coarse graining method \"{method}\".")
+
+    size = int(np.prod(shape))
+
+    def __sum(values) -> np.ndarray:
+        return np.bincount(grid_idx, weights=weight * values.ravel()[particle_idx], minlength=size)
+
+    count = np.bincount(grid_idx, weights=weight, minlength=size)
+    area = np.tile(cell_area.ravel(), num_frames) * num_pooled
+    out = {
+        "count": count / num_pooled,
+        "number_density": count / area,
+        "area_fraction": __sum(np.pi * radius ** 2) / area,
+    }
+
+    if with_velocity:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # the fluctuations are taken around the local mean, in a second pass, to avoid
+            # the cancellation of <v^2> - <v>^2
+            mean_x = __sum(v_x) / count
+            mean_y = __sum(v_y) / count
+            fluct = (v_x.ravel()[particle_idx] - mean_x[grid_idx]) ** 2 \
+                + (v_y.ravel()[particle_idx] - mean_y[grid_idx]) ** 2
+            temperature = np.bincount(grid_idx, weights=weight * fluct, minlength=size) / (2 * count)
+        out.update({"v_x": mean_x, "v_y": mean_y, "temperature": temperature})
+
+    for field, values in out.items():
+        values = values.reshape(shape)
+        out[field] = values if x.ndim == 2 and not average else values[0]
+
+    out["x_centres"] = (edges_x[:-1] + edges_x[1:]) / 2
+    out["y_centres"] = (edges_y[:-1] + edges_y[1:]) / 2
+    return out
+
+
+def _bin_weights(x, y, valid, edges_x, edges_y, average) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Function to put every particle in the grid cell holding its centre
+        - Returns : the flat grid index, the flat particle index and the weight (1) of every
+          (grid cell, particle) pair
+    """
+    num_x, num_y = len(edges_x) - 1, len(edges_y) - 1
+    col = np.searchsorted(edges_x, np.where(valid, x, edges_x[0]), side="right") - 1
+    row = np.searchsorted(edges_y, np.where(valid, y, edges_y[0]), side="right") - 1
+
+    # the particles right on the last edges go in the last cells
+    col[(col == num_x) & (x == edges_x[-1])] = num_x - 1
+    row[(row == num_y) & (y == edges_y[-1])] = num_y - 1
+    inside = valid & (col >= 0) & (col < num_x) & (row >= 0) & (row < num_y)
+
+    frame = np.arange(x.shape[0])[:, None] if x.ndim == 2 and not average else 0
+    grid_idx = (frame * num_y + row) * num_x + col
+    particle_idx = np.flatnonzero(inside)
+    return grid_idx.ravel()[particle_idx], particle_idx, np.ones(len(particle_idx))
+
+
+def _kernel_weights(x, y, valid, edges_x, edges_y, average, width) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Function to spread every particle over the nearby grid points with a truncated
+    Gaussian kernel, normalized to integrate to 1
+        - Returns : the flat grid index, the flat particle index and the kernel weight of
+          every (grid point, particle) pair closer than the cutoff
+    """
+    centres_x = (edges_x[:-1] + edges_x[1:]) / 2
+    centres_y = (edges_y[:-1] + edges_y[1:]) / 2
+    grid_x, grid_y = np.meshgrid(centres_x, centres_y)
+    grid = np.column_stack([grid_x.ravel(), grid_y.ravel()])
+    cutoff = KERNEL_CUTOFF * width
+    norm = 2 * np.pi * width ** 2 * (1 - np.exp(-KERNEL_CUTOFF ** 2 / 2))
+
+    x2, y2, valid2 = np.atleast_2d(x), np.atleast_2d(y), np.atleast_2d(valid)
+    num_particles = x2.shape[1]
+    out_g, out_p, out_w = [], [], []
+    for frame in range(x2.shape[0]):
+        particles = np.flatnonzero(valid2[frame])
+        if len(particles) == 0:
+            continue
+        cells = CellList(np.column_stack([x2[frame, particles], y2[frame, particles]]), cell_size=cutoff)
+        g_idx, p_idx, dist = cells.query_radius(grid, cutoff)
+        offset = 0 if average else frame * len(grid)
+        out_g.append(g_idx + offset)
+        out_p.append(particles[p_idx] + frame * num_particles)
+        out_w.append(np.exp(-dist ** 2 / (2 * width ** 2)) / norm)
+
+    if len(out_g) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(out_g), np.concatenate(out_p), np.concatenate(out_w)
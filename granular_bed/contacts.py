@@ -0,0 +1,133 @@
+from granular_vis.granular_bed.spatial import CellList
+import numpy as np
+
+
+class ContactNetwork:
+    """
+    The contacts between the particles of a single frame, kept as a sparse symmetric
+    adjacency structure in CSR form
+
+        - `ids` : sorted array of particle IDs, one per row
+        - `indptr` : the contacts of row `i` are at `indptr[i]:indptr[i + 1]` of the arrays below
+        - `indices` : the row of the particle in contact
+        - `overlaps` : r_i + r_j - distance of the contact, negative for the contacts only
+          found thanks to the tolerance
+
+    Every contact is stored twice, once for each particle.
+    """
+
+    def __init__(self, ids, first, second, overlaps, dims: int = 2) -> None:
+        """
+            - Arguments:
+                - `ids` : the sorted particle IDs
+                - `first`, `second`, `overlaps` : the rows and overlap of every contact, each once
+                - `dims` : the number of dimensions of the positions
+        """
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.dims = dims
+        first = np.asarray(first, dtype=np.int64)
+        second = np.asarray(second, dtype=np.int64)
+        overlaps = np.asarray(overlaps, dtype=np.float64)
+
+        rows = np.concatenate([first, second])
+        cols = np.concatenate([second, first])
+        order = np.lexsort((cols, rows))
+        self.indices = cols[order]
+        self.overlaps = np.concatenate([overlaps, overlaps])[order]
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(self.ids)))])
+
+    @classmethod
+    def from_positions(cls, ids, x, y, radius, z=None, tolerance: float = 1.0):  # -> ContactNetwork:
+        """
+        Method to find the contacts of a frame, i.e. the pairs closer than
+        `tolerance` * (r_i + r_j), with a cell list in linear time
+            - `ids` : the sorted particle IDs, particles with a NaN position have no contacts
+        """
+        columns = [x, y] if z is None else [x, y, z]
+        points = np.column_stack([np.asarray(c, dtype=np.float64) for c in columns])
+        radius = np.asarray(radius, dtype=np.float64)
+        valid = np.flatnonzero(~np.isnan(points).any(axis=1) & ~np.isnan(radius))
+        if len(valid) < 2:
+            return cls(ids, [], [], [], dims=points.shape[1])
+
+        reach = 2 * tolerance * radius[valid].max()
+        cells = CellList(points[valid], cell_size=reach)
+        i, j, dist = cells.query_pairs(reach)
+        i, j = valid[i], valid[j]
+        keep = dist < tolerance * (radius[i] + radius[j])
+        i, j, dist = i[keep], j[keep], dist[keep]
+        return cls(ids, i, j, radius[i] + radius[j] - dist, dims=points.shape[1])
+
+    @property
+    def num_particles(self) -> int:
+        return len(self.ids)
+
+    @property
+    def num_contacts(self) -> int:
+        return len(self.indices) // 2
+
+    def get_edges(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Method to get every contact once, as the (first row, second row, overlap) arrays
+        """
+        rows = np.repeat(np.arange(self.num_particles), np.diff(self.indptr))
+        once = rows < self.indices
+        return rows[once], self.indices[once], self.overlaps[once]
+
+    def get_neighbours(self, p_ID: int) -> np.ndarray:
+        """
+        Method to get the IDs of the particles in contact with a particle
+        """
+        row = np.searchsorted(self.ids, p_ID)
+        if row >= self.num_particles or self.ids[row] != p_ID:
+            raise KeyError(f"Particle ID {p_ID} was not found.")
+        return self.ids[self.indices[self.indptr[row]:self.indptr[row + 1]]]
+
+    def get_coordination(self) -> np.ndarray:
+        """
+        Method to get the number of contacts of every particle
+        """
+        return np.diff(self.indptr)
+
+    def get_rattlers(self, min_contacts: int = None) -> np.ndarray:
+        """
+        Method to find the rattlers, i.e. the particles left with fewer than `min_contacts`
+        (the number of dimensions + 1 by default) once the other rattlers are taken out
+            - Returns : a boolean array, True for the rattlers
+        """
+        if min_contacts is None:
+            min_contacts = self.dims + 1
+        first, second, _ = self.get_edges()
+        coordination = self.get_coordination().copy()
+        rattler = np.zeros(self.num_particles, dtype=bool)
+        alive = np.ones(len(first), dtype=bool)
+
+        while True:
+            removed = ~rattler & (coordination < min_contacts)
+            if not removed.any():
+                return rattler
+            rattler |= removed
+
+            # the contacts of the removed particles no longer count for their neighbours
+            lost = alive & (removed[first] | removed[second])
+            alive &= ~lost
+            np.subtract.at(coordination, first[lost], 1)
+            np.subtract.at(coordination, second[lost], 1)
+
+    def get_stats(self, min_contacts: int = None) -> dict:
+        """
+        Method to get the coordination number statistics of the frame
+            - Returns : the number of contacts, the mean coordination number of every
+              particle and of the non-rattlers only (counting their contacts with each other),
+              and the fraction of rattlers
+        """
+        rattler = self.get_rattlers(min_contacts)
+        first, second, _ = self.get_edges()
+        backbone = ~rattler[first] & ~rattler[second]
+        num_backbone = int((~rattler).sum())
+        return {
+            "num_contacts": self.num_contacts,
+            "mean_coordination": 2 * self.num_contacts / self.num_particles if self.num_particles else np.nan,
+            "mean_coordination_no_rattlers": 2 * int(backbone.sum()) / num_backbone if num_backbone else np.nan,
+            "rattler_fraction": float(rattler.mean()) if self.num_particles else np.nan,
+        }
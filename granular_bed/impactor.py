@@ -0,0 +1,70 @@
+from granular_vis.granular_bed.surface import surface_height
+import numpy as np
+
+
+def find_impactor(ids, columns: dict, impactor=None) -> int:
+    """
+    Function to pick the impactor out of the particles of a frame
+        - Arguments:
+            - `ids` : the particle IDs
+            - `columns` : 1D arrays of the particle data by field name, e.g. `type` and `radius`
+            - `impactor` : how the impactor is told apart from the bed
+                - None : the particle with the largest ID
+                - an int : the particle ID
+                - `('type', value)` : the only particle of that type
+                - `'radius'` : the largest particle
+        - Returns : the ID of the impactor
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        raise ValueError("A frame without particles has no impactor.")
+
+    if impactor is None:
+        return int(ids.max())
+    if isinstance(impactor, (int, np.integer)):
+        if impactor not in ids:
+            raise ValueError(f"The impactor ID {impactor} was not found.")
+        return int(impactor)
+    if impactor == "radius":
+        return int(ids[np.nanargmax(_get_column(columns, "radius"))])
+    if isinstance(impactor, tuple) and len(impactor) == 2 and impactor[0] == "type":
+        found = ids[_get_column(columns, "type") == impactor[1]]
+        if len(found) != 1:
+            raise ValueError(f"Found {len(found)} particles of type {impactor[1]} instead of a single impactor.")
+        return int(found[0])
+    raise ValueError(f"Unknown impactor selection {impactor!r}.")
+
+
+def _get_column(columns: dict, field: str) -> np.ndarray:
+    if field not in columns:
+        raise KeyError(f"Input parameter \"{field}\" was not found.")
+    return np.asarray(columns[field])
+
+
+def surface_level(x, y, radius, width: float = None, edges=None):  # -> np.ndarray | float:
+    """
+    Function to get the height of the free surface of a bed as a single value, the median
+    of the column heights of `surface.surface_height`, so the crater and the particles
+    thrown up by an impact barely move it
+        - Returns : the level of every frame for <frames> x <particles> input, or a single
+          value for a single frame, NaN without particles
+    """
+    x = np.asarray(x, dtype=np.float64)
+    valid = ~np.isnan(x)
+    if not valid.any():
+        return np.full(x.shape[0], np.nan) if x.ndim == 2 else np.nan
+
+    heights, _ = surface_height(x, y, radius, width=width, edges=edges)
+    heights = np.atleast_2d(heights)
+    level = np.full(heights.shape[0], np.nan)
+    filled = ~np.isnan(heights).all(axis=1)
+    level[filled] = np.nanmedian(heights[filled], axis=1)
+    return level if x.ndim == 2 else float(level[0])
+
+
+def penetration_depth(y, radius, level) -> np.ndarray:
+    """
+    Function to get how deep the lowest point of the impactor is below the surface level,
+    negative while it is above the surface
+    """
+    return np.asarray(level) - (np.asarray(y) - np.asarray(radius))
@@ -1,4 +1,6 @@
+from granular_vis.granular_bed.spatial import CellList
 import math
+import numpy as np
 
 
 class BedProfile:
@@ -10,14 +12,56 @@ class BedProfile:
             - Column 1 ( array[n][0] ): Particle x coordinate
             - Column 2 ( array[n][0] ): Particle y coordinate
             - Column 3 ( array[n][0] ): Particle radius
+
+    The `p_*_all` methods answer the same questions as their single particle versions for
+    many positions at once, using a `CellList` built once per profile.
     """
 
+    # for a scale distance, the maximum possible distance between 2 particles.
+    MAX_DIST = 1
+
     def __init__(self, particle_positions) -> None:
 
         # particle
         self.particle_positions = particle_positions
         self.num_particles = len(particle_positions)
 
+        self.__cell_list = None
+
+    def get_cell_list(self) -> CellList:
+        """
+        Method to get the spatial index of the particles, built on the first call
+        """
+        if self.__cell_list is None:
+            positions = self.__positions()
+            max_radius = positions[:, 2].max() if self.num_particles else 0
+            self.__cell_list = CellList(positions[:, :2], cell_size=2 * max_radius if max_radius > 0 else 1)
+        return self.__cell_list
+
+    def __positions(self) -> np.ndarray:
+        return np.asarray(self.particle_positions, dtype=np.float64).reshape(-1, 3)
+
+    def __query_points(self, points) -> np.ndarray:
+        """
+        Method to get the (x, y) positions to query, the particles themselves by default
+        """
+        if points is None:
+            return self.__positions()[:, :2]
+        return np.asarray(points, dtype=np.float64).reshape(-1, 2)
+
+    def __count_within_radius(self, points, radius_multiplier) -> np.ndarray:
+        """
+        Method to count, for every point, the other particles closer than their radius
+        times `radius_multiplier`, ignoring particles at the exact same position
+        """
+        points = self.__query_points(points)
+        if self.num_particles == 0:
+            return np.zeros(len(points), dtype=np.int64)
+        radius = self.__positions()[:, 2]
+        q_idx, p_idx, dist = self.get_cell_list().query_radius(points, radius_multiplier * radius.max())
+        keep = (dist > 0) & (dist < radius_multiplier * radius[p_idx])
+        return np.bincount(q_idx[keep], minlength=len(points))
+
     def p_square_count(self, current_x, current_y, side_length) -> int:
         """
         method to find the particle counts per region
@@ -61,11 +105,7 @@ class BedProfile:
         """
         method to find the distance to the nearest particle"""
 
-        # importing the dist() function
-
-        # for a scale distance, the maximum possible distance between 2 particles.
-        MAX_DIST = 1
-        distance = MAX_DIST
+        distance = self.MAX_DIST
 
         for pos in self.particle_positions:
 
@@ -133,3 +173,68 @@ class BedProfile:
                 return 0
 
         return 1
+
+    def p_circle_count_all(self, radius_multiplier, points=None) -> np.ndarray:
+        """
+        Method to get `p_circle_count` for many positions at once
+            - `points` : a <number of points> x 2 array of (x, y), the particles by default
+        """
+        return 1 + self.__count_within_radius(points, radius_multiplier)
+
+    def p_nearest_all(self, points=None) -> np.ndarray:
+        """
+        Method to get `p_nearest` for many positions at once
+            - `points` : a <number of points> x 2 array of (x, y), the particles by default
+        """
+        points = self.__query_points(points)
+        _, dist = self.get_cell_list().nearest(points, k=1, max_dist=self.MAX_DIST, exclude_coincident=True)
+        return np.minimum(dist[:, 0], self.MAX_DIST)
+
+    def p_count_near_particle_all(self, radius_multiplier, points=None) -> np.ndarray:
+        """
+        Method to get `p_count_near_particle` for many positions at once
+            - `points` : a <number of points> x 2 array of (x, y), the particles by default
+        """
+        count = 1 + self.__count_within_radius(points, radius_multiplier)
+        count[count < 3] = 1
+        return count
+
+    def p_is_surface_all(self, points=None) -> np.ndarray:
+        """
+        Method to get `p_is_surface` for many positions at once
+            - `points` : a <number of points> x 2 array of (x, y), the particles by default
+            - Returns : an array of 1 for the surface positions and 0 for the others
+        """
+        points = self.__query_points(points)
+        positions = self.__positions()
+        if self.num_particles == 0:
+            return np.ones(len(points), dtype=np.int64)
+        max_radius = positions[:, 2].max()
+
+        def __above(q_idx, p_idx) -> np.ndarray:
+            # particles at or above the point, within their own radius of it along x
+            return ((positions[p_idx, 1] >= points[q_idx, 1]) &
+                    (np.abs(positions[p_idx, 0] - points[q_idx, 0]) < positions[p_idx, 2]))
+
+        # most points are buried, which the particles right around them already show
+        q_idx, p_idx, _ = self.get_cell_list().query_radius(points, 4 * max_radius)
+        keep = __above(q_idx, p_idx)
+        count = np.bincount(q_idx[keep], minlength=len(points))
+
+        # the rest are checked against the whole column of particles above them
+        pending = np.flatnonzero(count < 2)
+        by_x = np.argsort(positions[:, 0], kind="stable")
+        sorted_x = positions[by_x, 0]
+        step = max(1, CellList.CHUNK // max(1, self.num_particles))
+        for start in range(0, len(pending), step):
+            chunk = pending[start:start + step]
+            lo = np.searchsorted(sorted_x, points[chunk, 0] - max_radius, side="right")
+            hi = np.searchsorted(sorted_x, points[chunk, 0] + max_radius, side="left")
+            counts = hi - lo
+            q_rep = np.repeat(chunk, counts)
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            p_rep = by_x[np.repeat(lo, counts) + within]
+            keep = __above(q_rep, p_rep)
+            count[chunk] = np.bincount(q_rep[keep], minlength=len(points))[chunk]
+
+        return (count <= 1).astype(np.int64)
@@ -0,0 +1,171 @@
+from itertools import product
+import numpy as np
+
+
+class CellList:
+    """
+    Spatial index that sorts a set of points into a uniform grid of cells, to find the
+    points near any position without looking at every point
+
+    For initialization:
+        - `points` : a <number of points> x <dimensions> array of coordinates
+        - `cell_size` : the side length of the cells, best set to the typical query radius
+    """
+
+    # largest query radius, in cells, before `nearest` stops growing the search radius
+    MAX_REACH = 16
+
+    # number of distances computed at once by the brute force search
+    CHUNK = 1 << 22
+
+    def __init__(self, points, cell_size: float) -> None:
+        self.points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        self.num_points, self.dims = self.points.shape
+        if cell_size <= 0:
+            raise ValueError(f"The cell size has to be positive, got {cell_size}.")
+        self.cell_size = float(cell_size)
+
+        if self.num_points == 0:
+            self.origin = np.zeros(self.dims)
+            self.shape = np.ones(self.dims, dtype=np.int64)
+        else:
+            self.origin = self.points.min(axis=0)
+            self.shape = self.__cells(self.points).max(axis=0) + 1
+
+        # the points sorted by cell, with the first position and count of every occupied cell
+        keys = self.__keys(self.__cells(self.points))
+        self.order = np.argsort(keys, kind="stable")
+        self.cell_keys, self.cell_starts, self.cell_counts = np.unique(
+            keys[self.order], return_index=True, return_counts=True)
+
+    def __cells(self, points) -> np.ndarray:
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
+
+    def __keys(self, cells) -> np.ndarray:
+        return np.ravel_multi_index(cells.T, self.shape)
+
+    def query_radius(self, points, radius: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Method to find every (query point, indexed point) pair closer than `radius`
+            - Returns : arrays of the query point indices, the indexed point indices and
+              their distances, one entry per pair
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        query_cells = self.__cells(points)
+        reach = int(np.ceil(radius / self.cell_size))
+
+        out_q, out_p, out_d = [], [], []
+        for offset in product(range(-reach, reach + 1), repeat=self.dims):
+            cells = query_cells + np.array(offset)
+            inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+            q_idx = np.flatnonzero(inside)
+            keys = self.__keys(cells[q_idx])
+
+            # looking up the occupied cells
+            pos = np.searchsorted(self.cell_keys, keys)
+            found = pos < len(self.cell_keys)
+            found[found] = self.cell_keys[pos[found]] == keys[found]
+            q_idx, pos = q_idx[found], pos[found]
+            if len(q_idx) == 0:
+                continue
+
+            # one candidate pair per point in the cell
+            counts = self.cell_counts[pos]
+            total = int(counts.sum())
+            q_rep = np.repeat(q_idx, counts)
+            within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            p_idx = self.order[np.repeat(self.cell_starts[pos], counts) + within]
+
+            dist = np.linalg.norm(points[q_rep] - self.points[p_idx], axis=1)
+            keep = dist < radius
+            out_q.append(q_rep[keep])
+            out_p.append(p_idx[keep])
+            out_d.append(dist[keep])
+
+        if len(out_q) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(out_q), np.concatenate(out_p), np.concatenate(out_d)
+
+    def query_pairs(self, radius: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Method to find every pair of indexed points closer than `radius`, each pair once
+            - Returns : arrays of the first point indices, the second point indices (always
+              larger than the first) and their distances
+        """
+        i, j, dist = self.query_radius(self.points, radius)
+        keep = i < j
+        return i[keep], j[keep], dist[keep]
+
+    def nearest(self, points, k: int = 1, max_dist: float = np.inf,
+                exclude_coincident: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Method to find the `k` nearest indexed points to every query point
+            - Arguments:
+                - `k` : the number of neighbours to find
+                - `max_dist` : ignore the points at this distance or further
+                - `exclude_coincident` : ignore the points at the exact same position
+            - Returns : <queries> x `k` arrays of the point indices and distances, sorted by
+              distance, padded with -1 and inf when there are fewer than `k` points
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        num_queries = len(points)
+        out_idx = np.full((num_queries, k), -1, dtype=np.int64)
+        out_dist = np.full((num_queries, k), np.inf)
+        if self.num_points == 0 or num_queries == 0:
+            return out_idx, out_dist
+
+        # every point is found once the radius spans the whole grid from any query point
+        extent = np.ptp(np.vstack([self.points, points]), axis=0)
+        full_radius = np.linalg.norm(extent) + self.cell_size
+
+        pending = np.arange(num_queries)
+        radius = self.cell_size
+        while len(pending):
+            if radius > self.MAX_REACH * self.cell_size:
+                # the few queries far from every point are cheaper to check one by one
+                self.__brute_nearest(points, pending, k, max_dist, exclude_coincident, out_idx, out_dist)
+                break
+            radius = min(radius, max_dist, full_radius)
+            q_idx, p_idx, dist = self.query_radius(points[pending], radius)
+            if exclude_coincident:
+                keep = dist > 0
+                q_idx, p_idx, dist = q_idx[keep], p_idx[keep], dist[keep]
+
+            # k smallest distances per query
+            order = np.lexsort((dist, q_idx))
+            q_idx, p_idx, dist = q_idx[order], p_idx[order], dist[order]
+            starts = np.searchsorted(q_idx, np.arange(len(pending)))
+            counts = np.bincount(q_idx, minlength=len(pending))
+            rank = np.arange(len(q_idx)) - np.repeat(starts, counts)
+            first_k = rank < k
+
+            # a query is done once it has k points within the radius, or nothing is left to find
+            final = radius >= min(max_dist, full_radius)
+            done = (counts >= k) | final
+            take = first_k & done[q_idx]
+            out_idx[pending[q_idx[take]], rank[take]] = p_idx[take]
+            out_dist[pending[q_idx[take]], rank[take]] = dist[take]
+
+            pending = pending[~done]
+            radius *= 2
+
+        return out_idx, out_dist
+
+    def __brute_nearest(self, points, queries, k, max_dist, exclude_coincident, out_idx, out_dist) -> None:
+        """
+        Method to fill in the nearest points of the queries passed in by checking every point
+        """
+        step = max(1, self.CHUNK // self.num_points)
+        for start in range(0, len(queries), step):
+            chunk = queries[start:start + step]
+            dist = np.linalg.norm(points[chunk, None, :] - self.points[None, :, :], axis=2)
+            dist[dist >= max_dist] = np.inf
+            if exclude_coincident:
+                dist[dist == 0] = np.inf
+
+            num = min(k, self.num_points)
+            nearest = np.argsort(dist, axis=1, kind="stable")[:, :num]
+            nearest_dist = np.take_along_axis(dist, nearest, axis=1)
+            nearest[np.isinf(nearest_dist)] = -1
+            out_idx[chunk, :num] = nearest
+            out_dist[chunk, :num] = nearest_dist
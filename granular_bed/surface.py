@@ -0,0 +1,94 @@
+import numpy as np
+
+
+def column_edges(x, radius, width: float = None) -> np.ndarray:
+    """
+    Function to get the edges of the columns the bed is split into along x
+        - `width` : the column width, the mean particle diameter by default
+    """
+    if width is None:
+        width = 2 * np.nanmean(radius)
+    lo, hi = np.nanmin(x), np.nanmax(x)
+    num_columns = max(1, int(np.ceil((hi - lo) / width)))
+    return lo + width * np.arange(num_columns + 1)
+
+
+def _column_keys(x, edges) -> tuple[np.ndarray, int]:
+    """
+    Function to get, for every particle, the index of its column plus the frame offset,
+    so the columns of every frame are told apart
+    """
+    num_columns = len(edges) - 1
+    column = np.clip(np.searchsorted(edges, x, side="right") - 1, 0, num_columns - 1)
+    frame = np.arange(x.shape[0])[:, None] if x.ndim == 2 else 0
+    return column + frame * num_columns, num_columns
+
+
+def surface_mask(x, y, radius, width: float = None, depth: int = 1, edges=None) -> np.ndarray:
+    """
+    Function to find the surface particles of a whole bed at once, by splitting it into
+    columns along x and taking the highest particles of every column
+        - Arguments:
+            - `x`, `y`, `radius` : arrays of the particle data, either 1D for a single frame
+              or <frames> x <particles> for every frame of a trajectory at once
+            - `width` : the column width, the mean particle diameter by default
+            - `depth` : the number of particles taken from the top of every column
+            - `edges` : the column edges along x, overrides `width`
+        - Returns : a boolean array with the shape of `x`, True for the surface particles
+
+    Particles with a NaN position are never on the surface.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), x.shape)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    mask = np.zeros(x.shape, dtype=bool)
+    if not valid.any():
+        return mask
+    if edges is None:
+        edges = column_edges(x[valid], radius[valid], width)
+
+    keys, _ = _column_keys(np.where(valid, x, edges[0]), np.asarray(edges))
+    keys, top = np.broadcast_to(keys, x.shape)[valid], (y + radius)[valid]
+
+    # ranking the particles of every column from the top
+    order = np.lexsort((-top, keys))
+    sorted_keys = keys[order]
+    starts = np.searchsorted(sorted_keys, sorted_keys, side="left")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - starts
+
+    mask[valid] = rank < depth
+    return mask
+
+
+def surface_height(x, y, radius, width: float = None, edges=None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function to get the free surface height profile h(x) of a bed, as the top of the
+    highest particle in every column
+        - Arguments:
+            - `x`, `y`, `radius` : arrays of the particle data, either 1D for a single frame
+              or <frames> x <particles> for every frame of a trajectory at once
+            - `width` : the column width, the mean particle diameter by default
+            - `edges` : the column edges along x, overrides `width`
+        - Returns : the heights, one per column (and per frame for 2D input), NaN for the
+          empty columns, and the column centres
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), x.shape)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    if edges is None:
+        edges = column_edges(x[valid], radius[valid], width)
+    edges = np.asarray(edges, dtype=np.float64)
+
+    keys, num_columns = _column_keys(np.where(valid, x, edges[0]), edges)
+    keys = np.broadcast_to(keys, x.shape)[valid]
+    num_frames = x.shape[0] if x.ndim == 2 else 1
+
+    heights = np.full(num_frames * num_columns, -np.inf)
+    np.maximum.at(heights, keys, (y + radius)[valid])
+    heights[np.isinf(heights)] = np.nan
+
+    centres = (edges[:-1] + edges[1:]) / 2
+    if x.ndim == 2:
+        return heights.reshape(num_frames, num_columns), centres
+    return heights, centres
@@ -0,0 +1,277 @@
+import bz2
+import zlib
+import numpy as np
+
+
+def open_source(filepath: str, blocks=None):  # -> DumpSource:
+    """
+    Function to open a dump file for random access, picking the reader from the first
+    bytes of the file, so plain, gzip, bzip2 and zstd compressed dumps are read alike
+        - `blocks` : the blocks of the file found before, see `DumpSource.blocks`
+    """
+    with open(filepath, 'rb') as input_file:
+        magic = input_file.read(4)
+    for source in (GzipSource, Bz2Source, ZstdSource):
+        if magic.startswith(source.MAGIC):
+            return source(filepath, blocks=blocks)
+    return DumpSource(filepath, blocks=blocks)
+
+
+class DumpSource:
+    """
+    Access to the bytes of a dump file by byte offset
+
+    Every offset is an offset in the uncompressed text of the dump, so the frame index is
+    the same whether the file is compressed or not.
+
+        - `blocks` : a <blocks> x 2 array of the (compressed, uncompressed) byte offsets
+          where the file can be decompressed from independently, i.e. where every gzip
+          member, bzip2 stream or zstd frame starts. A plain file is a single block.
+    """
+
+    compressed = False
+
+    def __init__(self, filepath: str, blocks=None) -> None:
+        self.filepath = filepath
+        self._blocks: list[tuple[int, int]] = [(0, 0)]
+        if blocks is not None and len(blocks):
+            self._blocks = [(int(comp), int(uncomp)) for comp, uncomp in np.reshape(blocks, (-1, 2))]
+
+    @property
+    def blocks(self) -> np.ndarray:
+        return np.array(self._blocks, dtype=np.int64).reshape(-1, 2)
+
+    def stream(self, offset: int = 0):
+        """
+        Method to open a binary stream over the bytes of the dump from `offset` on
+        """
+        handle = open(self.filepath, 'rb')
+        handle.seek(offset)
+        return handle
+
+    def read(self, start: int, end: int) -> bytes:
+        """
+        Method to get the bytes of the dump between the two offsets
+        """
+        with self.stream(start) as handle:
+            return handle.read(end - start)
+
+    def iter_ranges(self, starts, ends):  # -> Generator[bytes]:
+        """
+        Generator over the bytes of a sequence of ranges, read in a single pass over the
+        file as long as the ranges are sorted by offset
+        """
+        handle = None
+        pos = 0
+        try:
+            for start, end in zip(starts, ends):
+                start, end = int(start), int(end)
+                if handle is None or start < pos:
+                    if handle is not None:
+                        handle.close()
+                    handle = self.stream(start)
+                elif start > pos:
+                    handle.seek(start)
+                yield handle.read(end - start)
+                pos = end
+        finally:
+            if handle is not None:
+                handle.close()
+
+
+class _CompressedSource(DumpSource):
+    """
+    Access to a compressed dump file, decompressing from the closest block (or checkpoint)
+    before the offset asked for
+
+    The blocks are found while the file is read, and kept by the frame index so a cached
+    index can jump straight to them. Formats that allow copying the decompressor state
+    (gzip) also keep in-memory checkpoints every `CHECKPOINT_SPACING` bytes of output, so
+    single block files are only decompressed from the start once per session.
+    """
+
+    compressed = True
+    MAGIC = b""
+
+    # compressed bytes fed to the decompressor at once
+    CHUNK = 1 << 16
+
+    # uncompressed bytes between two in-memory checkpoints
+    CHECKPOINT_SPACING = 1 << 24
+
+    def __init__(self, filepath: str, blocks=None) -> None:
+        super().__init__(filepath, blocks=blocks)
+        self.checkpoints: list[tuple[int, int, object]] = []
+
+    def new_decompressor(self):
+        raise NotImplementedError
+
+    def copy_decompressor(self, decompressor):
+        """
+        Method to get an independent copy of a decompressor, or None if the format can't
+        """
+        return None
+
+    def stream(self, offset: int = 0):
+        return _DecompressingReader(self, offset)
+
+    def start_point(self, offset: int) -> tuple[int, int, object]:
+        """
+        Method to get the closest point before `offset` to decompress from
+            - Returns : the (compressed offset, uncompressed offset, decompressor)
+        """
+        uncomp_offsets = [uncomp for _, uncomp in self._blocks]
+        comp, uncomp = self._blocks[max(0, np.searchsorted(uncomp_offsets, offset, side="right") - 1)]
+        decompressor = None
+        for c_comp, c_uncomp, state in self.checkpoints:
+            if uncomp < c_uncomp <= offset:
+                comp, uncomp, decompressor = c_comp, c_uncomp, state
+        if decompressor is None:
+            return comp, uncomp, self.new_decompressor()
+        return comp, uncomp, self.copy_decompressor(decompressor)
+
+    def add_block(self, comp: int, uncomp: int) -> None:
+        if uncomp > self._blocks[-1][1]:
+            self._blocks.append((comp, uncomp))
+
+    def add_checkpoint(self, comp: int, uncomp: int, decompressor) -> None:
+        last = max([self._blocks[-1][1]] + [c_uncomp for _, c_uncomp, _ in self.checkpoints])
+        if uncomp - last < self.CHECKPOINT_SPACING:
+            return
+        state = self.copy_decompressor(decompressor)
+        if state is not None:
+            self.checkpoints.append((comp, uncomp, state))
+
+
+class GzipSource(_CompressedSource):
+    """
+    Gzip compressed dump. Every member of a multi-member file (`pigz -i`, `bgzip`,
+    concatenated `.gz` files) is a block.
+    """
+
+    MAGIC = b"\x1f\x8b"
+
+    def new_decompressor(self):
+        return zlib.decompressobj(wbits=31)
+
+    def copy_decompressor(self, decompressor):
+        return decompressor.copy()
+
+
+class Bz2Source(_CompressedSource):
+    """
+    Bzip2 compressed dump. Every stream of a multi-stream file (`pbzip2`) is a block.
+    """
+
+    MAGIC = b"BZh"
+
+    def new_decompressor(self):
+        return bz2.BZ2Decompressor()
+
+
+class ZstdSource(_CompressedSource):
+    """
+    Zstandard compressed dump, read with the `zstd` module of the standard library
+    (Python 3.14+) or the `zstandard` package. Every zstd frame is a block.
+    """
+
+    MAGIC = b"\x28\xb5\x2f\xfd"
+
+    def __init__(self, filepath: str, blocks=None) -> None:
+        super().__init__(filepath, blocks=blocks)
+        try:
+            from compression.zstd import ZstdDecompressor
+            self.__new = ZstdDecompressor
+        except ImportError:
+            try:
+                import zstandard
+            except ImportError:
+                raise ImportError(f"Reading the zstd compressed {filepath} needs Python 3.14+ "
+                                  f"or the `zstandard` package.") from None
+            self.__new = lambda: zstandard.ZstdDecompressor().decompressobj()
+
+    def new_decompressor(self):
+        return self.__new()
+
+
+class _DecompressingReader:
+    """
+    Binary stream over the decompressed bytes of a `_CompressedSource` from an offset on,
+    recording the blocks and checkpoints it passes in the source
+    """
+
+    def __init__(self, source: _CompressedSource, offset: int = 0) -> None:
+        self.__source = source
+        comp, uncomp, self.__decompressor = source.start_point(offset)
+        self.__file = open(source.filepath, 'rb')
+        self.__file.seek(comp)
+
+        # compressed offset of the next byte fed to the decompressor, and the bytes read
+        # from the file but not fed yet
+        self.__comp = comp
+        self.__pending = b""
+
+        # decompressed bytes not returned yet, starting at uncompressed offset `self.offset`
+        self.__buffer = bytearray()
+        self.offset = uncomp
+        self.__eof = False
+
+        self.seek(offset)
+
+    def __fill(self) -> bool:
+        if self.__eof:
+            return False
+        data = self.__pending or self.__file.read(self.__source.CHUNK)
+        self.__pending = b""
+        if not data:
+            self.__eof = True
+            return False
+
+        self.__buffer += self.__decompressor.decompress(data)
+        self.__comp += len(data)
+        produced = self.offset + len(self.__buffer)
+
+        if self.__decompressor.eof:
+            rest = self.__decompressor.unused_data
+            self.__comp -= len(rest)
+            rest = rest or self.__file.read(self.__source.CHUNK)
+            # anything but the start of another block is trailing padding
+            if rest.startswith(self.__source.MAGIC):
+                self.__source.add_block(self.__comp, produced)
+                self.__decompressor = self.__source.new_decompressor()
+                self.__pending = rest
+            else:
+                self.__eof = True
+        else:
+            self.__source.add_checkpoint(self.__comp, produced, self.__decompressor)
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        while (size < 0 or len(self.__buffer) < size) and self.__fill():
+            pass
+        if size < 0:
+            size = len(self.__buffer)
+        out = bytes(self.__buffer[:size])
+        del self.__buffer[:size]
+        self.offset += len(out)
+        return out
+
+    def seek(self, offset: int) -> int:
+        """
+        Method to move forward to the offset passed in, decompressing everything before it
+        """
+        if offset < self.offset:
+            raise ValueError(f"Can't seek back from {self.offset} to {offset} in {self.__source.filepath}.")
+        while self.offset < offset:
+            if not self.read(min(offset - self.offset, 1 << 22)):
+                break
+        return self.offset
+
+    def close(self) -> None:
+        self.__file.close()
+
+    def __enter__(self):  # -> _DecompressingReader:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
@@ -0,0 +1,423 @@
+from granular_vis.sim_tools import SimParams, _SimFileOperators, _frame_pool, _run_frame_chunk
+from granular_vis.traj_tools import Frame, Trajectory, stencil_reach
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import os
+import shutil
+import subprocess
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+# the fields colouring by them needs the velocities for
+VELOCITY_COLORS = ("speed", "v_x", "v_y", "a_x", "a_y")
+
+
+class FrameDrawer:
+    """
+    A single figure drawing the bed of one frame at a time, updating its artists in place
+    instead of drawing new ones:
+        - the particles are a single scatter collection, sized to their radius in data units
+        - the velocities are a single quiver
+
+    The figure is drawn with the Agg canvas, without pyplot, so it works in worker
+    processes and without a display.
+    """
+
+    def __init__(self, xlim, ylim, color: str = None, cmap: str = "Greys", clim=None,
+                 velocity: bool = False, velocity_scale: float = 1.0, radius: float = None,
+                 figsize=(8, 6), dpi: int = 100) -> None:
+        """
+            - Arguments:
+                - `xlim`, `ylim` : the (lo, hi) area of the bed drawn, in data units
+                - `color` : the field the particles are coloured by, `'speed'` for the norm
+                  of the velocity, or a single colour for every particle by default
+                - `cmap`, `clim` : the colour map and its (min, max), from the first frame
+                  drawn by default
+                - `velocity` : draw the velocity of every particle as an arrow
+                - `velocity_scale` : the length in data units of the arrow of a unit velocity
+                - `radius` : the radius of every particle when the frames have no `radius` field
+                - `figsize`, `dpi` : the size of the images, in inches and dots per inch
+        """
+        try:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+        except ImportError:
+            raise ImportError("Rendering the bed needs the `matplotlib` package.") from None
+
+        self.color = color
+        self.clim = clim
+        self.velocity = velocity
+        self.velocity_scale = velocity_scale
+        self.radius = radius
+        self.dpi = dpi
+
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.__canvas = FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.ax.set_xlim(*xlim)
+        self.ax.set_ylim(*ylim)
+        self.ax.set_aspect("equal")
+        self.__title = self.ax.set_title("")
+
+        # the artists are made empty and filled by the first frame drawn
+        colors = {"c": [], "cmap": cmap} if color is not None else {"color": "k"}
+        self.__scatter = self.ax.scatter([], [], linewidths=0, **colors)
+        self.__quiver = None
+
+        # marker areas are in points^2, so the radii are converted with the scale of the axes
+        self.__canvas.draw()
+        (x0, _), (x1, _) = self.ax.transData.transform([(0, 0), (1, 0)])
+        self.__points_per_unit = abs(x1 - x0) * 72 / dpi
+
+    def draw(self, frame: Frame, time: float = None) -> None:
+        """
+        Method to show the particles of a frame, which can hold any number of particles
+            - `time` : the time shown in the title, the timestep by default
+        """
+        x, y = frame.get_field("x"), frame.get_field("y")
+        radius = frame.columns["radius"] if "radius" in frame.columns else np.full(len(x), self.radius or 0.0)
+
+        self.__scatter.set_offsets(np.column_stack([x, y]))
+        self.__scatter.set_sizes((2 * radius * self.__points_per_unit) ** 2)
+        if self.color is not None:
+            values = get_color_values(frame, self.color)
+            if self.clim is None:
+                self.clim = _value_range(values)
+            self.__scatter.set_array(np.ma.masked_invalid(values))
+            self.__scatter.set_clim(*self.clim)
+
+        if self.velocity:
+            self.__draw_velocity(x, y, frame.get_field("v_x"), frame.get_field("v_y"))
+
+        label = f"t = {time:g}" if time is not None else f"Timestep {frame.timestep}"
+        self.__title.set_text(label)
+
+    def __draw_velocity(self, x, y, v_x, v_y) -> None:
+        # the quiver can't change its number of arrows, so it is made again when it changes
+        valid = ~(np.isnan(x) | np.isnan(y))
+        offsets = np.column_stack([np.where(valid, x, 0), np.where(valid, y, 0)])
+        u = np.ma.masked_where(~valid | np.isnan(v_x), v_x)
+        v = np.ma.masked_where(~valid | np.isnan(v_y), v_y)
+        if self.__quiver is None or self.__quiver.N != len(x):
+            if self.__quiver is not None:
+                self.__quiver.remove()
+            self.__quiver = self.ax.quiver(offsets[:, 0], offsets[:, 1], u, v, angles="xy",
+                                           scale_units="xy", scale=1 / self.velocity_scale,
+                                           color="tab:red", width=0.002)
+        else:
+            self.__quiver.set_offsets(offsets)
+            self.__quiver.set_UVC(u, v)
+
+    def to_rgb(self) -> np.ndarray:
+        """
+        Method to render the figure
+            - Returns : a <height> x <width> x 3 array of 8 bit RGB values
+        """
+        self.__canvas.draw()
+        return np.asarray(self.__canvas.buffer_rgba())[:, :, :3].copy()
+
+    def save(self, filepath: str) -> None:
+        """
+        Method to write the figure to an image file, the format being given by the extension
+        """
+        self.figure.savefig(filepath, dpi=self.dpi)
+
+
+class BedAnimator:
+    """
+    Class to render the frames of a simulation to an image sequence or a video
+
+    The frames are split into chunks of consecutive frames, and every chunk is parsed,
+    differentiated and drawn by a pool of processes, each opening the dump file itself and
+    reusing a single `FrameDrawer`. Only the frame indices and the images (or the paths of
+    the images written) are sent between the processes.
+    """
+
+    def __init__(self, sim: SimParams, color: str = None, cmap: str = "Greys", clim=None,
+                 velocity: bool = False, velocity_scale: float = 1.0, xlim=None, ylim=None,
+                 figsize=(8, 6), dpi: int = 100, ids=None, method: str = "central",
+                 window: int = 7, order: int = 2) -> None:
+        """
+            - Arguments:
+                - `sim` : the simulation to render
+                - `xlim`, `ylim` : the area drawn, the box of the first frame by default
+                - `ids` : the particle IDs to draw, every particle but the disc by default
+                - `method`, `window`, `order` : the stencil of the velocities, see `differentiate`
+                - see `FrameDrawer` for the others
+        """
+        self.sim = sim
+        oper = sim.get_bed_oper()
+        bounds = oper.index.box_bounds[0] if len(oper.index) else np.array([[0, 1], [0, 1]])
+        self.style = {
+            "xlim": tuple(xlim) if xlim is not None else tuple(bounds[0]),
+            "ylim": tuple(ylim) if ylim is not None else tuple(bounds[1]),
+            "color": color,
+            "cmap": cmap,
+            "clim": clim,
+            "velocity": velocity,
+            "velocity_scale": velocity_scale,
+            "figsize": figsize,
+            "dpi": dpi,
+        }
+        self.ids = ids
+        self.kinematics = {"method": method, "window": window, "order": order}
+
+    @property
+    def needs_velocity(self) -> bool:
+        return self.style["velocity"] or self.style["color"] in VELOCITY_COLORS
+
+    def get_fields(self) -> list[str]:
+        """
+        Method to get the fields of the dump file the frames are drawn from
+        """
+        available = self.sim.get_bed_oper().get_selection(absolute_coords=True)[1]
+        fields = ["x", "y"] + [field for field in ("radius",) if field in available]
+        color = self.style["color"]
+        if color is not None and color not in VELOCITY_COLORS and color not in fields:
+            fields.append(color)
+        return fields
+
+    def get_drawer(self) -> FrameDrawer:
+        """
+        Method to get a new figure with the style of the animation
+        """
+        return FrameDrawer(radius=_default_radius(self.sim), **self.style)
+
+    def draw_frame(self, idx: int = 0):  # -> matplotlib.figure.Figure:
+        """
+        Method to draw a single frame, e.g. to check the style before rendering every frame
+        """
+        frames = np.arange(len(self.sim.get_bed_oper().index))
+        job = _chunk_jobs(frames, idx, 1, self.__reach())[0]
+        drawer = self.get_drawer()
+        for frame in _prepare_frames(self.sim.get_bed_oper(), job, self.__job_state()):
+            drawer.draw(frame, time=frame.timestep * self.sim.dt)
+        return drawer.figure
+
+    def save_images(self, directory: str, start: int = 0, stop: int = None, step: int = 1,
+                    workers: int = None, chunksize: int = None, pattern: str = "frame_{:06d}.png",
+                    progress=None) -> list[str]:
+        """
+        Method to write every frame of a range to an image file
+            - Arguments:
+                - `directory` : the directory of the images, made if needed
+                - `start`, `stop`, `step` : the range of frame indices, as in `range`
+                - `workers` : the number of processes, all the available cores by default,
+                  1 to render in this process
+                - `chunksize` : the number of consecutive frames a process draws at once
+                - `pattern` : the name of the image files, formatted with the frame index
+                - `progress` : called as `progress(done, total)` every time a chunk is done
+            - Returns : the paths of the images, in frame order
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for chunk in self.__render(start, stop, step, workers, chunksize, progress,
+                                   os.path.join(directory, pattern)):
+            paths.extend(chunk)
+        return paths
+
+    def save_video(self, filepath: str, start: int = 0, stop: int = None, step: int = 1,
+                   fps: float = 30, workers: int = None, chunksize: int = None,
+                   codec: str = "libx264", ffmpeg: str = "ffmpeg", progress=None) -> None:
+        """
+        Method to write a range of frames to a video file, by piping the raw images to `ffmpeg`
+            - Arguments:
+                - `fps` : the frames per second of the video
+                - `codec`, `ffmpeg` : the video codec and the path of the `ffmpeg` executable
+                - see `save_images` for the others
+        """
+        executable = shutil.which(ffmpeg)
+        if executable is None:
+            raise FileNotFoundError(f"Writing a video needs ffmpeg, \"{ffmpeg}\" was not found.")
+
+        process = None
+        try:
+            for chunk in self.__render(start, stop, step, workers, chunksize, progress, None):
+                for image in chunk:
+                    if process is None:
+                        height, width, _ = image.shape
+                        process = subprocess.Popen([
+                            executable, "-y", "-loglevel", "error",
+                            "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}",
+                            "-r", str(fps), "-i", "-",
+                            # most codecs need even image sizes
+                            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                            "-c:v", codec, "-pix_fmt", "yuv420p", filepath,
+                        ], stdin=subprocess.PIPE)
+                    process.stdin.write(image.tobytes())
+        finally:
+            if process is not None:
+                process.stdin.close()
+                if process.wait() != 0:
+                    raise RuntimeError(f"ffmpeg failed to write {filepath}.")
+
+    def __reach(self) -> int:
+        return stencil_reach(self.kinematics["method"], self.kinematics["window"]) if self.needs_velocity else 0
+
+    def __job_state(self) -> dict:
+        return {
+            "fields": self.get_fields(),
+            "ids": self.ids,
+            "dt": self.sim.dt,
+            "kinematics": self.kinematics if self.needs_velocity else None,
+        }
+
+    def __render(self, start, stop, step, workers, chunksize, progress, pattern):  # -> Generator[list]:
+        """
+        Generator over the rendered chunks of a range of frames, in frame order. At most
+        two chunks per process are rendered ahead of the one being consumed, so the memory
+        used does not depend on the number of frames.
+        """
+        oper = self.sim.get_bed_oper()
+        frames = np.arange(len(oper.index))[slice(start, stop, step)]
+        if self.needs_velocity and len(frames) < 2:
+            raise ValueError("At least 2 frames are needed to differentiate.")
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if chunksize is None:
+            chunksize = max(1, int(np.ceil(len(frames) / (workers * 4))))
+        jobs = _chunk_jobs(frames, 0, chunksize, self.__reach())
+        state = self.__job_state()
+
+        # every process has to colour with the same limits
+        style = dict(self.style)
+        if style["color"] is not None and style["clim"] is None and len(jobs):
+            first = next(_prepare_frames(oper, jobs[0], state))
+            style["clim"] = _value_range(get_color_values(first, style["color"]))
+        for job in jobs:
+            job["pattern"] = pattern
+
+        state.update(style=style, radius=_default_radius(self.sim))
+
+        done = 0
+        with self.sim.stats.stage("render"):
+            if workers == 1:
+                local = _setup_drawer(state)
+                results = ((_draw_chunk(oper, job, local), None) for job in jobs)
+            else:
+                executor = _frame_pool(oper, workers, _draw_chunk, state, setup=_setup_drawer)
+                results = _ordered(executor, jobs, 2 * workers)
+
+            try:
+                for job, (result, job_stats) in zip(jobs, results):
+                    if workers != 1:
+                        self.sim.stats.merge(job_stats)
+                    done += len(job["frames"][job["keep"]])
+                    if progress is not None:
+                        progress(done, len(frames))
+                    logger.debug("Rendered %d of %d frames", done, len(frames))
+                    yield result
+            finally:
+                if workers != 1:
+                    executor.shutdown(cancel_futures=True)
+
+
+def get_color_values(frame: Frame, color: str) -> np.ndarray:
+    """
+    Function to get the value every particle of a frame is coloured by
+    """
+    if color == "speed":
+        return np.hypot(frame.get_field("v_x"), frame.get_field("v_y"))
+    return frame.get_field(color)
+
+
+def _value_range(values) -> tuple[float, float]:
+    values = np.asarray(values, dtype=np.float64)
+    if np.isnan(values).all():
+        return 0.0, 1.0
+    lo, hi = float(np.nanmin(values)), float(np.nanmax(values))
+    return (lo, hi) if hi > lo else (lo, lo + 1.0)
+
+
+def _default_radius(sim: SimParams) -> float:
+    """
+    Function to get the radius drawn for particles without a `radius` field, a hundredth
+    of the box width
+    """
+    return sim.box_width / 100 if "radius" not in sim.fields else None
+
+
+def _chunk_jobs(frames, start: int, chunksize: int, reach: int) -> list[dict]:
+    """
+    Function to split the frames into chunks of consecutive frames, each with the
+    neighbouring frames its velocities are derived from
+        - Returns : for every chunk, the `frames` to parse and the slice of them to `keep`
+
+    With `reach` frames on both sides (and at least a full stencil at the ends), the
+    velocities of a chunk are the ones `differentiate` gives over every frame.
+    """
+    size = 2 * reach + 1
+    num_frames = len(frames)
+    jobs = []
+    for first in range(start, num_frames, chunksize):
+        last = min(num_frames, first + chunksize)
+        lo, hi = max(0, first - reach), min(num_frames, last + reach)
+        if reach:
+            hi = max(hi, min(num_frames, lo + size))
+            lo = min(lo, max(0, hi - size))
+        jobs.append({"frames": frames[lo:hi], "keep": slice(first - lo, last - lo)})
+    return jobs
+
+
+def _prepare_frames(oper: _SimFileOperators, job: dict, state: dict):  # -> Generator[Frame]:
+    """
+    Function to parse the frames of a chunk, with their velocities when needed
+    """
+    frames = list(oper.iter_frames(job["frames"], fields=state["fields"], ids=state["ids"]))
+    if state["kinematics"] is not None:
+        traj = Trajectory.from_frames(frames)
+        with oper.stats.stage("differentiate"):
+            traj.differentiate(time=traj.timesteps * state["dt"], **state["kinematics"])
+        frames = [
+            Frame(frame.idx, frame.timestep, frame.ids, traj.get_frame(row))
+            for row, frame in enumerate(frames)
+        ]
+    yield from frames[job["keep"]]
+
+
+def _setup_drawer(state: dict) -> dict:
+    """
+    Function to make the figure a process draws every frame on, once
+    """
+    return dict(state, drawer=FrameDrawer(radius=state["radius"], **state["style"]))
+
+
+def _draw_chunk(oper: _SimFileOperators, job: dict, state: dict) -> list:
+    """
+    Function to draw the frames of a chunk on the figure of `_setup_drawer`
+        - Returns : the paths of the images written when the job has a file name `pattern`,
+          or the RGB images otherwise
+    """
+    drawer = state["drawer"]
+    out = []
+    for frame in _prepare_frames(oper, job, state):
+        drawer.draw(frame, time=frame.timestep * state["dt"])
+        if job["pattern"] is None:
+            out.append(drawer.to_rgb())
+        else:
+            path = job["pattern"].format(frame.idx)
+            drawer.save(path)
+            out.append(path)
+    return out
+
+
+def _ordered(executor: ProcessPoolExecutor, jobs: list, ahead: int):  # -> Generator:
+    """
+    Generator over the results of the jobs in order, keeping at most `ahead` jobs submitted
+    """
+    pending = deque()
+    jobs = iter(jobs)
+    for job in jobs:
+        pending.append(executor.submit(_run_frame_chunk, job))
+        if len(pending) >= ahead:
+            break
+    while pending:
+        result = pending.popleft().result()
+        for job in jobs:
+            pending.append(executor.submit(_run_frame_chunk, job))
+            break
+        yield result
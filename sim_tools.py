@@ -1,19 +1,69 @@
-from granular_vis.granular_bed.bed_tools import Bed
-from concurrent.futures import ThreadPoolExecutor
-from time import perf_counter
+from granular_vis.granular_bed.bed_tools import Bed, Selection
+from granular_vis.granular_bed.profiles import BedProfile
+from granular_vis.granular_bed.coarse import coarse_grain
+from granular_vis.granular_bed.contacts import ContactNetwork
+from granular_vis.granular_bed.impactor import find_impactor, penetration_depth, surface_level
+from granular_vis.granular_bed.surface import surface_height, surface_mask
+from granular_vis.traj_tools import Frame, Trajectory, stencil_reach
+from collections import deque
+from itertools import islice
+from granular_vis.cache_tools import FrameCache, SidecarCache
+from granular_vis.coord_tools import output_fields, transform
+from granular_vis.export_tools import export_frames
+from granular_vis.io_tools import open_source
+from granular_vis.stats_tools import LoadStats
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import perf_counter, sleep
+import logging
+import os
+import tempfile
 import numpy as np
 
 
+logger = logging.getLogger(__name__)
+
+
 class SimParams:
     """
     Class to capture the state of the granular bed in the simulation
     """
 
-    def __init__(self, filepath: str) -> None:
-        self.__bed_oper = _SimFileOperators(filepath)
+    def __init__(self, filepath: str, cache: bool = True, dt: float = 1.0, stats: LoadStats = None,
+                 frame_cache_bytes: int = FrameCache.DEFAULT_BYTES, unwrap: bool = False,
+                 impactor=None) -> None:
+        """
+            - Arguments:
+                - `filepath` : path to the LAMMPS dump file
+                - `cache` : keep the frame index and the parsed trajectory in a binary
+                  sidecar cache next to the dump file, see `SidecarCache`
+                - `dt` : the simulation time of a single timestep, used as the time unit
+                  of the velocities and accelerations
+                - `stats` : a `LoadStats` to collect the loading counters and timings in,
+                  a new one by default (see `self.stats`)
+                - `frame_cache_bytes` : the memory budget of the in-memory cache of parsed
+                  frames, profiles and surfaces used by the `*_static` methods, 0 to disable it
+                  (see `self.frame_cache`)
+                - `unwrap` : add the image flags of the dump (`ix`, `iy`, `iz`) to the positions,
+                  so the particles crossing a periodic boundary don't jump across the box in
+                  the trajectory and its derivatives
+                - `impactor` : how the impactor is told apart from the bed, the particle with
+                  the largest ID by default, see `impactor.find_impactor`
+        """
+        self.dt = dt
+        self.__bed_oper = _SimFileOperators(filepath, cache=SidecarCache(filepath) if cache else None,
+                                            stats=stats, unwrap=unwrap, impactor=impactor)
+        self.stats: LoadStats = self.__bed_oper.stats
+        self.frame_cache = FrameCache(frame_cache_bytes)
+
+        # the trajectory loaded by `render_bed_single` / `render_bed_multi`, the impactor
+        # split from it in the same pass, and the stencil their velocities and
+        # accelerations were derived with
+        self.render_bed: Trajectory = None
+        self.impactor: Trajectory = None
+        self.__kinematics = {"method": "central", "window": 7, "order": 2}
 
         # the initial state of the bed in the simulation
-        self.initial_state: Bed = Bed(self.__bed_oper.get_bed_snap())
+        self.initial_state: Bed = self.get_bed_static()
 
         self.timesteps = self.__bed_oper.get_timesteps()
         self.num_timesteps = len(self.timesteps)
@@ -27,138 +77,961 @@ class SimParams:
         self.fields = self.__bed_oper.get_available_fields()
 
     def initial_state_scaled(self) -> Bed:
-        return Bed(self.__bed_oper.get_bed_snap(absolute_coords=False))
+        return self.get_bed_static(absolute_coords=False)
 
-    def get_bed_static(self, idx: int = 0, absolute_coords=True, include_only=None) -> Bed:
-        return Bed(self.__bed_oper.get_bed_snap(idx=idx, timestep=self.timesteps[idx]['value'],
-                                                absolute_coords=absolute_coords,
-                                                include_only=include_only))
+    def get_bed_static(self, idx: int = 0, absolute_coords=True, include_only=None, timestep: int = None) -> Bed:
+        """
+        Method to get the bed at a single frame. The parsed frame is kept in `self.frame_cache`,
+        so going back to a frame does not parse it again.
+            - `timestep` : the timestep value of the frame, instead of its index `idx`
+        """
+        if timestep is not None:
+            idx = self.__bed_oper.index.find_timestep(timestep)
+        frame = self.__get_frame(idx, absolute_coords, include_only)
+        return Bed.from_arrays(frame.ids, dict(frame.columns))
 
-    def get_bed_dynamic(self, idx: int = 0, absolute_coords=True, include_only=None) -> Bed:
+    def get_profile_static(self, idx: int = 0, absolute_coords=True, include_only=None) -> BedProfile:
         """
-        Method to get the expanded data
+        Method to get the `BedProfile` of the bed at a single frame, kept in `self.frame_cache`
         """
-        out: dict = {}
+        key = self.__frame_key("profile", idx, absolute_coords, include_only)
+        return self.frame_cache.get_or_create(
+            key, lambda: self.get_bed_static(key[1], absolute_coords, include_only).make_profile())
+
+    def get_surface_static(self, idx: int = 0, method: str = "profile", width: float = None, depth: int = 1,
+                           absolute_coords=True, include_only=None) -> Selection:
         """
-        p_ID : {
-            ax : [...],
-            vx : [...]
-        },
-        p_ID : {
-            ax : [...],
-            vx : [...]
-        },
-        ...
-        """
-        for p_ID, fields in self.render_bed.items():
-            if include_only is not None:
-                if p_ID not in include_only:
-                    continue
-            out[p_ID] = {
-                field: f_array[idx]
-                for field, f_array in fields.items()
-            }
+        Method to get the surface particles of the bed at a single frame (see `Bed.get_surface`
+        for the arguments), kept in `self.frame_cache`
+        """
+        key = self.__frame_key("surface", idx, absolute_coords, include_only) + (method, width, depth)
+        return self.frame_cache.get_or_create(
+            key, lambda: self.get_bed_static(key[1], absolute_coords, include_only).get_surface(
+                method=method, width=width, depth=depth))
 
-        return Bed(out)
+    def get_contacts_static(self, idx: int = 0, tolerance: float = 1.0, absolute_coords=True,
+                            include_only=None) -> ContactNetwork:
+        """
+        Method to get the contact network of the bed at a single frame, kept in `self.frame_cache`
+        """
+        key = self.__frame_key("contacts", idx, absolute_coords, include_only) + (tolerance,)
+        return self.frame_cache.get_or_create(
+            key, lambda: self.get_bed_static(key[1], absolute_coords, include_only).get_contacts(tolerance))
 
-    def render_bed_multi(self) -> None:
-        self.render_bed = self.__bed_oper.read_timesteps_multi()
+    def iter_contacts(self, start: int = 0, stop: int = None, step: int = 1, tolerance: float = 1.0,
+                      ids=None):  # -> Generator[ContactNetwork]:
+        """
+        Generator over the contact networks of a range of frames, parsing one frame at a time
+        """
+        for frame in self.iter_frames(start, stop, step, ids=ids):
+            z = frame.columns.get('z')
+            yield ContactNetwork.from_positions(frame.ids, frame.get_field('x'), frame.get_field('y'),
+                                                frame.get_field('radius'), z=z, tolerance=tolerance)
+
+    def __frame_key(self, kind: str, idx: int, absolute_coords, include_only) -> tuple:
+        """
+        Method to get the `self.frame_cache` key of a product of a frame
+        """
+        idx = range(len(self.__bed_oper.index))[idx]
+        ids = None if include_only is None else np.unique(np.fromiter(include_only, dtype=np.int64)).tobytes()
+        return kind, idx, bool(absolute_coords), ids
+
+    def __get_frame(self, idx: int, absolute_coords=True, include_only=None) -> Frame:
+        """
+        Method to get a parsed frame from `self.frame_cache`, parsing it on a miss.
+        The cached arrays are read-only, since every bed made from them shares them.
+        """
+        key = self.__frame_key("frame", idx, absolute_coords, include_only)
+
+        def __read() -> Frame:
+            frame = self.__bed_oper.read_frame(key[1], ids=include_only, absolute_coords=absolute_coords)
+            for values in frame.columns.values():
+                values.flags.writeable = False
+            return frame
+
+        return self.frame_cache.get_or_create(key, __read)
+
+    def get_bed_dynamic(self, idx: int = 0, absolute_coords=True, include_only=None) -> Bed:
+        """
+        Method to get the expanded data, including the derived velocities and accelerations,
+        from the rendered trajectory
+        """
+        traj = self.render_bed
+        columns = traj.get_frame(idx)
+        if include_only is None:
+            return Bed.from_arrays(traj.ids, columns)
+
+        keep = np.isin(traj.ids, np.fromiter(include_only, dtype=np.int64))
+        return Bed.from_arrays(traj.ids[keep], {field: values[keep] for field, values in columns.items()})
+
+    def render_bed_multi(self, workers: int = None, ids=None, fields=None) -> None:
+        """
+        Method to load the whole trajectory with a pool of processes, then differentiate it
+            - `ids`, `fields` : only load these particles and fields, all of them by default
+        """
+        self.render_bed, self.impactor = self.__load_trajectory(
+            lambda: self.__bed_oper.read_timesteps_multi(workers=workers, ids=ids, fields=fields),
+            ids=ids, fields=fields)
         self.differentiate()
 
-    def render_bed_single(self) -> None:
-        self.render_bed = self.__bed_oper.read_timesteps_single()
+    def render_bed_single(self, ids=None, fields=None) -> None:
+        """
+        Method to load the whole trajectory, then differentiate it
+            - `ids`, `fields` : only load these particles and fields, all of them by default
+        """
+        self.render_bed, self.impactor = self.__load_trajectory(
+            lambda: self.__bed_oper.read_timesteps_single(ids=ids, fields=fields),
+            ids=ids, fields=fields)
         self.differentiate()
 
+    def __load_trajectory(self, reader, ids=None, fields=None) -> tuple[Trajectory, Trajectory]:
+        """
+        Method to get the parsed trajectories of the bed and the impactor from the sidecar
+        cache, or parse them with the reader passed in and store them in the cache.
+        Partial loads are taken out of a cached trajectory, but never stored. The impactor
+        of a partial load has no `surface_height` either way, see `get_impactor_series`.
+        """
+        cache = self.__bed_oper.cache
+        suffix = "_unwrapped" if self.__bed_oper.unwrap else ""
+        if cache is not None:
+            with self.stats.stage("cache_load"):
+                traj = cache.load_trajectory("trajectory" + suffix)
+                impactor = cache.load_trajectory("impactor" + suffix)
+            # the impactor may have been picked differently when the cache was written
+            hit = traj is not None and impactor is not None and impactor.ids[0] == self.DISC_ID
+            self.stats.record_cache(hit)
+            if hit:
+                if ids is None and fields is None:
+                    return traj, impactor
+                if ids is not None:
+                    impactor = Trajectory(impactor.ids, impactor.timesteps, {
+                        **impactor.columns, "surface_height": np.full((impactor.num_frames, 1), np.nan)})
+                ids, fields = self.__bed_oper.get_selection(ids, fields)
+                return traj.subset(ids=np.intersect1d(ids, traj.ids), fields=fields), impactor
+
+        traj, impactor = reader()
+        if ids is not None or fields is not None:
+            return traj, impactor
+        if cache is not None:
+            try:
+                with self.stats.stage("cache_save"):
+                    cache.save_trajectory(traj, "trajectory" + suffix)
+                    cache.save_trajectory(impactor, "impactor" + suffix)
+            except (OSError, ValueError) as err:
+                logger.warning("Could not write the cache in %s: %s", cache.directory, err)
+        return traj, impactor
+
+    def iter_frames(self, start: int = 0, stop: int = None, step: int = 1,
+                    fields=None, ids=None, absolute_coords=True, frames=None):  # -> Generator[Frame]:
+        """
+        Generator over the frames of the simulation that parses one frame at a time,
+        so the memory used does not depend on the length of the trajectory
+            - Arguments:
+                - `start`, `stop`, `step` : the range of frame indices, as in `range`
+                - `fields` : the fields to keep, all of them by default
+                - `ids` : the particle IDs to keep, every particle but the disc by default
+                - `frames` : the frame indices, e.g. from `frames_between`, instead of a range
+        """
+        frames = self.__frame_range(start, stop, step, frames)
+        yield from self.__bed_oper.iter_frames(frames, fields=fields, ids=ids,
+                                               absolute_coords=absolute_coords)
+
+    def iter_windows(self, start: int = 0, stop: int = None, step: int = 1,
+                     fields=None, ids=None, width: int = 3, absolute_coords=True):  # -> Generator[Trajectory]:
+        """
+        Generator over sliding windows of `width` consecutive frames, advancing one frame
+        at a time. Every window is a `Trajectory` and only `width` frames are held in memory.
+        """
+        window = deque(maxlen=width)
+        for frame in self.iter_frames(start, stop, step, fields=fields, ids=ids,
+                                      absolute_coords=absolute_coords):
+            window.append(frame)
+            if len(window) == width:
+                yield Trajectory.from_frames(list(window))
+
+    def iter_kinematics(self, start: int = 0, stop: int = None, step: int = 1,
+                        fields=None, ids=None, absolute_coords=True,
+                        method: str = "central", window: int = 7, order: int = 2,
+                        frames=None):  # -> Generator[Frame]:
+        """
+        Generator over the frames of the simulation with the velocities and accelerations
+        of the position fields added on the fly, from a sliding window of the neighbouring
+        frames. The values match the ones `differentiate` gives for the same frame range
+        and stencil.
+            - `frames` : the frame indices, e.g. from `frames_between`, instead of a range
+        """
+        frames = self.__frame_range(start, stop, step, frames)
+        num_frames = len(frames)
+        if num_frames < 2:
+            raise ValueError("At least 2 frames are needed to differentiate.")
+
+        # the derivatives of a frame depend on the positions up to `reach` frames away,
+        # and the first and last frames on the first and last full windows
+        reach = stencil_reach(method, window)
+        size = 2 * reach + 1
+        frame_window = deque(maxlen=size)
+        next_out = 0
+        loaded = -1
+        for frame in self.__bed_oper.iter_frames(frames, fields=fields, ids=ids,
+                                                 absolute_coords=absolute_coords):
+            frame_window.append(frame)
+            loaded += 1
+            done = loaded == num_frames - 1
+            while next_out < num_frames and (done or (next_out + reach <= loaded and loaded >= size - 1)):
+                first = loaded - len(frame_window) + 1
+                yield self.__differentiate_window(list(frame_window), next_out - first,
+                                                  method=method, window=window, order=order)
+                next_out += 1
+
+    def __frame_range(self, start: int, stop: int, step: int, frames=None):  # -> range | np.ndarray:
+        """
+        Method to get the frame indices of a range, or check the ones passed in
+        """
+        if frames is None:
+            return range(*slice(start, stop, step).indices(len(self.__bed_oper.index)))
+        return np.arange(len(self.__bed_oper.index))[np.asarray(frames, dtype=np.int64)]
+
+    def frames_between(self, start=None, stop=None, step: int = 1, time: bool = False) -> np.ndarray:
+        """
+        Method to find the frames with a timestep value between two bounds, by a binary search
+        over the sorted timesteps of the frame index, so no frame is read
+            - Arguments:
+                - `start`, `stop` : the inclusive bounds, open ended by default
+                - `step` : keep every `step`-th frame found, to decimate the window
+                - `time` : the bounds are simulation times (timestep * `dt`) instead of
+                  timestep values
+            - Returns : the frame indices, in frame order, e.g. for `iter_frames` or `map_frames`
+        """
+        if time:
+            start = None if start is None else _time_to_timestep(start, self.dt)
+            stop = None if stop is None else _time_to_timestep(stop, self.dt)
+        return self.__bed_oper.index.frames_between(start, stop)[::step]
+
+    def nearest_frame(self, timestep=None, time: float = None) -> int:
+        """
+        Method to find the frame closest to a timestep value, or to a simulation time
+        """
+        if (timestep is None) == (time is None):
+            raise ValueError("Exactly one of timestep and time has to be passed in.")
+        if time is not None:
+            timestep = _time_to_timestep(time, self.dt)
+        return self.__bed_oper.index.nearest(timestep)
+
+    def __differentiate_window(self, frames: list[Frame], pos: int, **kwargs) -> Frame:
+        """
+        Method to get the frame at position `pos` of a window with the derived fields added
+        """
+        traj = Trajectory.from_frames(frames)
+        traj.differentiate(time=traj.timesteps * self.dt, **kwargs)
+        frame = frames[pos]
+        return Frame(frame.idx, frame.timestep, frame.ids, traj.get_frame(pos))
+
+    def map_frames(self, func, frames=None, workers: int = None, chunksize: int = None,
+                   absolute_coords=True, include_only=None, progress=None):  # -> np.ndarray | list:
+        """
+        Method to run an analysis on the bed of every frame passed in, with a pool of processes
+            - Arguments:
+                - `func` : called as `func(bed)` with the `Bed` of every frame. It has to be
+                  picklable, e.g. a module level function, unless `workers` is 1.
+                - `frames` : the frame indices, every frame by default
+                - `workers` : the number of processes, all the available cores by default,
+                  1 to run in this process
+                - `chunksize` : the number of consecutive frames a process gets at once
+                - `progress` : called as `progress(done, total)` every time a chunk is done
+            - Returns : the results in frame order, stacked into an array when they are all
+              numbers or arrays of the same shape
+
+        Every process opens the dump file itself from the frame index it gets once, so only
+        the frame indices and the results are sent between the processes.
+        """
+        frames = self.__frame_range(0, None, 1, frames)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if chunksize is None:
+            chunksize = max(1, int(np.ceil(len(frames) / (workers * 4))))
+        chunks = [frames[i:i + chunksize] for i in range(0, len(frames), chunksize)]
+
+        state = {"func": func, "absolute_coords": absolute_coords, "include_only": include_only}
+
+        results = [None] * len(chunks)
+        done = 0
+        if workers == 1:
+            for i, chunk in enumerate(chunks):
+                results[i] = _map_chunk(self.__bed_oper, chunk, state)
+                done += len(chunk)
+                if progress is not None:
+                    progress(done, len(frames))
+        else:
+            with self.stats.stage("map"), _frame_pool(self.__bed_oper, workers, _map_chunk, state) as executor:
+                futures = {executor.submit(_run_frame_chunk, chunk): i for i, chunk in enumerate(chunks)}
+                for future in as_completed(futures):
+                    results[futures[future]], job_stats = future.result()
+                    self.stats.merge(job_stats)
+                    done += len(chunks[futures[future]])
+                    if progress is not None:
+                        progress(done, len(frames))
+                    logger.debug("Mapped %d of %d frames", done, len(frames))
+
+        return _gather([value for chunk in results for value in chunk])
+
+    def export(self, filepath: str, start: int = 0, stop: int = None, step: int = 1, frames=None,
+               fields=None, ids=None, kinematics: bool = True, file_format: str = None, chunk_frames: int = 64,
+               chunk_particles: int = None, compression: str = None, progress=None) -> int:
+        """
+        Method to convert a range of frames to HDF5, Zarr or Parquet for other tools, streaming
+        them from the dump file `chunk_frames` at a time so the memory used stays flat
+            - Arguments:
+                - `start`, `stop`, `step`, `frames` : the frames, see `iter_frames`
+                - `fields`, `ids` : only export these fields and particles, all of them by default
+                - `kinematics` : add the velocities and accelerations, derived on the fly with
+                  the stencil of the last `differentiate` (see `iter_kinematics`). The frames
+                  the stencil reaches past both ends are read too but not written, so the
+                  first and last frames get the values `differentiate` gives over the longer run.
+                - see `export_tools.export_frames` for the others
+            - Returns : the number of frames written
+
+        The export is read back with `export_tools.open_export`.
+        """
+        frames = self.__frame_range(start, stop, step, frames)
+        reach = stencil_reach(self.__kinematics["method"], self.__kinematics["window"])
+        padded, lead = _pad_frames(frames, reach, len(self.__bed_oper.index))
+        if kinematics and len(padded) >= 2:
+            stream = islice(self.iter_kinematics(frames=padded, fields=fields, ids=ids, **self.__kinematics),
+                            lead, lead + len(frames))
+        else:
+            stream = self.iter_frames(frames=frames, fields=fields, ids=ids)
+        with self.stats.stage("export"):
+            return export_frames(filepath, stream, len(frames), dt=self.dt, file_format=file_format,
+                                 chunk_frames=chunk_frames, chunk_particles=chunk_particles,
+                                 compression=compression, source=self.__bed_oper.filepath, progress=progress)
+
     def get_bed_oper(self):
         return self.__bed_oper
 
-    def differentiate(self) -> None:
+    def differentiate(self, method: str = "central", window: int = 7, order: int = 2) -> None:
+        """
+        Method to differentiate the position fields of the rendered trajectory to get the
+        velocity and acceleration of every particle, using the actual time of every frame
+            - Arguments:
+                - `method` : `'central'`, `'fourth'` or `'savgol'`, see `traj_tools.differentiate`
+                - `window`, `order` : the window length and polynomial order for `'savgol'`
+        """
+        self.__kinematics = {"method": method, "window": window, "order": order}
+        with self.stats.stage("differentiate"):
+            for traj in (self.render_bed, self.impactor):
+                if traj is not None and traj.num_frames >= 2:
+                    traj.differentiate(time=traj.timesteps * self.dt, **self.__kinematics)
+
+    def load_impactor(self, workers: int = None) -> Trajectory:
+        """
+        Method to load the impactor of every frame, with its velocity and acceleration,
+        without keeping any of the bed but its surface height (see `get_impactor_series`)
+            - `workers` : the number of processes, all the available cores by default,
+              1 to parse in this process
+        """
+        oper = self.__bed_oper
+        if workers == 1:
+            _, self.impactor = oper.read_timesteps_single(fields=[])
+        else:
+            _, self.impactor = oper.read_timesteps_multi(workers=workers, fields=[])
+        if self.impactor.num_frames >= 2:
+            with self.stats.stage("differentiate"):
+                self.impactor.differentiate(time=self.impactor.timesteps * self.dt, **self.__kinematics)
+        return self.impactor
+
+    def get_impactor_series(self) -> dict[str, np.ndarray]:
+        """
+        Method to get the time series of the impactor, loaded by `render_bed_single`,
+        `render_bed_multi` or `load_impactor`
+            - Returns : one value per frame by name:
+                - `'timestep'`, `'time'` : the timestep value and the simulation time
+                - every field of the impactor, e.g. `'x'`, `'y'`, `'v_y'`, `'a_y'`
+                - `'surface_height'` : the level of the free surface of the bed, see
+                  `impactor.surface_level`. It is NaN after a load of only some particles
+                  (`ids`), from the cache or not, as the rest of the bed is not parsed then,
+                  and `load_impactor` gets it.
+                - `'penetration_depth'` : how deep the bottom of the impactor is below the
+                  surface, negative above it
+        """
+        traj = self.impactor
+        series = {"timestep": traj.timesteps, "time": traj.timesteps * self.dt}
+        series.update({field: traj.get_field(field)[:, 0] for field in traj.fields})
+        if "y" in series and "radius" in series:
+            series["penetration_depth"] = penetration_depth(series["y"], series["radius"],
+                                                            series["surface_height"])
+        return series
+
+    def update(self, callback=None) -> list[Frame]:
         """
-        Method to differentiate the x and y datas to get velocity and acceleration
+        Method to pick up the frames appended to the dump file since it was last read, e.g.
+        while the simulation is still running. Only the new complete frames are parsed, and
+        if the trajectory was rendered they are added to it, with the velocities and
+        accelerations of the last frames updated to match `differentiate`. The impactor
+        trajectory is extended the same way if it was loaded.
+            - `callback` : called as `callback(frame)` for every new frame
+            - Returns : the new frames, holding the fields of the rendered trajectory
+              (or every field if it was not rendered)
         """
-        num_timesteps = self.num_timesteps
-        for time_data, value in self.render_bed.items():
-            x = [i for i in value if i in ["xs", "x"]][0]
-            y = [i for i in value if i in ["ys", "y"]][0]
-            x_arr = value[x]
-            y_arr = value[y]
+        new = self.__bed_oper.update()
+        if len(new) == 0:
+            return []
+        self.timesteps = self.__bed_oper.get_timesteps()
+        self.num_timesteps = len(self.timesteps)
+        self.__extend_impactor(new)
 
-            if x == 'x':
-                v_x = np.gradient(x_arr, num_timesteps)
-                self.render_bed[time_data]['v_x'] = v_x
-                self.render_bed[time_data]['a_x'] = np.gradient(v_x, num_timesteps)
-            elif x == "xs":
-                vs_x = np.gradient(x_arr, num_timesteps)
-                self.render_bed[time_data]['vs_x'] = vs_x
-                self.render_bed[time_data]['as_x'] = np.gradient(vs_x, num_timesteps)
+        traj = self.render_bed
+        if traj is None:
+            frames = list(self.__bed_oper.iter_frames(new))
+        else:
+            # the same particles and parsed fields as the rendered trajectory
+            _, available = self.__bed_oper.get_selection()
+            fields = [field for field in traj.fields if field in available]
+            ids = None if np.array_equal(traj.ids, self.__bed_oper.get_bed_ids()) else traj.ids
+            parsed = list(self.__bed_oper.iter_frames(new, fields=fields, ids=ids))
 
-            if y == 'y':
-                v_y = np.gradient(y_arr, num_timesteps)
-                self.render_bed[time_data]['v_y'] = v_y
-                self.render_bed[time_data]['a_y'] = np.gradient(v_y, num_timesteps)
-            elif y == "ys":
-                vs_y = np.gradient(y_arr, num_timesteps)
-                self.render_bed[time_data]['vs_y'] = vs_y
-                self.render_bed[time_data]['as_y'] = np.gradient(vs_y, num_timesteps)
+            start = traj.num_frames
+            traj.extend([frame.timestep for frame in parsed],
+                        {field: np.stack([frame.columns[field] for frame in parsed]) for field in fields})
+            if traj.num_frames >= 2:
+                with self.stats.stage("differentiate"):
+                    traj.differentiate_tail(start, time=traj.timesteps * self.dt, **self.__kinematics)
+            frames = [
+                Frame(frame.idx, frame.timestep, traj.ids, traj.get_frame(start + i))
+                for i, frame in enumerate(parsed)
+            ]
+
+        if callback is not None:
+            for frame in frames:
+                callback(frame)
+        return frames
+
+    def __extend_impactor(self, frames) -> None:
+        """
+        Method to add the new frames to the impactor trajectory, if it was loaded
+        """
+        impactor = self.impactor
+        if impactor is None:
+            return
+        new = self.__bed_oper.read_impactor(frames)
+        start = impactor.num_frames
+        impactor.extend(new.timesteps, {field: new.get_field(field) for field in new.fields})
+        if impactor.num_frames >= 2:
+            with self.stats.stage("differentiate"):
+                impactor.differentiate_tail(start, time=impactor.timesteps * self.dt, **self.__kinematics)
+
+    def follow(self, interval: float = 1.0, timeout: float = None):  # -> Generator[Frame]:
+        """
+        Generator following a dump file that is still being written, yielding every frame
+        appended to it as soon as it is complete (see `update`)
+            - Arguments:
+                - `interval` : the seconds to wait between two checks of the file
+                - `timeout` : stop once no frame was added for this many seconds,
+                  never by default
+        """
+        last = perf_counter()
+        while True:
+            frames = self.update()
+            if len(frames):
+                last = perf_counter()
+                yield from frames
+                continue
+            if timeout is not None and perf_counter() - last >= timeout:
+                return
+            sleep(interval)
+
+    def get_surface_masks(self, width: float = None, depth: int = 1, edges=None) -> np.ndarray:
+        """
+        Method to find the surface particles of every frame of the rendered trajectory
+            - Returns : a <frames> x <particles> boolean array, see `surface.surface_mask`
+        """
+        traj = self.render_bed
+        return surface_mask(traj.get_field('x'), traj.get_field('y'), traj.get_field('radius'),
+                            width=width, depth=depth, edges=edges)
+
+    def coarse_grain(self, start: int = 0, stop: int = None, step: int = 1, cell_size: float = None,
+                     edges=None, method: str = "bins", width: float = None,
+                     average: bool = False) -> dict[str, np.ndarray]:
+        """
+        Method to get the number density, area fraction, mean velocity and granular
+        temperature grids of a range of frames of the rendered trajectory
+            - Returns : the grids of every frame, or of all of them pooled with `average`,
+              see `coarse.coarse_grain` for the arguments
+        """
+        traj = self.render_bed
+        frames = slice(start, stop, step)
+        velocity = {
+            field: traj.get_field(field)[frames]
+            for field in ('v_x', 'v_y') if field in traj.columns
+        }
+        return coarse_grain(traj.get_field('x')[frames], traj.get_field('y')[frames],
+                            traj.get_field('radius')[frames], cell_size=cell_size, edges=edges,
+                            method=method, width=width, average=average, **velocity)
+
+    def get_surface_heights(self, width: float = None, edges=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Method to get the free surface height profile h(x) of every frame of the rendered trajectory
+            - Returns : the <frames> x <columns> heights and the column centres,
+              see `surface.surface_height`
+        """
+        traj = self.render_bed
+        return surface_height(traj.get_field('x'), traj.get_field('y'), traj.get_field('radius'),
+                              width=width, edges=edges)
+
+
+class _FrameIndex:
+    """
+    Index of the frames in a LAMMPS dump file, built in a single pass over the file
+
+    Every attribute is an array with one entry per frame:
+        - `offsets` : byte offset of the `ITEM: TIMESTEP` line
+        - `data_offsets` : byte offset of the first atom row
+        - `end_offsets` : byte offset right after the last atom row
+        - `lines` : line number of the timestep value
+        - `timesteps` : the timestep value
+        - `num_atoms` : the number of atom rows
+        - `box_bounds` : the lo/hi box bounds, with shape <frames> x 3 x 2
+        - `headers` : the column names of the `ITEM: ATOMS` line
+
+    The frames are also kept sorted by timestep value, in `timestep_order`, for the
+    lookups by timestep. Dumps of restarted runs can hold the same timestep twice.
+
+    The offsets are offsets in the uncompressed text of the dump, and for compressed dumps
+    `blocks` holds the (compressed, uncompressed) offsets the file can be decompressed
+    from, see `io_tools.DumpSource`.
+    """
+
+    def __init__(self) -> None:
+        self.offsets = np.empty(0, dtype=np.int64)
+        self.data_offsets = np.empty(0, dtype=np.int64)
+        self.end_offsets = np.empty(0, dtype=np.int64)
+        self.lines = np.empty(0, dtype=np.int64)
+        self.timesteps = np.empty(0, dtype=np.int64)
+        self.num_atoms = np.empty(0, dtype=np.int64)
+        self.box_bounds = np.empty((0, 3, 2), dtype=np.float64)
+        self.headers: list[tuple[str, ...]] = []
+        self.blocks = np.zeros((1, 2), dtype=np.int64)
+        self.timestep_order = np.empty(0, dtype=np.int64)
+
+        # where the next scan has to pick up from
+        self.scan_offset = 0
+        self.scan_line = 0
+
+        # line numbers of the box bounds and the atom rows in the first frame
+        self.dim_line = -1
+        self.data_line = -1
+
+    def __len__(self) -> int:
+        return len(self.timesteps)
+
+    ARRAYS = ("offsets", "data_offsets", "end_offsets", "lines", "timesteps", "num_atoms", "box_bounds", "blocks")
+
+    def get_state(self) -> tuple[dict, dict]:
+        """
+        Method to get the index as a dictionary of arrays and a JSON serializable dictionary
+        """
+        headers = sorted(set(self.headers))
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        arrays["header_ids"] = np.array([headers.index(h) for h in self.headers], dtype=np.int64)
+        info = {
+            "headers": [list(h) for h in headers],
+            "scan_offset": int(self.scan_offset),
+            "scan_line": int(self.scan_line),
+            "dim_line": int(self.dim_line),
+            "data_line": int(self.data_line),
+        }
+        return arrays, info
+
+    @classmethod
+    def from_state(cls, arrays: dict, info: dict):  # -> _FrameIndex:
+        """
+        Method to rebuild an index from the output of `get_state`
+        """
+        index = cls()
+        for name in cls.ARRAYS:
+            setattr(index, name, np.asarray(arrays[name]))
+        headers = [tuple(h) for h in info["headers"]]
+        index.headers = [headers[i] for i in arrays["header_ids"]]
+        index.scan_offset = info["scan_offset"]
+        index.scan_line = info["scan_line"]
+        index.dim_line = info["dim_line"]
+        index.data_line = info["data_line"]
+        index.sort_timesteps()
+        return index
+
+    def sort_timesteps(self) -> None:
+        """
+        Method to update `timestep_order`, the frames sorted by timestep value (stable)
+        """
+        if np.all(np.diff(self.timesteps) >= 0):
+            self.timestep_order = np.arange(len(self.timesteps))
+        else:
+            self.timestep_order = np.argsort(self.timesteps, kind="stable")
+
+    def find_timestep(self, timestep: int) -> int:
+        """
+        Method to get the index of the frame holding a timestep value, the first one if
+        there are several
+        """
+        sorted_timesteps = self.timesteps[self.timestep_order]
+        pos = np.searchsorted(sorted_timesteps, timestep, side="left")
+        if pos == len(sorted_timesteps) or sorted_timesteps[pos] != timestep:
+            raise KeyError(f"Timestep {timestep} was not found.")
+        return int(self.timestep_order[pos])
+
+    def frames_between(self, start=None, stop=None) -> np.ndarray:
+        """
+        Method to get the indices of the frames with `start` <= timestep <= `stop`, in frame order
+        """
+        sorted_timesteps = self.timesteps[self.timestep_order]
+        lo = 0 if start is None else np.searchsorted(sorted_timesteps, start, side="left")
+        hi = len(sorted_timesteps) if stop is None else np.searchsorted(sorted_timesteps, stop, side="right")
+        return np.sort(self.timestep_order[lo:hi])
+
+    def nearest(self, timestep) -> int:
+        """
+        Method to get the index of the frame with the timestep value closest to the one
+        passed in, the earlier one on a tie
+        """
+        if len(self.timesteps) == 0:
+            raise IndexError("The index holds no frames.")
+        sorted_timesteps = self.timesteps[self.timestep_order]
+        pos = int(np.searchsorted(sorted_timesteps, timestep, side="left"))
+        if pos == len(sorted_timesteps) or (
+                pos > 0 and timestep - sorted_timesteps[pos - 1] <= sorted_timesteps[pos] - timestep):
+            # the first of the frames holding that value, as in `find_timestep`
+            pos = int(np.searchsorted(sorted_timesteps, sorted_timesteps[pos - 1], side="left"))
+        return int(self.timestep_order[pos])
+
+    def extend(self, frames: list[dict]) -> None:
+        """
+        Method to add the frames found by a scan at the end of the index
+        """
+        if len(frames) == 0:
+            return
+
+        def __column(key, dtype):
+            return np.array([frame[key] for frame in frames], dtype=dtype)
+
+        self.offsets = np.concatenate([self.offsets, __column("offset", np.int64)])
+        self.data_offsets = np.concatenate([self.data_offsets, __column("data_offset", np.int64)])
+        self.end_offsets = np.concatenate([self.end_offsets, __column("end_offset", np.int64)])
+        self.lines = np.concatenate([self.lines, __column("line", np.int64)])
+        self.timesteps = np.concatenate([self.timesteps, __column("value", np.int64)])
+        self.num_atoms = np.concatenate([self.num_atoms, __column("num_atoms", np.int64)])
+        self.box_bounds = np.concatenate([self.box_bounds, __column("box_bounds", np.float64)])
+        self.headers.extend(frame["header"] for frame in frames)
+        self.sort_timesteps()
+
+
+class _ByteScanner:
+    """
+    Sequential line reader over a binary stream that keeps track of the byte offset and
+    line number, and skips blocks of lines without splitting them
+    """
+
+    def __init__(self, handle, offset: int = 0, line: int = 0, block_size: int = 1 << 20) -> None:
+        self.__handle = handle
+        self.__block_size = block_size
+        self.__buffer = b""
+        self.__pos = 0
+
+        self.offset = offset
+        self.line = line
+
+    def __fill(self) -> bool:
+        chunk = self.__handle.read(self.__block_size)
+        if not chunk:
+            return False
+        self.__buffer = self.__buffer[self.__pos:] + chunk
+        self.__pos = 0
+        return True
+
+    def readline(self) -> bytes:
+        """
+        Method to read the next line, including the newline character.
+        At the end of the stream the returned line is incomplete (or empty).
+        """
+        while True:
+            end = self.__buffer.find(b"\n", self.__pos)
+            if end >= 0:
+                end += 1
+                break
+            if not self.__fill():
+                end = len(self.__buffer)
+                break
+
+        line = self.__buffer[self.__pos:end]
+        self.__pos = end
+        self.offset += len(line)
+        if line.endswith(b"\n"):
+            self.line += 1
+        return line
+
+    def skip_lines(self, count: int) -> bool:
+        """
+        Method to move past the next `count` complete lines.
+        Returns False if the stream ends before that.
+        """
+        remaining = count
+        while remaining > 0:
+            found = self.__buffer.count(b"\n", self.__pos)
+            if found >= remaining:
+                view = np.frombuffer(self.__buffer, dtype=np.uint8)[self.__pos:]
+                end = self.__pos + int(np.flatnonzero(view == 10)[remaining - 1]) + 1
+                self.offset += end - self.__pos
+                self.line += remaining
+                self.__pos = end
+                return True
+
+            self.offset += len(self.__buffer) - self.__pos
+            self.line += found
+            self.__pos = len(self.__buffer)
+            remaining -= found
+            if not self.__fill():
+                return False
+
+        return True
 
 
 class _SimFileOperators:
     """
     Defining the operators for the bed
+
+    The dump file is scanned once to build a `_FrameIndex`, after which every frame is
+    read straight from its byte range instead of rescanning the file. Compressed dumps are
+    read through the same offsets, see `io_tools.open_source`. The work done is counted in
+    `self.stats`, a `LoadStats`.
     """
 
-    def __init__(self, filepath: str) -> None:
+    def __init__(self, filepath: str, cache: SidecarCache = None, stats: LoadStats = None,
+                 index: _FrameIndex = None, unwrap: bool = False, impactor=None) -> None:
+        """
+            - `index` : a frame index of the file built before, e.g. by another process
+            - `unwrap` : add the image flags to the positions, see `coord_tools.coordinate_plan`
+            - `impactor` : how the impactor is told apart from the bed in the first frame,
+              see `impactor.find_impactor`
+        """
         self.filepath: str = filepath
+        self.unwrap = unwrap
+        self.impactor = impactor
+        self.__disc_id = None
+        self.__bed_ids = None
+        self.__first_values = None
+        self.cache = cache
+        self.stats = stats if stats is not None else LoadStats()
+
+        state = None
+        if index is None and cache is not None:
+            with self.stats.stage("cache_load"):
+                state = cache.load_index()
+            self.stats.record_cache(state is not None)
+        if state is not None:
+            index = _FrameIndex.from_state(*state)
+        if index is not None:
+            self.index = index
+            self.source = open_source(filepath, blocks=self.index.blocks)
+        else:
+            self.index = _FrameIndex()
+            self.source = open_source(filepath)
+            self.scan()
+            if cache is not None:
+                try:
+                    with self.stats.stage("cache_save"):
+                        cache.save_index(*self.index.get_state())
+                except OSError as err:
+                    logger.warning("Could not write the cache in %s: %s", cache.directory, err)
+                    self.cache = None
 
-        with open(filepath, 'r') as input_file:
-            lines = input_file.readlines()
-        self.__lines = lines
+    def update(self) -> list[int]:
+        """
+        Method to index the frames appended to the dump file since the last scan, keeping
+        the index in the sidecar cache up to date.
+        Returns the indices of the frames that were added.
+        """
+        if self.cache is None:
+            return self.scan()
+
+        key = self.cache.file_key()
+        self.cache.refresh_key()
+        new = self.scan()
+        if self.cache.file_key() != key:
+            try:
+                with self.stats.stage("cache_save"):
+                    self.cache.save_index(*self.index.get_state())
+            except OSError as err:
+                logger.warning("Could not write the cache in %s: %s", self.cache.directory, err)
+                self.cache = None
+        return new
+
+    def scan(self) -> list[int]:
+        """
+        Method to index the complete frames after the last indexed byte offset.
+        Returns the indices of the frames that were added.
+        """
+        index = self.index
+        frames = []
+        start_offset = index.scan_offset
+        with self.stats.stage("scan"), self.source.stream(index.scan_offset) as input_file:
+            scanner = _ByteScanner(input_file, offset=index.scan_offset, line=index.scan_line)
+
+            while True:
+                frame = self.__scan_frame(scanner, first=(len(index) + len(frames) == 0))
+                if frame is None:
+                    break
+                frames.append(frame)
+                index.scan_offset = scanner.offset
+                index.scan_line = scanner.line
+            self.stats.bytes_read += scanner.offset - start_offset
+
+        start = len(index)
+        index.extend(frames)
+        index.blocks = self.source.blocks
+        self.stats.frames_indexed += len(frames)
+        logger.debug("Indexed %d frames of %s", len(frames), self.filepath)
+        return list(range(start, len(index)))
+
+    def __scan_frame(self, scanner: _ByteScanner, first: bool = False):  # -> dict | None:
+        """
+        Method to read the headers of a single frame and skip over its atom rows.
+        Returns None if there is no complete frame left in the file.
+        """
+        frame: dict = {"offset": scanner.offset, "box_bounds": np.full((3, 2), np.nan)}
+
+        def __next_line():
+            next_line = scanner.readline()
+            if not next_line.endswith(b"\n"):
+                raise EOFError
+            return next_line
+
+        try:
+            while True:
+                line = __next_line()
+                if not line.strip():
+                    frame["offset"] = scanner.offset
+                    continue
+                if not line.startswith(b"ITEM:"):
+                    raise ValueError(f"Unexpected line {scanner.line} in {self.filepath}: {line[:80]!r}")
+
+                if line.startswith(b"ITEM: TIMESTEP"):
+                    frame["line"] = scanner.line
+                    frame["value"] = int(__next_line().split()[0])
+                elif line.startswith(b"ITEM: NUMBER OF ATOMS"):
+                    frame["num_atoms"] = int(__next_line().split()[0])
+                elif line.startswith(b"ITEM: BOX BOUNDS"):
+                    if first:
+                        self.index.dim_line = scanner.line
+                    for dim in range(3):
+                        frame["box_bounds"][dim] = [float(b) for b in __next_line().split()[:2]]
+                elif line.startswith(b"ITEM: ATOMS"):
+                    if first:
+                        self.index.data_line = scanner.line
+                    frame["header"] = tuple(line.decode().split()[2:])
+                    frame["data_offset"] = scanner.offset
+                    if not scanner.skip_lines(frame["num_atoms"]):
+                        raise EOFError
+                    frame["end_offset"] = scanner.offset
+                    return frame
+                else:
+                    # any other section (ITEM: TIME, ITEM: UNITS) holds a single value
+                    __next_line()
+        except EOFError:
+            return None
+
+    def read_frame_bytes(self, idx: int) -> bytes:
+        """
+        Method to get the raw atom rows of the frame at the index passed in
+        """
+        raw = self.source.read(self.index.data_offsets[idx], self.index.end_offsets[idx])
+        self.stats.bytes_read += len(raw)
+        return raw
+
+    def iter_frame_bytes(self, frames):  # -> Generator[bytes]:
+        """
+        Generator over the raw atom rows of the frames at the indices passed in, read in a
+        single pass over the file (so a compressed dump is only decompressed once) as long
+        as the frames are in order
+        """
+        for raw in self.source.iter_ranges(self.index.data_offsets[frames], self.index.end_offsets[frames]):
+            self.stats.bytes_read += len(raw)
+            yield raw
+
+    def get_selection(self, ids=None, fields=None, absolute_coords=True) -> tuple[np.ndarray, list[str]]:
+        """
+        Method to check the particle IDs and fields asked for in a partial load
+            - Returns : the sorted IDs and the fields, every particle but the disc and
+              every field by default
+        """
+        bed_ids = self.get_bed_ids()
+        ids = bed_ids if ids is None else np.intersect1d(np.fromiter(ids, dtype=np.int64), bed_ids)
+        available = self.get_output_fields(0, absolute_coords)
+        if fields is None:
+            return ids, available
+        for field in fields:
+            if field not in available:
+                raise KeyError(f"Input parameter \"{field}\" was not found.")
+        return ids, list(fields)
+
+    def iter_frames(self, frames, fields=None, ids=None, absolute_coords=True):  # -> Generator[Frame]:
+        """
+        Generator over the frames at the indices passed in, parsed one at a time.
+        When `ids` is passed in, only the rows of those particles are parsed.
+        """
+        selector = _RowSelector(ids) if ids is not None else None
+        ids, fields = self.get_selection(ids, fields, absolute_coords)
+
+        frames = np.asarray(frames, dtype=np.int64)
+        for idx, raw in zip(frames, self.iter_frame_bytes(frames)):
+            columns = {field: np.full((1, len(ids)), np.nan) for field in fields}
+            _scatter_rows(self.read_frame_array(idx, selector, raw=raw), self.index.headers[idx], ids, columns, 0,
+                          self.index.box_bounds[idx], absolute_coords, self.unwrap)
+            yield Frame(int(idx), int(self.index.timesteps[idx]), ids,
+                        {field: values[0] for field, values in columns.items()})
+
+    def read_frame(self, idx: int, fields=None, ids=None, absolute_coords=True) -> Frame:
+        """
+        Method to parse a single frame, keeping only the particles of `ids` found in the bed
+        """
+        return next(self.iter_frames([idx], fields=fields, ids=ids, absolute_coords=absolute_coords))
 
     def get_num_particles(self) -> int:
-        for i, line in enumerate(self.__lines):
-            if "ITEM: NUMBER OF ATOMS" in line:
-                return int(self.__lines[i + 1].split()[0])
-        return -1
+        if len(self.index) == 0:
+            return -1
+        return int(self.index.num_atoms[0])
 
     def get_dim_idx(self) -> int:
-        for i, line in enumerate(self.__lines):
-            if "ITEM: BOX BOUNDS" in line:
-                return i + 1  # 5
-        return -1
+        return self.index.dim_line
 
     def get_data_idx(self) -> int:
-        for i, line in enumerate(self.__lines):
-            if "ITEM: ATOMS" in line:
-                return i + 1  # 8
-        return -1
+        return self.index.data_line
 
     def get_available_fields(self) -> list[str]:
-        for line in self.__lines:
-            if "ITEM: ATOMS" in line:
-                return [param for param in line.split()
-                        if param not in "ITEM: ATOMS"
-                        ]
-        return []
+        if len(self.index) == 0:
+            return []
+        return list(self.index.headers[0])
 
-    def get_box_dims(self):  # -> Generator[float]:
-        dim_idx = self.get_dim_idx()
+    def get_box_dims(self, idx: int = 0):  # -> Generator[float]:
+        """
+        Generator over the width and height of the box of a frame
+        """
         return (
-            float(line.split().pop(1))
-            for line in self.__lines[dim_idx:dim_idx + 2]
+            float(hi - lo)
+            for lo, hi in self.get_box_bounds(idx)[:2]
         )
 
+    def get_box_bounds(self, idx: int = 0) -> np.ndarray:
+        """
+        Method to get the 3 x 2 (lo, hi) bounds of the box of a frame
+        """
+        return self.index.box_bounds[idx]
+
     def get_timesteps(self) -> dict[int, dict[str, int]]:
-        out = {}
-        i = 0
-        for idx, line in enumerate(self.__lines):
-            if "ITEM: TIMESTEP" in line:
-                # TODO actual timestep value being used to query
-                out[i] = {
-                    "line": idx + 1,
-                    "value": int(self.__lines[idx + 1].split()[0])
-                }
-                i += 1
-        return out
+        return {
+            i: {
+                "line": int(line),
+                "value": int(value)
+            }
+            for i, (line, value) in enumerate(zip(self.index.lines, self.index.timesteps))
+        }
 
     def get_bed_snap(self,
                      timestep=None, idx=None,
@@ -167,157 +1040,651 @@ class _SimFileOperators:
                      array_form=False) -> dict:
         """
         Method to get the state of the bed at the specified timestep.
+        The frame is looked up by its timestep value when `idx` is not passed in.
         """
 
         if include_only is None:
             include_only = []
-        timesteps = self.get_timesteps()
-        fields = self.get_available_fields()
 
         # setting default timestep values
         if idx is None:
-            idx = 0
+            idx = 0 if timestep is None else self.index.find_timestep(timestep)
         if timestep is None:
-            timestep = timesteps[0]["value"]
+            timestep = int(self.index.timesteps[idx])
 
         # checking if the timestep is correct
-        if timestep != int(self.__lines[timesteps[idx]['line']]):
+        if timestep != self.index.timesteps[idx]:
             raise IndexError(
                 f"The TIMESTEP at index {idx}, "
-                f"line {timesteps[idx]['line']} "
+                f"line {self.index.lines[idx]} "
                 f"does not match the TIMESTEP passed in the argument: "
-                f" {timesteps[idx]['value']}")
+                f" {timestep}")
+
+        header = list(self.index.headers[idx])
+        values = self.read_frame_array(idx)
+        p_IDs = values[:, header.index("id")].astype(np.int64)
+
+        # the coordinates of every particle are transformed at once
+        keep = p_IDs != self.disc_id
+        if len(include_only) != 0:
+            keep &= np.isin(p_IDs, np.fromiter(include_only, dtype=np.int64))
+        columns = {
+            field: column.tolist()
+            for field, column in transform(values[keep], header, self.index.box_bounds[idx],
+                                           absolute_coords, self.unwrap).items()
+        }
 
-        data_idx = timesteps[idx]['line'] + self.get_data_idx()
         out: dict = {}
-        self.disc_id = 0
-        try:
-            while "ITEM: TIMESTEP" not in self.__lines[data_idx]:
-                data_line = self.__lines[data_idx].split()
-                p_ID = int(data_line[0])
-                if p_ID > self.disc_id:
-                    self.disc_id = p_ID
-                valid_particle = False
-
-                if len(include_only) == 0:
-                    valid_particle = True
-                else:
-                    if p_ID in include_only:
-                        valid_particle = True
-                    else:
-                        data_idx += 1
-                        continue
-
-                # putting the values in a dictionary by parameter type
-                if valid_particle:
-                    data_values = {
-                        p: float(data_line[fields.index(p)])
-                        for p in fields if p != "id"
-                    }
-                    # converting to absolute coordinates
-                    # throws KeyError if target key is not found
-                    if absolute_coords:
-                        # TODO for 3D simulations, scale it for the z-axis as well
-                        box_w, box_h = self.get_box_dims()
-                        try:
-                            data_values["x"] = box_w * data_values["xs"]
-                            if not data_values.pop("xs", True):
-                                raise KeyError
-                        except KeyError:
-                            print(f"WARNING: key \'x\' was not found as a "
-                                  f"parameter for particle {p_ID}!")
-                        try:
-                            data_values["y"] = box_h * data_values["ys"]
-                            if not data_values.pop("ys", True):
-                                raise KeyError
-                        except KeyError:
-                            print(f"WARNING: key \'y\' was not found as a "
-                                  f"parameter for particle {p_ID}!")
-                    if array_form:
-                        data_values = {
-                            p: [v]
-                            for p, v in data_values.items()
-                        }
-
-                    out[p_ID] = data_values
-                data_idx += 1
-        except IndexError:
-            pass
-        # removing the disc
-        if not out.pop(self.disc_id, True):
-            raise KeyError
+        for row, p_ID in enumerate(p_IDs[keep].tolist()):
+            out[p_ID] = {
+                field: [column[row]] if array_form else column[row]
+                for field, column in columns.items()
+            }
+
+        if absolute_coords:
+            for key in ("x", "y"):
+                if key not in columns:
+                    logger.warning("Key '%s' was not found as a parameter in frame %d.", key, idx)
 
         return out
 
-    def read_timesteps_multi(self):  # -> dict:
-        out_multi = self.get_bed_snap(array_form=True)
+    def read_frame_array(self, idx: int, selector=None, raw: bytes = None) -> np.ndarray:
+        """
+        Method to parse the atom rows of a frame into a <rows> x <fields> array
+            - `selector` : a `_RowSelector` to parse only the rows of some particles
+            - `raw` : the atom rows, if they were already read
+
+        The whole first frame is only parsed once, as the impactor, the bed IDs and the
+        initial state all come from it. Its array is read-only.
+        """
+        first = idx == 0 and selector is None
+        if first and self.__first_values is not None:
+            return self.__first_values
+        if raw is None:
+            raw = self.read_frame_bytes(idx)
+        self.stats.frames_parsed += 1
+        values = _parse_frame(raw, int(self.index.num_atoms[idx]), self.index.headers[idx], selector,
+                              f"Frame {idx} of {self.filepath}")
+        if first:
+            values.flags.writeable = False
+            self.__first_values = values
+        return values
+
+    @property
+    def disc_id(self) -> int:
+        """
+        The ID of the impactor, found once in the first frame
+        """
+        if self.__disc_id is None:
+            header = self.index.headers[0]
+            values = self.read_frame_array(0)
+            self.__disc_id = find_impactor(values[:, header.index("id")].astype(np.int64),
+                                           transform(values, header, self.index.box_bounds[0]), self.impactor)
+        return self.__disc_id
+
+    def get_frame_ids(self, idx: int = 0) -> np.ndarray:
+        """
+        Method to get the sorted particle IDs of a frame, without the disc
+        """
+        ids = np.sort(self.read_frame_array(idx)[:, self.index.headers[idx].index("id")].astype(np.int64))
+        return ids[ids != self.disc_id]
+
+    def get_bed_ids(self) -> np.ndarray:
+        """
+        Method to get the sorted particle IDs of the bed, i.e. of the first frame without the disc
+        """
+        if self.__bed_ids is None:
+            self.__bed_ids = self.get_frame_ids(0)
+        return self.__bed_ids
+
+    def get_output_fields(self, idx: int = 0, absolute_coords=True) -> list[str]:
+        """
+        Method to get the fields of a frame as they are stored in a `Trajectory`
+        """
+        return output_fields(self.index.headers[idx], absolute_coords, self.unwrap)
+
+    def new_trajectory(self, frames, absolute_coords=True, ids=None, fields=None) -> Trajectory:
+        """
+        Method to allocate an empty `Trajectory` for the frames passed in.
+        The particles and fields are the ones of the first indexed frame, or the ones passed in.
+        """
+        ids, fields = self.get_selection(ids, fields, absolute_coords)
+        columns = {
+            field: np.full((len(frames), len(ids)), np.nan)
+            for field in fields
+        }
+        return Trajectory(ids, self.index.timesteps[frames], columns)
+
+    def new_impactor(self, frames, absolute_coords=True) -> Trajectory:
+        """
+        Method to allocate an empty single particle `Trajectory` for the impactor, holding
+        every field plus the `surface_height` of the bed in every frame
+        """
+        fields = self.get_output_fields(0, absolute_coords) + ["surface_height"]
+        columns = {
+            field: np.full((len(frames), 1), np.nan)
+            for field in fields
+        }
+        return Trajectory([self.disc_id], self.index.timesteps[frames], columns)
+
+    def get_selector(self, ids=None):  # -> _RowSelector | None:
+        """
+        Method to get the `_RowSelector` of a partial load of the particles passed in,
+        which also picks the row of the impactor
+        """
+        if ids is None:
+            return None
+        return _RowSelector(np.append(np.fromiter(ids, dtype=np.int64), self.disc_id))
+
+    def fill_frame(self, traj: Trajectory, row: int, idx: int, absolute_coords=True,
+                   selector=None, raw: bytes = None, impactor: Trajectory = None) -> list[str]:
+        """
+        Method to parse the frame at index `idx` into row `row` of the trajectory
+            - `selector` : a `_RowSelector` to parse only the rows of the trajectory particles
+            - `raw` : the atom rows of the frame, if they were already read
+            - `impactor` : a trajectory from `new_impactor` to fill from the same rows, without
+              the `surface_height` when only the `selector` rows are parsed
+            - Returns : messages for the data that could not be added, only built when the
+              debug level of the module logger is enabled (the counts go to `self.stats`)
+        """
+        if raw is None:
+            raw = self.read_frame_bytes(idx)
+        return _fill_frame(raw, self.get_frame_info(idx), traj.ids, traj.columns, row,
+                           self.get_load_settings(absolute_coords), self.stats, selector=selector,
+                           impactor=impactor.columns if impactor is not None else None)
+
+    def get_frame_info(self, idx: int) -> dict:
+        """
+        Method to get what `_fill_frame` needs to know of the frame at index `idx`
+        """
+        return {
+            "idx": int(idx),
+            "num_atoms": int(self.index.num_atoms[idx]),
+            "header": self.index.headers[idx],
+            "timestep": int(self.index.timesteps[idx]),
+            "bounds": self.index.box_bounds[idx],
+        }
+
+    def get_load_settings(self, absolute_coords=True) -> dict:
+        """
+        Method to get the settings of a load shared by every frame, see `_fill_frame`
+        """
+        return {
+            "filepath": self.filepath,
+            "all_fields": self.get_output_fields(0, absolute_coords),
+            "absolute_coords": absolute_coords,
+            "unwrap": self.unwrap,
+            "disc_id": self.disc_id,
+            "debug": logger.isEnabledFor(logging.DEBUG),
+        }
+
+    def read_timesteps_multi(self, workers: int = None, absolute_coords=True,
+                             ids=None, fields=None) -> tuple[Trajectory, Trajectory]:
+        """
+        Method to parse every frame with a pool of processes
+            - Arguments:
+                - `workers` : the number of processes, all the available cores by default
+                - `ids`, `fields` : only load these particles and fields, all of them by default
+            - Returns : the trajectory of the bed and the one of the impactor, see `new_impactor`
+
+        The frames are split into contiguous byte ranges and every process writes the rows
+        of its frames by frame index into a block memory-mapped by every process, so the
+        result does not depend on the order in which the processes finish. The returned
+        trajectories are views of that block, which is never copied. Compressed dumps are
+        split at their block boundaries, and are parsed in this process if they are a single block.
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        frames = np.arange(len(self.index))
+        chunks = self.__split_frames(frames, workers * 4)
+        if self.source.compressed and len(chunks) < 2:
+            logger.info("%s can only be decompressed from the start, parsing it in a single process.",
+                        self.filepath)
+            return self.read_timesteps_single(ids=ids, fields=fields)
+        select_ids = ids
+        ids, fields = self.get_selection(ids, fields, absolute_coords)
+        impactor = self.new_impactor(frames, absolute_coords)
+        shape = (len(fields), len(frames), len(ids))
+        impactor_shape = (len(impactor.fields), len(frames), 1)
         keys_not_added_multi = []
+        dropped = LoadStats()
+
+        # the impactor arrays come right after the ones of the bed
+        size = max(int(np.prod(shape)) + int(np.prod(impactor_shape)), 1)
+        path = _new_block_file(size)
+        try:
+            block = np.memmap(path, dtype=np.float64, mode="r+", shape=(size,))
+            block[:] = np.nan
+
+            settings = self.get_load_settings(absolute_coords)
+            jobs = [
+                {
+                    "blocks": self.source.blocks,
+                    "block_path": path,
+                    "block_size": size,
+                    "shape": shape,
+                    "fields": fields,
+                    "impactor_shape": impactor_shape,
+                    "impactor_fields": impactor.fields,
+                    "ids": ids,
+                    "select_ids": np.append(ids, self.disc_id) if select_ids is not None else None,
+                    "settings": settings,
+                    "data_offsets": self.index.data_offsets[chunk],
+                    "end_offsets": self.index.end_offsets[chunk],
+                    "frames": [self.get_frame_info(t) for t in chunk],
+                }
+                for chunk in chunks
+            ]
+
+            with self.stats.stage("parse"), ProcessPoolExecutor(max_workers=workers) as executor:
+                for job_stats, msgs in executor.map(_parse_chunk, jobs):
+                    dropped.merge(job_stats)
+                    keys_not_added_multi.extend(msgs)
+
+            if os.name == "nt":
+                # a mapped file can't be removed on Windows, so the block is read out of it
+                block = np.array(block)
+            data, impactor_data = _split_block(block, shape, impactor_shape)
+        finally:
+            # the mapping of `block` keeps its pages once the file is removed, for as long
+            # as the trajectories are views of it
+            os.remove(path)
 
-        timesteps = self.get_timesteps()
-        ts = [t for t in timesteps]
-        vs = [timesteps[t] for t in timesteps]
-
-        def __add_entry_t(t, v):
-            bed_snap = self.get_bed_snap(idx=t, timestep=v['value'], include_only=None)
-            for p_ID, p_data in bed_snap.items():
-                for f_name, f_value in p_data.items():
-                    try:
-                        out_multi[p_ID][f_name].append(f_value)
-                    except KeyError:
-                        keys_not_added_multi.append(f"{f_name:15s} for p{p_ID} at t{t}-->{v['value']} not added.")
-                        pass
-
-        workers = 4
-        print(f"Testing Multithreading ({workers} workers)")
-        start_multi = perf_counter()
-        with ThreadPoolExecutor(max_workers=workers) as executor:
-            executor.map(__add_entry_t, ts, vs)
-        print("End Test Multithreading")
-        end_multi = perf_counter()
-
-        for msg in list(set(keys_not_added_multi)):
-            print(msg)
-        print(f"\nMulti Time: {end_multi - start_multi}")
-
-        return out_multi
-
-    def read_timesteps_single(self):
-        out_single = self.get_bed_snap(array_form=True)
+        self.stats.merge(dropped)
+        for msg in sorted(set(keys_not_added_multi)):
+            logger.debug(msg)
+        _log_dropped(dropped.unmatched_rows, dropped.dropped_fields)
+        logger.debug("Parsed %d frames of %s with %d workers", len(frames), self.filepath, workers)
+
+        for i, field in enumerate(impactor.fields):
+            impactor.columns[field] = impactor_data[i]
+        return Trajectory(ids, self.index.timesteps[frames],
+                          {field: data[i] for i, field in enumerate(fields)}), impactor
+
+    def __split_frames(self, frames, num_chunks: int) -> list[np.ndarray]:
+        """
+        Method to split the frames into contiguous chunks. The chunks of a compressed dump
+        start at block boundaries, so no block is decompressed by two processes.
+        """
+        if not self.source.compressed:
+            return [chunk for chunk in np.array_split(frames, min(len(frames), num_chunks)) if len(chunk)]
+
+        block = np.searchsorted(self.source.blocks[:, 1], self.index.data_offsets[frames], side="right") - 1
+        starts = np.flatnonzero(np.diff(block)) + 1
+        if len(starts) == 0:
+            return [frames]
+        targets = np.linspace(0, len(frames), min(num_chunks, len(starts) + 1) + 1)[1:-1]
+        cuts = np.unique(starts[np.minimum(np.searchsorted(starts, targets), len(starts) - 1)])
+        return np.split(frames, cuts)
+
+    def read_timesteps_single(self, ids=None, fields=None) -> tuple[Trajectory, Trajectory]:
+        """
+        Method to parse every frame in this process
+            - Returns : the trajectory of the bed and the one of the impactor, see `new_impactor`
+        """
+        frames = np.arange(len(self.index))
+        traj = self.new_trajectory(frames, ids=ids, fields=fields)
+        impactor = self.new_impactor(frames)
+        selector = self.get_selector(traj.ids if ids is not None else None)
         keys_not_added_single = []
-        timesteps = self.get_timesteps()
-
-        print("Start Single")
-        start_single = perf_counter()
-        for t, v in timesteps.items():
-            out_single, keys_not_added_single = self.__add_entry_t(out=out_single,
-                                                                   t=t, v=v,
-                                                                   keys_not_added=keys_not_added_single)
-        print("End Test Single")
-        end_single = perf_counter()
-        for msg in list(set(keys_not_added_single)):
-            print(msg)
-        print(f"Single Time: {end_single - start_single}")
-
-        return out_single
-
-    def __add_entry_t(self, **kwargs) -> tuple:
-        """
-        Method to add a single entry to the rendered datafile
-        """
-        out = kwargs["out"]
-        keys_not_added = kwargs["keys_not_added"]
-        t = kwargs["t"]
-        v = kwargs["v"]
-
-        bed_snap = self.get_bed_snap(idx=t, timestep=v['value'], include_only=None)
-        for p_ID, p_data in bed_snap.items():
-            for f_name, f_value in p_data.items():
-                try:
-                    out[p_ID][f_name].append(f_value)
-                    # print(f"Added {f_name:15s} for p{p_ID} at t{t}-->{v['value']}")
-                except KeyError:
-                    keys_not_added.append(f"{f_name:15s} for p{p_ID} at t{t}-->{v['value']} not added.")
-                    pass
-        # print("")
-
-        return out, keys_not_added
+        unmatched, dropped = self.stats.unmatched_rows, self.stats.dropped_fields.copy()
+
+        with self.stats.stage("parse"):
+            for t, raw in zip(frames, self.iter_frame_bytes(frames)):
+                keys_not_added_single.extend(self.fill_frame(traj, t, t, selector=selector, raw=raw,
+                                                             impactor=impactor))
+
+        for msg in sorted(set(keys_not_added_single)):
+            logger.debug(msg)
+        _log_dropped(self.stats.unmatched_rows - unmatched, self.stats.dropped_fields - dropped)
+        logger.debug("Parsed %d frames of %s", len(frames), self.filepath)
+
+        return traj, impactor
+
+    def read_impactor(self, frames, absolute_coords=True) -> Trajectory:
+        """
+        Method to parse the frames passed in for the impactor only, keeping nothing of the
+        bed but its surface height
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        bed = self.new_trajectory(frames, absolute_coords=absolute_coords, fields=[])
+        impactor = self.new_impactor(frames, absolute_coords)
+        for row, (idx, raw) in enumerate(zip(frames, self.iter_frame_bytes(frames))):
+            self.fill_frame(bed, row, idx, absolute_coords, raw=raw, impactor=impactor)
+        return impactor
+
+
+class _RowSelector:
+    """
+    Picks the atom rows of a set of particles out of the raw text of a frame, and parses
+    only those rows
+
+    The rows of one frame holding every selected particle are tried first on the next one,
+    so dumps sorted by ID (`dump_modify sort id`) are only searched once. Otherwise the ID of every row is read
+    from the leading digits of the lines, without parsing the rest of the frame.
+    """
+
+    def __init__(self, ids) -> None:
+        self.ids = np.unique(np.fromiter(ids, dtype=np.int64))
+        self.rows = None
+        self.found_ids = None
+
+    def parse(self, raw: bytes, header, num_rows: int, name: str = "Frame") -> np.ndarray:
+        """
+        Method to parse the rows of the selected particles, in the order of their IDs.
+        The particles missing from the frame are left out.
+        """
+        header = list(header)
+        if num_rows == 0:
+            return np.empty((0, len(header)))
+        id_col = header.index("id")
+        starts, ends = _line_bounds(raw, num_rows, name)
+
+        # the rows of the last frame are only reused when they held every particle, as the
+        # ones missing from it can come back
+        reuse = self.rows is not None and len(self.rows) and np.array_equal(self.found_ids, self.ids)
+        if reuse and self.rows.max() < num_rows:
+            values = self.__parse_lines(raw, starts, ends, self.rows, len(header), name)
+            if np.array_equal(values[:, id_col], self.found_ids):
+                return values
+
+        # looking the rows up by ID
+        if id_col == 0 and len(starts) and not np.any(np.frombuffer(raw, dtype=np.uint8)[starts] == 32):
+            row_ids = _leading_ints(raw, starts)
+        else:
+            row_ids = _parse_rows(raw, num_rows, len(header), name)[:, id_col].astype(np.int64)
+        order = np.argsort(row_ids, kind="stable")
+        pos = np.searchsorted(row_ids[order], self.ids)
+        found = pos < num_rows
+        found[found] = row_ids[order][pos[found]] == self.ids[found]
+        rows = order[pos[found]]
+
+        self.rows = rows
+        self.found_ids = self.ids[found]
+        return self.__parse_lines(raw, starts, ends, rows, len(header), name)
+
+    @staticmethod
+    def __parse_lines(raw, starts, ends, rows, num_cols, name) -> np.ndarray:
+        block = b"\n".join([raw[start:end] for start, end in zip(starts[rows], ends[rows])])
+        return _parse_rows(block, len(rows), num_cols, name)
+
+
+def _line_bounds(raw: bytes, num_rows: int, name: str = "Frame") -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function to get the byte offsets where every line of a block of atom rows starts and ends
+    """
+    newlines = np.flatnonzero(np.frombuffer(raw, dtype=np.uint8) == 10)
+    if len(newlines) != num_rows:
+        raise ValueError(f"{name} does not hold {num_rows} rows.")
+    starts = np.concatenate([[0], newlines[:-1] + 1]).astype(np.int64)
+    return starts, newlines
+
+
+def _leading_ints(raw: bytes, starts: np.ndarray) -> np.ndarray:
+    """
+    Function to read the non-negative integer at the start of every line, all at once
+    """
+    buffer = np.frombuffer(raw, dtype=np.uint8)
+    separators = np.flatnonzero((buffer == 32) | (buffer == 9) | (buffer == 10))
+    lengths = separators[np.searchsorted(separators, starts)] - starts
+    width = int(lengths.max())
+
+    # the digits of every number, right aligned
+    offsets = np.arange(width)
+    digits = buffer[np.minimum(starts[:, None] + offsets, len(buffer) - 1)].astype(np.int64) - 48
+    exponent = lengths[:, None] - 1 - offsets
+    scale = np.where(exponent >= 0, 10 ** np.clip(exponent, 0, None), 0)
+    return (digits * scale).sum(axis=1)
+
+
+def _parse_rows(raw: bytes, num_rows: int, num_cols: int, name: str = "Frame") -> np.ndarray:
+    """
+    Function to parse a block of atom rows into a <rows> x <fields> array
+    """
+    values = np.fromstring(raw, sep=" ")
+    if values.size != num_rows * num_cols:
+        raise ValueError(f"{name} does not hold {num_rows} rows of {num_cols} numeric fields.")
+    return values.reshape(num_rows, num_cols)
+
+
+def _parse_frame(raw: bytes, num_atoms: int, header, selector=None, name: str = "Frame") -> np.ndarray:
+    """
+    Function to parse the atom rows of a frame, or only the ones of a `_RowSelector`
+    """
+    if selector is not None:
+        return selector.parse(raw, header, num_atoms, name)
+    return _parse_rows(raw, num_atoms, len(header), name)
+
+
+def _fill_frame(raw: bytes, frame: dict, ids, columns: dict, row: int, settings: dict,
+                stats: LoadStats, selector=None, impactor: dict = None) -> list[str]:
+    """
+    Function to parse a frame into row `row` of the field arrays, the step shared by the
+    loaders of this process and the worker processes of `read_timesteps_multi`
+        - Arguments:
+            - `raw` : the atom rows of the frame
+            - `frame` : the frame from `_SimFileOperators.get_frame_info`
+            - `ids`, `columns` : the particle IDs and the <frames> x <particles> field arrays
+            - `settings` : the load from `_SimFileOperators.get_load_settings`
+            - `stats` : the `LoadStats` the frame and the data dropped are counted in
+            - `selector`, `impactor` : see `_SimFileOperators.fill_frame`
+        - Returns : messages for the data that could not be added, only built in debug mode
+    """
+    stats.frames_parsed += 1
+    values = _parse_frame(raw, frame["num_atoms"], frame["header"], selector,
+                          f"Frame {frame['idx']} of {settings['filepath']}")
+    disc_id = settings["disc_id"]
+    unmatched, missing = _scatter_rows(values, frame["header"], ids, columns, row, frame["bounds"],
+                                       settings["absolute_coords"], settings["unwrap"], impactor=impactor,
+                                       disc_id=disc_id, surface=selector is None)
+    # the fields left out of a partial load were left out on purpose
+    missing = [field for field in missing if field not in settings["all_fields"]]
+    unmatched = unmatched[unmatched != disc_id]
+    stats.record_dropped(len(unmatched), missing)
+    if not settings["debug"]:
+        return []
+    return _not_added(unmatched, missing, frame["idx"], frame["timestep"], disc_id)
+
+
+def _scatter_rows(values, header, ids, columns: dict, row: int, bounds, absolute_coords=True,
+                  unwrap=False, impactor: dict = None, disc_id: int = None,
+                  surface: bool = True) -> tuple[np.ndarray, list[str]]:
+    """
+    Function to write the parsed rows of a frame into row `row` of the field arrays,
+    matching every atom row to its column by particle ID
+        - `bounds` : the box bounds of the frame, the coordinates are turned into fields
+          with `coord_tools.transform`
+        - `impactor` : the <frames> x 1 field arrays of the impactor, to write the row of
+          `disc_id` and the `surface_height` of the bed in
+        - `surface` : whether `values` holds every row of the frame, so the `surface_height`
+          can be found from all the bed rows. It is left as NaN otherwise.
+        - Returns : the IDs and the fields that have no place in the arrays
+    """
+    p_IDs = values[:, list(header).index("id")].astype(np.int64)
+    pos = np.searchsorted(ids, p_IDs)
+    valid = pos < len(ids)
+    valid[valid] = ids[pos[valid]] == p_IDs[valid]
+    pos = pos[valid]
+
+    fields = transform(values, header, bounds, absolute_coords, unwrap)
+    missing = []
+    for field, column in fields.items():
+        if field not in columns:
+            missing.append(field)
+            continue
+        columns[field][row, pos] = column[valid]
+
+    if impactor is not None:
+        disc = p_IDs == disc_id
+        if disc.any():
+            for field, column in fields.items():
+                if field in impactor:
+                    impactor[field][row, 0] = column[disc][0]
+        if surface and all(field in fields for field in ("x", "y", "radius")):
+            bed = ~disc
+            impactor["surface_height"][row, 0] = surface_level(
+                fields["x"][bed], fields["y"][bed], fields["radius"][bed])
+
+    return p_IDs[~valid], missing
+
+
+def _not_added(unmatched, missing, idx, timestep, disc_id) -> list[str]:
+    """
+    Function to describe the data of a frame that could not be added to a trajectory
+    """
+    return [
+        f"p{p_ID} at t{idx}-->{timestep} not added."
+        for p_ID in unmatched if p_ID != disc_id
+    ] + [
+        f"{field:15s} at t{idx}-->{timestep} not added."
+        for field in missing
+    ]
+
+
+def _pad_frames(frames, reach: int, num_indexed: int) -> tuple[np.ndarray, int]:
+    """
+    Function to add up to `reach` frames before and after a sequence of frames, keeping the
+    spacing of its ends, for the stencil of the derivatives of its first and last frames
+        - Returns : the padded frame indices and the number of frames added before
+    """
+    frames = np.asarray(frames, dtype=np.int64)
+    if len(frames) < 2 or reach == 0:
+        return frames, 0
+    steps = np.arange(1, reach + 1)
+    before = frames[0] - steps[::-1] * (frames[1] - frames[0])
+    after = frames[-1] + steps * (frames[-1] - frames[-2])
+    before = before[(before >= 0) & (before < num_indexed)]
+    after = after[(after >= 0) & (after < num_indexed)]
+    return np.concatenate([before, frames, after]), len(before)
+
+
+def _time_to_timestep(time: float, dt: float) -> float:
+    """
+    Function to turn a simulation time into a timestep value, rounded to the closest
+    integer when it is only off by floating point error (e.g. 0.3 / 0.1)
+    """
+    value = time / dt
+    closest = round(value)
+    return closest if np.isclose(value, closest, rtol=1e-9, atol=1e-9) else value
+
+
+def _gather(values: list):  # -> np.ndarray | list:
+    """
+    Function to stack per-frame results into an array when they are all numbers or
+    arrays of the same shape, or leave them in a list otherwise
+    """
+    if len(values) == 0:
+        return []
+    if all(isinstance(value, (int, float, bool, np.number, np.bool_, np.ndarray)) for value in values):
+        shapes = {np.shape(value) for value in values}
+        if len(shapes) == 1:
+            return np.stack([np.asarray(value) for value in values])
+    return values
+
+
+# the state of a worker process of `_frame_pool`, set up once by `_init_frame_worker`
+_worker_state: dict = {}
+
+
+def _frame_pool(oper: _SimFileOperators, workers: int, run, state, setup=None) -> ProcessPoolExecutor:
+    """
+    Function to start a pool of processes running `_run_frame_chunk` on chunks of frames of
+    a dump file, every process opening it itself from the frame index of `oper`, as done by
+    `SimParams.map_frames` and `render_tools.BedAnimator`
+        - Arguments:
+            - `run` : called as `run(oper, chunk, state)` in the processes to get the results
+              of a chunk of frames. It has to be picklable, e.g. a module level function.
+            - `state` : what `run` needs besides the frames, sent once to every process
+            - `setup` : called as `setup(state)` once in every process to get the state `run`
+              gets instead, e.g. to make objects that can't be sent between processes
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_frame_worker,
+                               initargs=(oper.filepath, *oper.index.get_state(), oper.unwrap, run, state, setup))
+
+
+def _init_frame_worker(filepath, arrays, info, unwrap, run, state, setup) -> None:
+    """
+    Function run once by every `_frame_pool` process to open the dump file from the frame
+    index of the parent process
+    """
+    _worker_state["oper"] = _SimFileOperators(filepath, index=_FrameIndex.from_state(arrays, info), unwrap=unwrap)
+    _worker_state["run"] = run
+    _worker_state["state"] = setup(state) if setup is not None else state
+
+
+def _run_frame_chunk(chunk) -> tuple[list, LoadStats]:
+    """
+    Function run by the `_frame_pool` processes on a chunk of frames
+        - Returns : the results of the chunk and the counters of the work done
+    """
+    oper = _worker_state["oper"]
+    oper.stats = LoadStats()
+    return _worker_state["run"](oper, chunk, _worker_state["state"]), oper.stats
+
+
+def _map_chunk(oper: _SimFileOperators, frames, state: dict) -> list:
+    """
+    Function to run the analysis of `SimParams.map_frames` on the bed of every frame of a chunk
+    """
+    return [
+        state["func"](Bed.from_arrays(frame.ids, frame.columns))
+        for frame in oper.iter_frames(frames, ids=state["include_only"], absolute_coords=state["absolute_coords"])
+    ]
+
+
+def _log_dropped(unmatched: int, dropped_fields) -> None:
+    """
+    Function to log a single summary of the data a load could not add to its trajectory
+    """
+    if unmatched:
+        logger.warning("%d atom rows of particles outside the bed were not added.", unmatched)
+    for field, count in sorted(dropped_fields.items()):
+        logger.warning("Field \"%s\" was not added in %d frames.", field, count)
+
+
+def _new_block_file(size: int) -> str:
+    """
+    Function to make an empty file for a block of `size` float64 values, in shared memory
+    (`/dev/shm`) where there is one so the block never goes to disk
+        - Returns : the path of the file
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    handle, path = tempfile.mkstemp(prefix="granular_vis_", suffix=".block", dir=directory)
+    os.close(handle)
+    try:
+        os.truncate(path, size * 8)
+    except OSError:
+        os.remove(path)
+        raise
+    return path
+
+
+def _split_block(block, shape, impactor_shape) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function to get the bed and impactor arrays of a `read_timesteps_multi` block, as views
+    """
+    size = int(np.prod(shape))
+    return (block[:size].reshape(shape),
+            block[size:size + int(np.prod(impactor_shape))].reshape(impactor_shape))
+
+
+def _parse_chunk(job: dict) -> tuple[LoadStats, list[str]]:
+    """
+    Function run by the worker processes of `read_timesteps_multi` to parse a contiguous
+    range of frames into the memory-mapped block of `read_timesteps_multi`
+        - Returns : the counters of the work done and, in debug mode, the messages for the
+          data that could not be added
+    """
+    block = np.memmap(job["block_path"], dtype=np.float64, mode="r+", shape=(job["block_size"],))
+    selector = _RowSelector(job["select_ids"]) if job["select_ids"] is not None else None
+    stats = LoadStats()
+    not_added = []
+    shared, shared_impactor = _split_block(block, job["shape"], job["impactor_shape"])
+    columns = {field: shared[i] for i, field in enumerate(job["fields"])}
+    impactor = {field: shared_impactor[i] for i, field in enumerate(job["impactor_fields"])}
+    source = open_source(job["settings"]["filepath"], blocks=job["blocks"])
+    for frame, raw in zip(job["frames"], source.iter_ranges(job["data_offsets"], job["end_offsets"])):
+        stats.bytes_read += len(raw)
+        not_added.extend(_fill_frame(raw, frame, job["ids"], columns, frame["idx"], job["settings"], stats,
+                                     selector=selector, impactor=impactor))
+    return stats, not_added
@@ -0,0 +1,98 @@
+from collections import Counter
+from contextlib import contextmanager
+from time import perf_counter
+
+
+class LoadStats:
+    """
+    Counters and timings of the work done to load a dump file, collected instead of
+    printing them so long jobs can report them without any console output
+
+        - `bytes_read` : bytes read from the dump file, by the index scans and the parsers
+        - `frames_indexed` : number of frames added to the frame index
+        - `frames_parsed` : number of frames parsed into arrays
+        - `stage_times` : seconds spent in every stage by name, e.g. `'scan'`, `'parse'`
+        - `cache_hits`, `cache_misses` : lookups of the sidecar cache
+        - `unmatched_rows` : atom rows left out because their particle is not in the trajectory
+        - `dropped_fields` : the number of frames every field was left out of a trajectory
+    """
+
+    def __init__(self, callback=None) -> None:
+        """
+            - `callback` : called as `callback(stage, stats)` every time a stage ends
+        """
+        self.callback = callback
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Method to set every counter and timing back to zero
+        """
+        self.bytes_read = 0
+        self.frames_indexed = 0
+        self.frames_parsed = 0
+        self.stage_times: Counter = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.unmatched_rows = 0
+        self.dropped_fields: Counter = Counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager adding the time spent in its body to the stage passed in
+        """
+        start = perf_counter()
+        try:
+            yield self
+        finally:
+            self.stage_times[name] += perf_counter() - start
+            if self.callback is not None:
+                self.callback(name, self)
+
+    def record_cache(self, hit: bool) -> None:
+        if hit:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+    def record_dropped(self, unmatched: int, fields) -> None:
+        """
+        Method to count the rows and fields of a frame that could not be added to a trajectory
+        """
+        self.unmatched_rows += unmatched
+        self.dropped_fields.update(fields)
+
+    def merge(self, other) -> None:
+        """
+        Method to add the counters of another `LoadStats`, e.g. the ones of a worker process
+        """
+        self.bytes_read += other.bytes_read
+        self.frames_indexed += other.frames_indexed
+        self.frames_parsed += other.frames_parsed
+        self.stage_times.update(other.stage_times)
+        self.cache_hits += other.cache_hits
+        self.cache_misses += other.cache_misses
+        self.unmatched_rows += other.unmatched_rows
+        self.dropped_fields.update(other.dropped_fields)
+
+    def as_dict(self) -> dict:
+        return {
+            "bytes_read": self.bytes_read,
+            "frames_indexed": self.frames_indexed,
+            "frames_parsed": self.frames_parsed,
+            "stage_times": dict(self.stage_times),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "unmatched_rows": self.unmatched_rows,
+            "dropped_fields": dict(self.dropped_fields),
+        }
+
+    def __getstate__(self) -> dict:
+        # the callback stays in the process it was set in
+        state = self.__dict__.copy()
+        state["callback"] = None
+        return state
+
+    def __repr__(self) -> str:
+        return f"LoadStats({self.as_dict()})"
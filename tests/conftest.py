@@ -0,0 +1,45 @@
+from granular_vis.benchmarks.synthetic_dump import write_dump
+from granular_vis.sim_tools import SimParams
+import pytest
+
+
+@pytest.fixture
+def make_dump(tmp_path):
+    """
+    Fixture to write synthetic dumps into the test directory, see `synthetic_dump.write_dump`
+    """
+    def make(name: str = "bed.dump", **kwargs) -> str:
+        filepath = str(tmp_path / name)
+        write_dump(filepath, **kwargs)
+        return filepath
+    return make
+
+
+@pytest.fixture
+def dump(make_dump):
+    return make_dump(num_particles=300, num_frames=12, shuffle=True)
+
+
+@pytest.fixture
+def sim(dump):
+    sim = SimParams(dump, cache=False, dt=0.1)
+    sim.render_bed_single()
+    return sim
+
+
+@pytest.fixture
+def gaps_dump(tmp_path):
+    """
+    Fixture to write a small dump whose particle 2 leaves in frame 2 and comes back in frame 3,
+    after the rows particles 3 and 5 (the disc) had in frame 2, and whose frame 4 is empty
+    """
+    filepath = str(tmp_path / "gaps.dump")
+    frames = [(0, [1, 2, 3, 4, 5]), (1, [1, 2, 3, 4, 5]), (2, [1, 3, 4, 5]),
+              (3, [1, 3, 4, 5, 2]), (4, []), (5, [1, 2, 3, 4, 5])]
+    with open(filepath, "w") as dump_file:
+        for timestep, ids in frames:
+            dump_file.write(f"ITEM: TIMESTEP\n{timestep}\nITEM: NUMBER OF ATOMS\n{len(ids)}\n"
+                            "ITEM: BOX BOUNDS pp pp pp\n0 1\n0 1\n-0.5 0.5\nITEM: ATOMS id x y radius\n")
+            for p_id in ids:
+                dump_file.write(f"{p_id} {0.1 * p_id} {0.01 * timestep + 0.05 * p_id} 0.01\n")
+    return filepath
@@ -0,0 +1,55 @@
+from granular_vis.granular_bed.bed_tools import Bed, Selection
+from granular_vis.sim_tools import SimParams, _SimFileOperators
+import numpy as np
+
+
+def test_bed_from_snapshot_in_array_form(dump):
+    oper = _SimFileOperators(dump)
+    snap = oper.get_bed_snap(idx=3)
+    listed = Bed(oper.get_bed_snap(idx=3, array_form=True))
+
+    assert listed.fields == Bed(snap).fields
+    for field in listed.fields:
+        assert listed.get_data(field) == Bed(snap).get_data(field)
+
+
+def test_selection_indexing_matches_its_ids():
+    bed_ids = np.arange(10, 20)
+    selection = Selection(bed_ids, bed_ids % 3 == 0)
+
+    assert list(selection) == [12, 15, 18]
+    assert [selection[i] for i in range(len(selection))] == [12, 15, 18]
+    assert selection[-1] == 18 and isinstance(selection[0], int)
+    assert selection[1:] == [15, 18]
+    assert 15 in selection and 16 not in selection
+
+
+def test_selectors_match_a_loop_over_the_particles(dump):
+    bed = SimParams(dump, cache=False).get_bed_static(5)
+    x, y = bed.get_data("x"), bed.get_data("y")
+    origin = (0.15, 0.05)
+
+    def __dist(p_ID):
+        return float(np.hypot(x[p_ID] - origin[0], y[p_ID] - origin[1]))
+
+    assert list(bed.is_greater("y", 0.1)) == [p for p in x if y[p] > 0.1]
+    assert list(bed.is_within_2d(0.05, 0.2, 0.02, 0.08)) == [p for p in x if 0.05 < x[p] < 0.2 and 0.02 < y[p] < 0.08]
+    assert list(bed.is_within_circle(origin, 0.05)) == [p for p in x if __dist(p) < 0.05]
+    assert list(bed.is_within_circle_region(origin, 0.03, 0.06)) == [p for p in x if 0.03 < __dist(p) < 0.06]
+    assert list(~bed.is_greater("y", 0.1) | bed.is_greater("x", 0.2)) == [p for p in x if y[p] <= 0.1 or x[p] > 0.2]
+
+
+def test_probes_match_a_loop_over_the_particles(dump):
+    bed = SimParams(dump, cache=False).get_bed_static(5)
+    x, y = bed.get_data("x"), bed.get_data("y")
+    array_x, array_y = np.linspace(0.01, 0.29, 9), np.linspace(0.01, 0.12, 5)
+
+    expected = [min(x, key=lambda p: np.hypot(x[p] - px, y[p] - py)) for py in array_y for px in array_x]
+    assert bed.is_mesh(array_x, array_y) == expected
+
+    unique = bed.is_mesh(array_x, array_y, unique=True)
+    assert len(set(unique)) == len(unique) and -1 not in unique
+
+    row = [p for p in x if 0.05 - 0.01 < y[p] < 0.05 + 0.01]
+    expected = [min(row, key=lambda p: np.hypot(x[p] - px, y[p] - 0.05)) for px in array_x]
+    assert bed.is_array('h', array_x, 0.05) == expected
@@ -0,0 +1,69 @@
+from granular_vis.benchmarks.synthetic_dump import write_dump
+from granular_vis.cache_tools import FrameCache
+from granular_vis.sim_tools import SimParams
+import numpy as np
+
+
+def _assert_same_trajectory(traj, expected):
+    assert traj.fields == expected.fields
+    np.testing.assert_array_equal(traj.ids, expected.ids)
+    np.testing.assert_array_equal(traj.timesteps, expected.timesteps)
+    for field in expected.fields:
+        np.testing.assert_array_equal(traj.get_field(field), expected.get_field(field), err_msg=field)
+
+
+def test_sidecar_cache_is_used_until_the_dump_changes(dump):
+    first = SimParams(dump)
+    first.render_bed_single()
+    assert first.stats.cache_hits == 0
+
+    cached = SimParams(dump)
+    cached.render_bed_single()
+    assert cached.stats.cache_hits == 2
+    assert cached.stats.frames_parsed == 1
+    assert isinstance(cached.render_bed.get_field("x"), np.memmap)
+    _assert_same_trajectory(cached.render_bed, first.render_bed)
+
+    # the same number of particles and frames, so only the content tells the files apart
+    write_dump(dump, num_particles=300, num_frames=12, shuffle=True, seed=1)
+    changed = SimParams(dump)
+    changed.render_bed_single()
+    assert changed.stats.cache_hits == 0
+    expected = SimParams(dump, cache=False)
+    expected.render_bed_single()
+    _assert_same_trajectory(changed.render_bed, expected.render_bed)
+
+
+def test_frame_cache_evicts_the_least_recently_used_values():
+    cache = FrameCache(max_bytes=3 * 800)
+    for idx in range(3):
+        cache.put(("frame", idx), np.zeros(100))
+    assert cache.get(("frame", 0)) is not None
+
+    cache.put(("frame", 3), np.zeros(100))
+    assert ("frame", 1) not in cache
+    assert all(("frame", idx) in cache for idx in (0, 2, 3))
+    assert cache.num_bytes == 3 * 800 and cache.evictions == 1
+
+    cache.put(("bed", 0), np.zeros(10))
+    assert ("frame", 2) not in cache
+    assert cache.evict_frames([0]) == 2
+    assert len(cache) == 1
+    cache.put(("frame", 4), np.zeros(1000))
+    assert ("frame", 4) not in cache
+
+
+def test_static_beds_are_parsed_once(dump):
+    sim = SimParams(dump, cache=False)
+    parsed = sim.stats.frames_parsed
+    bed = sim.get_bed_static(4)
+    again = sim.get_bed_static(4)
+    assert sim.stats.frames_parsed == parsed + 1
+    np.testing.assert_array_equal(again.get_data("x", as_array=True), bed.get_data("x", as_array=True))
+
+    uncached = SimParams(dump, cache=False, frame_cache_bytes=0)
+    parsed = uncached.stats.frames_parsed
+    uncached.get_bed_static(4)
+    uncached.get_bed_static(4)
+    assert uncached.stats.frames_parsed == parsed + 2
+    assert len(uncached.frame_cache) == 0
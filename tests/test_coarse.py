@@ -0,0 +1,19 @@
+from granular_vis.granular_bed.coarse import coarse_grain
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("method", ["bins", "gaussian"])
+def test_average_of_identical_frames_is_the_frame(method):
+    rng = np.random.default_rng(0)
+    x, y = rng.uniform(0, 1, 500), rng.uniform(0, 1, 500)
+    radius = rng.uniform(0.005, 0.01, 500)
+    v_x, v_y = rng.normal(0, 1, 500), rng.normal(0, 1, 500)
+    edges = (np.linspace(0, 1, 11), np.linspace(0, 1, 11))
+
+    single = coarse_grain(x, y, radius, v_x, v_y, edges=edges, method=method, width=0.05)
+    pooled = coarse_grain(*(np.tile(values, (10, 1)) for values in (x, y, radius, v_x, v_y)),
+                          edges=edges, method=method, width=0.05, average=True)
+
+    for field in ("count", "number_density", "area_fraction", "v_x", "v_y", "temperature"):
+        np.testing.assert_allclose(pooled[field], single[field], rtol=1e-12, atol=1e-15, err_msg=field)
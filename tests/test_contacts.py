@@ -0,0 +1,37 @@
+from granular_vis.granular_bed.contacts import ContactNetwork
+import numpy as np
+
+
+def test_contacts_match_every_pair(sim):
+    bed = sim.get_bed_static(4)
+    x, y, radius = (bed.get_data(field, as_array=True) for field in ("x", "y", "radius"))
+    network = bed.get_contacts(tolerance=1.05)
+
+    dist = np.hypot(x[:, None] - x[None, :], y[:, None] - y[None, :])
+    touching = (dist < 1.05 * (radius[:, None] + radius[None, :])) & ~np.eye(len(x), dtype=bool)
+    first, second, overlaps = network.get_edges()
+    assert network.num_contacts == touching.sum() // 2
+    assert touching[first, second].all()
+    np.testing.assert_allclose(overlaps, radius[first] + radius[second] - dist[first, second], rtol=1e-12)
+    np.testing.assert_array_equal(network.get_coordination(), touching.sum(axis=1))
+    np.testing.assert_array_equal(network.get_neighbours(bed.ids[7]), np.sort(bed.ids[touching[7]]))
+
+    streamed = next(sim.iter_contacts(4, 5, tolerance=1.05))
+    np.testing.assert_array_equal(streamed.get_coordination(), network.get_coordination())
+
+
+def test_rattlers_are_taken_out_one_after_the_other():
+    # a triangle, a particle touching two of its corners, and a chain of two hanging off it
+    ids = np.arange(1, 7)
+    first, second = [0, 1, 2, 3, 3, 4], [1, 2, 0, 0, 1, 5]
+    network = ContactNetwork(ids, first, second, np.zeros(6))
+
+    np.testing.assert_array_equal(network.get_coordination(), [3, 3, 2, 2, 1, 1])
+    np.testing.assert_array_equal(network.get_rattlers(min_contacts=2), [False, False, False, False, True, True])
+    assert network.get_rattlers().all()
+
+    stats = network.get_stats(min_contacts=2)
+    assert stats["num_contacts"] == 6
+    assert stats["mean_coordination"] == 2
+    assert stats["mean_coordination_no_rattlers"] == 2.5
+    assert stats["rattler_fraction"] == 2 / 6
@@ -0,0 +1,35 @@
+from granular_vis.coord_tools import output_fields, transform
+import numpy as np
+import pytest
+
+
+BOUNDS = [[0.0, 1.0], [0.0, 1.0], [-0.5, 0.5]]
+
+
+@pytest.mark.parametrize("header", [["id", "xu", "x", "y", "ix"], ["id", "x", "xu", "y", "ix"]])
+@pytest.mark.parametrize("unwrap", [False, True])
+def test_mixed_wrapped_and_unwrapped_columns(header, unwrap):
+    row = {"id": 1, "xu": 1.9, "x": 0.9, "y": 0.4, "ix": 1}
+    values = np.array([[row[field] for field in header]])
+
+    fields = output_fields(header, unwrap=unwrap)
+    out = transform(values, header, BOUNDS, unwrap=unwrap)
+
+    assert len(fields) == len(set(fields))
+    assert list(out) == fields
+    assert out["x"][0] == (1.9 if unwrap else 0.9)
+    assert out["y"][0] == 0.4
+    if not unwrap:
+        assert out["xu"][0] == 1.9
+
+
+@pytest.mark.parametrize("header", [["id", "xsu", "xs", "ys"], ["id", "xs", "xsu", "ys"]])
+def test_mixed_scaled_columns(header):
+    row = {"id": 1, "xsu": 1.25, "xs": 0.25, "ys": 0.5}
+    values = np.array([[row[field] for field in header]])
+    bounds = [[-1.0, 3.0], [0.0, 2.0], [0.0, 1.0]]
+
+    assert transform(values, header, bounds, unwrap=True)["x"][0] == 4.0
+    out = transform(values, header, bounds)
+    assert out["x"][0] == 0.0
+    assert out["xsu"][0] == 1.25
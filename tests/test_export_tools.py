@@ -0,0 +1,49 @@
+from granular_vis.export_tools import open_export
+from granular_vis.sim_tools import SimParams
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("extension, module", [(".h5", "h5py"), (".zarr", "zarr"), (".parquet", "pyarrow")])
+def test_export_of_a_window_matches_the_rendered_trajectory(sim, tmp_path, extension, module):
+    pytest.importorskip(module)
+    filepath = str(tmp_path / ("export" + extension))
+    assert sim.export(filepath, start=3, stop=8, chunk_frames=2) == 5
+
+    traj = sim.render_bed
+    with open_export(filepath) as stored:
+        np.testing.assert_array_equal(stored.frames, np.arange(3, 8))
+        for field in traj.fields:
+            np.testing.assert_allclose(np.asarray(stored.get_field(field)), traj.get_field(field)[3:8],
+                                       rtol=1e-12, err_msg=field)
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_zarr_export_uses_the_compression(sim, tmp_path, compression):
+    zarr = pytest.importorskip("zarr")
+    filepath = str(tmp_path / "export.zarr")
+    sim.export(filepath, stop=4, fields=["x", "y"], kinematics=False, compression=compression)
+
+    array = zarr.open_group(filepath, mode="r")["fields/x"]
+    codecs = array.compressors if hasattr(array, "compressors") else (array.compressor,)
+    assert [type(codec).__name__.lower() for codec in codecs] == [compression + "codec"] \
+        or [getattr(codec, "codec_id", None) for codec in codecs] == [compression]
+    with open_export(filepath, file_format="zarr") as stored:
+        np.testing.assert_array_equal(np.asarray(stored.get_field("x")), sim.render_bed.get_field("x")[:4])
+
+
+@pytest.mark.parametrize("extension, module", [(".h5", "h5py"), (".zarr", "zarr"), (".parquet", "pyarrow")])
+def test_export_keeps_the_frames_without_particles(gaps_dump, tmp_path, extension, module):
+    pytest.importorskip(module)
+    sim = SimParams(gaps_dump, cache=False)
+    filepath = str(tmp_path / ("export" + extension))
+    assert sim.export(filepath, ids=[2], kinematics=False, chunk_frames=1) == 6
+
+    expected = sim.get_bed_oper().read_timesteps_single(ids=[2])[0]
+    with open_export(filepath) as stored:
+        assert stored.num_frames == 6
+        np.testing.assert_array_equal(stored.frames, np.arange(6))
+        np.testing.assert_array_equal(stored.timesteps, expected.timesteps)
+        for field in expected.fields:
+            np.testing.assert_array_equal(np.asarray(stored.get_field(field)), expected.get_field(field))
+        assert np.isnan(stored.get_frame(4)["x"]).all()
@@ -0,0 +1,121 @@
+from granular_vis.sim_tools import SimParams, _FrameIndex
+import numpy as np
+import pytest
+
+
+def _index_of(timesteps) -> _FrameIndex:
+    index = _FrameIndex()
+    index.timesteps = np.asarray(timesteps, dtype=np.int64)
+    index.sort_timesteps()
+    return index
+
+
+def test_timestep_queries_at_the_edges(dump):
+    sim = SimParams(dump, cache=False, dt=0.5)
+    values = np.array([t["value"] for t in sim.timesteps.values()])
+    stride = values[1] - values[0]
+    last = len(values) - 1
+
+    assert sim.nearest_frame(values[0] - 10 * stride) == 0
+    assert sim.nearest_frame(values[-1] + 10 * stride) == last
+    assert sim.nearest_frame(values[3] + stride // 2) == 3
+    assert sim.nearest_frame(values[3] + stride // 2 + 1) == 4
+    assert sim.nearest_frame(time=values[5] * 0.5) == 5
+    with pytest.raises(ValueError):
+        sim.nearest_frame()
+
+    np.testing.assert_array_equal(sim.frames_between(), np.arange(len(values)))
+    np.testing.assert_array_equal(sim.frames_between(values[2], values[5]), [2, 3, 4, 5])
+    np.testing.assert_array_equal(sim.frames_between(values[2] + 1, values[5] - 1), [3, 4])
+    np.testing.assert_array_equal(sim.frames_between(stop=values[0]), [0])
+    np.testing.assert_array_equal(sim.frames_between(start=values[-1]), [last])
+    assert len(sim.frames_between(start=values[-1] + 1)) == 0
+    assert len(sim.frames_between(values[5], values[2])) == 0
+    np.testing.assert_array_equal(sim.frames_between(values[1] * 0.5, values[7] * 0.5, step=3, time=True), [1, 4, 7])
+
+
+def test_timestep_queries_of_a_restarted_run():
+    # the run was restarted from timestep 10, so 10 and 20 are held twice
+    index = _index_of([0, 10, 20, 10, 20, 30])
+
+    assert index.find_timestep(10) == 1 and index.find_timestep(30) == 5
+    with pytest.raises(KeyError):
+        index.find_timestep(15)
+    assert index.nearest(15) == 1
+    assert index.nearest(16) == 2
+    assert index.nearest(100) == 5
+    np.testing.assert_array_equal(index.frames_between(10, 20), [1, 2, 3, 4])
+    with pytest.raises(IndexError):
+        _index_of([]).nearest(0)
+
+
+def _scan_lines(filepath: str) -> list[dict]:
+    """
+    Function to find the frames of a dump the slow way, one line at a time
+    """
+    with open(filepath, 'rb') as dump_file:
+        lines = dump_file.readlines()
+    offsets = np.concatenate([[0], np.cumsum([len(line) for line in lines])])
+    frames = []
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith(b"ITEM: TIMESTEP"):
+            frames.append({"offset": offsets[i], "line": i + 1, "timestep": int(lines[i + 1])})
+        elif line.startswith(b"ITEM: NUMBER OF ATOMS"):
+            frames[-1]["num_atoms"] = int(lines[i + 1])
+        elif line.startswith(b"ITEM: BOX BOUNDS"):
+            frames[-1]["box_bounds"] = [[float(b) for b in lines[i + dim].split()[:2]] for dim in (1, 2, 3)]
+        elif line.startswith(b"ITEM: ATOMS"):
+            frame = frames[-1]
+            frame["header"] = tuple(line.decode().split()[2:])
+            rows = lines[i + 1:i + 1 + frame["num_atoms"]]
+            frame["rows"] = np.array([row.split() for row in rows], dtype=np.float64).reshape(len(rows), len(frame["header"]))
+            frame["data_line"] = i + 1
+            frame["data_offset"] = offsets[i + 1]
+            frame["end_offset"] = offsets[i + 1 + len(rows)]
+            i += len(rows)
+        i += 1
+    return frames
+
+
+@pytest.mark.parametrize("fixture", ["dump", "gaps_dump"])
+def test_index_matches_a_line_by_line_scan(request, fixture):
+    filepath = request.getfixturevalue(fixture)
+    expected = _scan_lines(filepath)
+    oper = SimParams(filepath, cache=False).get_bed_oper()
+    index = oper.index
+
+    assert len(index) == len(expected)
+    for name, key in (("offsets", "offset"), ("data_offsets", "data_offset"), ("end_offsets", "end_offset"),
+                      ("lines", "line"), ("timesteps", "timestep"), ("num_atoms", "num_atoms"),
+                      ("box_bounds", "box_bounds")):
+        np.testing.assert_array_equal(getattr(index, name), [frame[key] for frame in expected], err_msg=name)
+    assert index.headers == [frame["header"] for frame in expected]
+    # the line number of the first atom row, not of the `ITEM: ATOMS` line
+    assert oper.get_data_idx() == expected[0]["data_line"]
+
+
+def test_parsed_frames_match_the_rows_of_the_dump(dump):
+    expected = _scan_lines(dump)
+    sim = SimParams(dump, cache=False)
+    sim.render_bed_single()
+    header = list(expected[0]["header"])
+
+    for idx in (0, 1, len(expected) - 1):
+        rows = expected[idx]["rows"]
+        # the disc, with the largest ID, is not part of the bed
+        rows = rows[rows[:, header.index("id")] != rows[:, header.index("id")].max()]
+        order = np.argsort(rows[:, header.index("id")])
+        (x_lo, x_hi), (y_lo, y_hi), _ = expected[idx]["box_bounds"]
+
+        scaled = sim.get_bed_static(idx, absolute_coords=False)
+        bed = sim.get_bed_static(idx)
+        np.testing.assert_array_equal(bed.ids, rows[order, header.index("id")])
+        for field in ("type", "xs", "ys", "radius"):
+            np.testing.assert_array_equal(scaled.get_data(field, as_array=True), rows[order, header.index(field)])
+        np.testing.assert_allclose(bed.get_data("x", as_array=True),
+                                   x_lo + rows[order, header.index("xs")] * (x_hi - x_lo), rtol=1e-12)
+        np.testing.assert_allclose(bed.get_data("y", as_array=True),
+                                   y_lo + rows[order, header.index("ys")] * (y_hi - y_lo), rtol=1e-12)
+        np.testing.assert_array_equal(sim.render_bed.get_frame(idx)["radius"], rows[order, header.index("radius")])
@@ -0,0 +1,47 @@
+from granular_vis.granular_bed.impactor import surface_level
+from granular_vis.sim_tools import SimParams
+import numpy as np
+import pytest
+
+
+def test_surface_height_of_full_load_uses_every_bed_particle(dump):
+    sim = SimParams(dump, cache=False)
+    sim.render_bed_single()
+    bed = sim.render_bed
+    expected = [
+        surface_level(bed.get_field("x")[t], bed.get_field("y")[t], bed.get_field("radius")[t])
+        for t in range(bed.num_frames)
+    ]
+    np.testing.assert_allclose(sim.impactor.get_field("surface_height")[:, 0], expected)
+
+
+@pytest.mark.parametrize("render", ["render_bed_single", "render_bed_multi"])
+def test_partial_load_does_not_guess_surface_height(dump, render):
+    full = SimParams(dump, cache=False)
+    full.render_bed_single()
+    partial = SimParams(dump, cache=False)
+    getattr(partial, render)(ids=partial.get_bed_oper().get_bed_ids()[:10])
+
+    series, expected = partial.get_impactor_series(), full.get_impactor_series()
+    np.testing.assert_array_equal(series["y"], expected["y"])
+    assert np.isnan(series["surface_height"]).all()
+    assert np.isnan(series["penetration_depth"]).all()
+
+
+def test_partial_load_from_cache_matches_parsed_partial_load(dump):
+    SimParams(dump).render_bed_single()
+    cached = SimParams(dump)
+    cached.render_bed_single(ids=cached.get_bed_oper().get_bed_ids()[:10])
+    parsed = SimParams(dump, cache=False)
+    parsed.render_bed_single(ids=parsed.get_bed_oper().get_bed_ids()[:10])
+
+    series, expected = cached.get_impactor_series(), parsed.get_impactor_series()
+    assert series.keys() == expected.keys()
+    for key in expected:
+        np.testing.assert_array_equal(series[key], expected[key], err_msg=key)
+
+
+def test_first_frame_is_parsed_once(dump):
+    sim = SimParams(dump, cache=False)
+    assert sim.stats.frames_parsed == 1
+    np.testing.assert_array_equal(sim.initial_state.ids, sim.get_bed_oper().get_bed_ids())
@@ -0,0 +1,47 @@
+from granular_vis.io_tools import open_source
+from granular_vis.sim_tools import SimParams
+import bz2
+import gzip
+import numpy as np
+import pytest
+
+
+def _split(data: bytes, parts: int) -> list[bytes]:
+    size = -(-len(data) // parts)
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def _gzip(data: bytes) -> bytes:
+    return b"".join(gzip.compress(chunk) for chunk in _split(data, 4))
+
+
+def _bz2(data: bytes) -> bytes:
+    return b"".join(bz2.compress(chunk) for chunk in _split(data, 4))
+
+
+def _zstd(data: bytes) -> bytes:
+    zstandard = pytest.importorskip("zstandard")
+    return b"".join(zstandard.ZstdCompressor().compress(chunk) for chunk in _split(data, 4))
+
+
+@pytest.mark.parametrize("compress", [_gzip, _bz2, _zstd], ids=["gzip", "bz2", "zstd"])
+def test_compressed_dump_reads_like_the_plain_dump(dump, tmp_path, compress):
+    with open(dump, 'rb') as plain_file:
+        data = plain_file.read()
+    packed = tmp_path / "packed.dump"
+    packed.write_bytes(compress(data))
+
+    source = open_source(str(packed))
+    assert source.compressed
+    for start, end in ((0, 64), (len(data) // 2, len(data) // 2 + 1000), (len(data) - 50, len(data)), (100, 90000)):
+        assert source.read(start, end) == data[start:end]
+
+    plain = SimParams(dump, cache=False)
+    other = SimParams(str(packed), cache=False)
+    np.testing.assert_array_equal(other.timesteps, plain.timesteps)
+    for idx in (0, 7, 3):
+        expected = plain.get_bed_static(idx)
+        found = other.get_bed_static(idx)
+        for field in expected.fields:
+            np.testing.assert_array_equal(found.get_data(field, as_array=True),
+                                          expected.get_data(field, as_array=True))
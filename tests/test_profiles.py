@@ -0,0 +1,51 @@
+from granular_vis.granular_bed.surface import surface_height, surface_mask
+from granular_vis.sim_tools import SimParams
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def profile(dump):
+    return SimParams(dump, cache=False).get_profile_static(6)
+
+
+def test_batched_queries_match_the_single_particle_ones(profile):
+    positions = np.asarray(profile.particle_positions)
+    points = np.random.default_rng(0).uniform(0, 0.3, (50, 2))
+
+    for query in (positions[:, :2], points):
+        np.testing.assert_array_equal(profile.p_circle_count_all(1.5, query),
+                                      [profile.p_circle_count(px, py, 1.5) for px, py in query])
+        np.testing.assert_array_equal(profile.p_count_near_particle_all(3, query),
+                                      [profile.p_count_near_particle(px, py, 3) for px, py in query])
+        np.testing.assert_allclose(profile.p_nearest_all(query),
+                                   [profile.p_nearest(px, py) for px, py in query], rtol=1e-12)
+        np.testing.assert_array_equal(profile.p_is_surface_all(query),
+                                      [profile.p_is_surface(px, py) for px, py in query])
+
+    # the particles themselves by default
+    np.testing.assert_array_equal(profile.p_is_surface_all(), profile.p_is_surface_all(positions[:, :2]))
+
+
+def test_surface_of_every_frame_matches_a_loop_over_the_columns(sim):
+    traj = sim.render_bed
+    x, y, radius = (traj.get_field(field) for field in ("x", "y", "radius"))
+    edges = np.linspace(0, 0.3, 13)
+
+    masks = surface_mask(x, y, radius, edges=edges, depth=2)
+    heights, centres = surface_height(x, y, radius, edges=edges)
+    np.testing.assert_allclose(centres, np.arange(12) * 0.025 + 0.0125)
+    for idx in range(traj.num_frames):
+        column = np.clip(np.searchsorted(edges, x[idx], side="right") - 1, 0, 11)
+        top = y[idx] + radius[idx]
+        for col in range(12):
+            members = np.flatnonzero(column == col)
+            highest = members[np.argsort(-top[members])[:2]]
+            np.testing.assert_array_equal(np.flatnonzero(masks[idx] & (column == col)), np.sort(highest))
+            if len(members):
+                assert heights[idx, col] == top[members].max()
+            else:
+                assert np.isnan(heights[idx, col])
+
+        # a single frame gives the same as the whole trajectory at once
+        np.testing.assert_array_equal(surface_mask(x[idx], y[idx], radius[idx], edges=edges, depth=2), masks[idx])
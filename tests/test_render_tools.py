@@ -0,0 +1,33 @@
+from granular_vis.render_tools import BedAnimator, _chunk_jobs, _prepare_frames
+from granular_vis.traj_tools import stencil_reach
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("method, window", [("central", 7), ("savgol", 5)])
+@pytest.mark.parametrize("chunksize", [1, 2, 5, 12])
+def test_chunked_velocities_match_the_whole_trajectory(sim, method, window, chunksize):
+    sim.differentiate(method=method, window=window)
+    animator = BedAnimator(sim, color="speed", method=method, window=window)
+    state = {"fields": animator.get_fields(), "ids": None, "dt": sim.dt, "kinematics": animator.kinematics}
+    frames = np.arange(sim.num_timesteps)
+
+    drawn = []
+    for job in _chunk_jobs(frames, 0, chunksize, stencil_reach(method, window)):
+        drawn.extend(_prepare_frames(sim.get_bed_oper(), job, state))
+    assert [frame.idx for frame in drawn] == frames.tolist()
+    for frame in drawn:
+        for field in ("v_x", "v_y"):
+            np.testing.assert_allclose(frame.get_field(field), sim.render_bed.get_field(field)[frame.idx],
+                                       rtol=1e-9, atol=1e-12, err_msg=field)
+
+
+def test_images_drawn_in_processes_match_this_process(sim, tmp_path):
+    image = pytest.importorskip("matplotlib.image")
+    animator = BedAnimator(sim, color="speed", velocity=True, figsize=(3, 3), dpi=50)
+
+    single = animator.save_images(str(tmp_path / "single"), start=2, stop=9, workers=1)
+    multi = animator.save_images(str(tmp_path / "multi"), start=2, stop=9, workers=2, chunksize=2)
+    assert len(single) == len(multi) == 7
+    for first, second in zip(single, multi):
+        np.testing.assert_array_equal(image.imread(first), image.imread(second))
@@ -0,0 +1,154 @@
+from granular_vis.sim_tools import SimParams
+from granular_vis.stats_tools import LoadStats
+import mmap
+import re
+import numpy as np
+import pytest
+
+
+def test_multi_process_parse_matches_single_process(dump):
+    oper = SimParams(dump, cache=False).get_bed_oper()
+    single, single_impactor = oper.read_timesteps_single()
+    multi, multi_impactor = oper.read_timesteps_multi(workers=3)
+
+    for expected, traj in ((single, multi), (single_impactor, multi_impactor)):
+        np.testing.assert_array_equal(traj.ids, expected.ids)
+        assert traj.fields == expected.fields
+        for field in expected.fields:
+            np.testing.assert_array_equal(traj.get_field(field), expected.get_field(field))
+
+    # the fields are views of the block the workers wrote, not copies of it
+    blocks = {id(_root(traj.get_field(field))) for traj in (multi, multi_impactor) for field in traj.fields}
+    assert len(blocks) == 1
+    assert isinstance(_root(multi.get_field("x")), mmap.mmap)
+
+
+def _root(values):
+    while isinstance(values, np.ndarray) and values.base is not None:
+        values = values.base
+    return values
+
+
+def test_selected_particle_leaving_and_coming_back(gaps_dump):
+    sim = SimParams(gaps_dump, cache=False)
+    full, _ = sim.get_bed_oper().read_timesteps_single()
+    partial, _ = sim.get_bed_oper().read_timesteps_single(ids=[2, 3])
+
+    expected = full.subset(ids=[2, 3])
+    for field in expected.fields:
+        np.testing.assert_array_equal(partial.get_field(field), expected.get_field(field))
+    np.testing.assert_array_equal(partial.get_field("x")[:, 0], [0.2, 0.2, np.nan, 0.2, np.nan, 0.2])
+
+
+def _mean_height(bed) -> float:
+    return float(np.nanmean(bed.get_data("y", as_array=True)))
+
+
+def test_map_frames_in_processes_matches_this_process(dump):
+    sim = SimParams(dump, cache=False)
+    frames = [5, -1, 2, 0]
+    expected = [_mean_height(sim.get_bed_static(idx)) for idx in frames]
+
+    np.testing.assert_array_equal(sim.map_frames(_mean_height, frames=frames, workers=1), expected)
+    np.testing.assert_array_equal(sim.map_frames(_mean_height, frames=frames, workers=2, chunksize=1), expected)
+
+
+def test_streamed_frames_match_the_rendered_trajectory(sim):
+    traj = sim.render_bed
+    frames = list(sim.iter_frames(2, None, 3))
+    assert [frame.idx for frame in frames] == [2, 5, 8, 11]
+    for frame in frames:
+        for field in frame.fields:
+            np.testing.assert_array_equal(frame.get_field(field), traj.get_field(field)[frame.idx])
+
+    windows = list(sim.iter_windows(width=4, fields=["x"]))
+    assert len(windows) == traj.num_frames - 3
+    np.testing.assert_array_equal(windows[-1].get_field("x"), traj.get_field("x")[-4:])
+
+    for frame in sim.iter_kinematics():
+        for field in ("x", "v_x", "a_x", "v_y", "a_y"):
+            np.testing.assert_allclose(frame.get_field(field), traj.get_field(field)[frame.idx],
+                                       rtol=1e-9, atol=1e-12, err_msg=field)
+
+
+@pytest.mark.parametrize("method", ["central", "fourth", "savgol"])
+def test_differentiate_is_exact_for_a_parabola(sim, method):
+    traj = sim.render_bed
+    time = traj.timesteps * sim.dt
+    positions = 3 + 2 * time - 0.5 * time ** 2
+    traj.add_field("y", np.repeat(positions[:, None], traj.num_particles, axis=1))
+    sim.differentiate(method=method)
+
+    # np.gradient is only first order accurate at the first and last frames
+    inner = slice(2, -2) if method == "central" else slice(None)
+    np.testing.assert_allclose(traj.get_field("v_y")[inner, 0], (2 - time)[inner], rtol=1e-9)
+    np.testing.assert_allclose(traj.get_field("a_y")[inner, 0], -1, rtol=1e-9)
+
+
+def test_differentiate_uses_the_time_of_every_frame(dump):
+    sim = SimParams(dump, cache=False)
+    sim.render_bed_single()
+    traj = sim.render_bed
+    traj.timesteps = traj.timesteps ** 2 // traj.timesteps.max()
+    time = traj.timesteps.astype(np.float64)
+    traj.add_field("y", np.repeat((time ** 2)[:, None], traj.num_particles, axis=1))
+
+    sim.differentiate()
+    np.testing.assert_allclose(traj.get_field("v_y")[1:-1, 0], 2 * time[1:-1], rtol=1e-9)
+    for method in ("fourth", "savgol"):
+        with pytest.raises(ValueError):
+            sim.differentiate(method=method)
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_update_matches_a_full_reload(make_dump, tmp_path, cache):
+    full = make_dump(num_particles=100, num_frames=12, shuffle=True)
+    with open(full, 'rb') as dump_file:
+        data = dump_file.read()
+    # the file ends in the middle of the 8th frame, as if it was still being written
+    cut = [match.start() for match in re.finditer(b"ITEM: TIMESTEP", data)][7] + 200
+    growing = tmp_path / "growing.dump"
+    growing.write_bytes(data[:cut])
+
+    sim = SimParams(str(growing), cache=cache)
+    sim.render_bed_single()
+    assert sim.num_timesteps == 7
+    with open(growing, 'ab') as dump_file:
+        dump_file.write(data[cut:])
+    seen = []
+    frames = sim.update(callback=seen.append)
+    assert [frame.idx for frame in frames] == list(range(7, 12)) and seen == frames
+    assert sim.update() == []
+
+    expected = SimParams(full, cache=False)
+    expected.render_bed_single()
+    assert sim.num_timesteps == 12
+    for traj, reference in ((sim.render_bed, expected.render_bed), (sim.impactor, expected.impactor)):
+        np.testing.assert_array_equal(traj.timesteps, reference.timesteps)
+        assert sorted(traj.fields) == sorted(reference.fields)
+        for field in reference.fields:
+            np.testing.assert_allclose(traj.get_field(field), reference.get_field(field),
+                                       rtol=1e-9, atol=1e-12, err_msg=field)
+    for frame in frames:
+        np.testing.assert_allclose(frame.get_field("v_y"), expected.render_bed.get_field("v_y")[frame.idx],
+                                   rtol=1e-9, atol=1e-12)
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_load_stats_count_every_frame_once(dump, workers):
+    stages = []
+    stats = LoadStats(callback=lambda stage, _: stages.append(stage))
+    sim = SimParams(dump, cache=False, stats=stats)
+    if workers == 1:
+        sim.render_bed_single()
+    else:
+        sim.render_bed_multi(workers=workers)
+
+    # the first frame is parsed once more, for the initial state
+    assert stats.frames_indexed == stats.frames_parsed - 1 == sim.num_timesteps
+    with open(dump, 'rb') as dump_file:
+        size = len(dump_file.read())
+    # a scan of the whole file, then the atom rows of the frames
+    assert stats.bytes_read > size
+    assert stats.unmatched_rows == 0 and not stats.dropped_fields
+    assert {"scan", "differentiate"} <= set(stages)
@@ -0,0 +1,44 @@
+from granular_vis.traj_tools import Trajectory, cumulative_travel, d2min, mean_squared_displacement
+import numpy as np
+
+
+def test_msd_matches_the_average_over_every_time_origin():
+    positions = np.random.default_rng(0).normal(size=(40, 25, 2)).cumsum(axis=0)
+    lags, msd = mean_squared_displacement(positions, max_lag=30)
+    _, per_particle = mean_squared_displacement(positions, per_particle=True)
+
+    expected = np.array([
+        ((positions[lag:] - positions[:len(positions) - lag]) ** 2).sum(axis=-1).mean(axis=0)
+        for lag in range(40)
+    ])
+    np.testing.assert_array_equal(lags, np.arange(31))
+    np.testing.assert_allclose(per_particle, expected, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(msd, expected[:31].mean(axis=1), rtol=1e-9, atol=1e-9)
+
+    positions[5, 3] = np.nan
+    _, msd = mean_squared_displacement(positions)
+    np.testing.assert_allclose(msd, np.delete(expected, 3, axis=1).mean(axis=1), rtol=1e-9, atol=1e-9)
+
+
+def test_displacement_and_travel_of_a_trajectory():
+    steps = np.array([[0, 0], [3, 4], [0, 0], [-6, -8]], dtype=np.float64)
+    positions = steps.cumsum(axis=0)[:, None, :].repeat(2, axis=1)
+    traj = Trajectory([1, 2], [0, 10, 20, 30], {"x": positions[..., 0], "y": positions[..., 1]})
+
+    np.testing.assert_array_equal(cumulative_travel(positions)[:, 0], [0, 5, 5, 15])
+    np.testing.assert_array_equal(traj.get_travel(ids=[2])[:, 0], [0, 5, 5, 15])
+    np.testing.assert_array_equal(traj.get_displacement(reference=1)[3, 0], [-6, -8])
+    lags, _ = traj.get_msd()
+    np.testing.assert_array_equal(lags, [0, 10, 20, 30])
+
+
+def test_d2min_is_zero_for_an_affine_deformation():
+    rng = np.random.default_rng(1)
+    reference = rng.uniform(0, 1, (200, 2))
+    strained = reference @ np.array([[1.1, 0.2], [0.0, 0.95]]).T + [0.3, -0.1]
+    np.testing.assert_allclose(d2min(reference, strained, 0.2), 0, atol=1e-12)
+
+    moved = strained.copy()
+    moved[17] += 0.05
+    found = d2min(reference, moved, 0.2)
+    assert np.nanargmax(found) == 17 and found[17] > 1e-4
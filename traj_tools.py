@@ -0,0 +1,490 @@
+from granular_vis.granular_bed.spatial import CellList
+import numpy as np
+
+
+# position fields and the names of their derived velocity and acceleration fields
+DERIVATIVES = (
+    ("x", "v_x", "a_x"), ("xs", "vs_x", "as_x"),
+    ("y", "v_y", "a_y"), ("ys", "vs_y", "as_y"),
+    ("z", "v_z", "a_z"), ("zs", "vs_z", "as_z"),
+)
+
+# the finite difference stencils supported by `differentiate`
+METHODS = ("central", "fourth", "savgol")
+
+# the position fields, in the order of their axes
+POSITIONS = ("x", "y", "z")
+
+
+class Frame:
+    """
+    The particle data of a single frame
+
+        - `idx` : position of the frame in the dump file
+        - `timestep` : the timestep value of the frame
+        - `ids` : sorted array of particle IDs
+        - `columns` : dictionary of 1D float64 arrays by field name, one value per particle
+    """
+
+    def __init__(self, idx: int, timestep: int, ids, columns: dict) -> None:
+        self.idx = idx
+        self.timestep = timestep
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.columns: dict = dict(columns)
+
+    @property
+    def num_particles(self) -> int:
+        return len(self.ids)
+
+    @property
+    def fields(self) -> list[str]:
+        return list(self.columns)
+
+    def get_field(self, field: str) -> np.ndarray:
+        """
+        Method to get the values of a single field
+        """
+        if field not in self.columns:
+            raise KeyError(f"Input parameter \"{field}\" was not found.")
+        return self.columns[field]
+
+
+class Trajectory:
+    """
+    Columnar store of the particle data over a sequence of frames
+
+    The data is kept as one 2D array per field:
+        - `ids` : sorted array of particle IDs, one per column of the field arrays
+        - `timesteps` : array of timestep values, one per row of the field arrays
+        - `columns` : dictionary of <frames> x <particles> float64 arrays by field name
+    """
+
+    def __init__(self, ids, timesteps, columns: dict) -> None:
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.timesteps = np.asarray(timesteps, dtype=np.int64)
+        self.columns: dict = dict(columns)
+
+        # the arrays `extend` appends frames to, with room left for more frames
+        self.__timestep_buffer = None
+        self.__buffers: dict = {}
+
+    @classmethod
+    def from_frames(cls, frames: list[Frame]):  # -> Trajectory:
+        """
+        Method to stack frames holding the same particles and fields into a trajectory
+        """
+        return cls(
+            frames[0].ids,
+            [frame.timestep for frame in frames],
+            {
+                field: np.stack([frame.get_field(field) for frame in frames])
+                for field in frames[0].fields
+            }
+        )
+
+    @property
+    def num_frames(self) -> int:
+        return len(self.timesteps)
+
+    @property
+    def num_particles(self) -> int:
+        return len(self.ids)
+
+    @property
+    def fields(self) -> list[str]:
+        return list(self.columns)
+
+    def get_field(self, field: str) -> np.ndarray:
+        """
+        Method to get the <frames> x <particles> array of a single field
+        """
+        if field not in self.columns:
+            raise KeyError(f"Input parameter \"{field}\" was not found.")
+        return self.columns[field]
+
+    def add_field(self, field: str, values) -> None:
+        """
+        Method to add (or replace) a field, e.g. a derived velocity
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != (self.num_frames, self.num_particles):
+            raise ValueError(f"Field \"{field}\" has shape {values.shape}, "
+                             f"expected {(self.num_frames, self.num_particles)}")
+        self.columns[field] = values
+
+    def differentiate(self, time=None, method: str = "central", window: int = 7, order: int = 2) -> None:
+        """
+        Method to add the velocity and acceleration of every position field, for all the
+        particles at once (see `differentiate` for the arguments)
+            - `time` : the time value of every frame, the timestep values by default
+        """
+        if time is None:
+            time = self.timesteps
+        for field, vel, acc in DERIVATIVES:
+            if field not in self.columns:
+                continue
+            v, a = differentiate(self.get_field(field), time, method=method, window=window, order=order)
+            self.add_field(vel, v)
+            self.add_field(acc, a)
+
+    def differentiate_tail(self, start: int, time=None, method: str = "central", window: int = 7,
+                           order: int = 2) -> None:
+        """
+        Method to update the velocities and accelerations after frames were added from row
+        `start` on, recomputing only the rows whose stencils reach the new frames. Gives the
+        same values as `differentiate` over the whole trajectory.
+        """
+        if time is None:
+            time = self.timesteps
+        time = np.asarray(time)
+
+        # the rows from `first` on change, and their stencils reach back to `lo`
+        reach = stencil_reach(method, window)
+        lo = max(0, start - 2 * reach)
+        first = max(0, start - reach)
+        for field, vel, acc in DERIVATIVES:
+            if field not in self.columns:
+                continue
+            v, a = differentiate(self.get_field(field)[lo:], time[lo:], method=method, window=window, order=order)
+            for name, values in ((vel, v), (acc, a)):
+                if name not in self.columns:
+                    self.add_field(name, np.full((self.num_frames, self.num_particles), np.nan))
+                self.columns[name][first:] = values[first - lo:]
+
+    def extend(self, timesteps, columns: dict) -> None:
+        """
+        Method to add frames of the same particles at the end of the trajectory
+            - Arguments:
+                - `timesteps` : the timestep values of the new frames
+                - `columns` : dictionary of <new frames> x <particles> arrays by field name,
+                  the fields left out are filled with NaN (e.g. the derived ones)
+
+        The arrays grow geometrically, so adding frames one at a time costs amortized
+        constant time per frame.
+        """
+        timesteps = np.atleast_1d(np.asarray(timesteps, dtype=np.int64))
+        for field in columns:
+            if field not in self.columns:
+                raise KeyError(f"Input parameter \"{field}\" was not found.")
+        start = self.num_frames
+        end = start + len(timesteps)
+        self.__reserve(end)
+
+        self.__timestep_buffer[start:end] = timesteps
+        self.timesteps = self.__timestep_buffer[:end]
+        for field in self.fields:
+            buffer = self.__buffers[field]
+            buffer[start:end] = columns[field] if field in columns else np.nan
+            self.columns[field] = buffer[:end]
+
+    def __reserve(self, num_frames: int) -> None:
+        """
+        Method to make sure every array has room for `num_frames` frames, moving the fields
+        that are not backed by a buffer yet (e.g. replaced by `add_field`) into one
+        """
+        def __grow(values, buffer):
+            if buffer is not None and values.base is buffer and len(buffer) >= num_frames:
+                return buffer
+            capacity = max(num_frames, 2 * len(values), 16)
+            grown = np.empty((capacity,) + values.shape[1:], dtype=values.dtype)
+            grown[:len(values)] = values
+            return grown
+
+        self.__timestep_buffer = __grow(self.timesteps, self.__timestep_buffer)
+        self.timesteps = self.__timestep_buffer[:self.num_frames]
+        for field, values in self.columns.items():
+            self.__buffers[field] = __grow(values, self.__buffers.get(field))
+            self.columns[field] = self.__buffers[field][:len(values)]
+
+    def id_index(self, ids) -> np.ndarray:
+        """
+        Method to get the column positions of the particle IDs passed in
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        pos = np.searchsorted(self.ids, ids)
+        found = pos < self.num_particles
+        found[found] = self.ids[pos[found]] == ids[found]
+        if not found.all():
+            raise KeyError(f"Particle IDs {ids[~found][:10].tolist()} were not found.")
+        return pos
+
+    def subset(self, ids=None, fields=None, frames=None):  # -> Trajectory:
+        """
+        Method to get a new trajectory with only the particles, fields and frames passed in
+        """
+        pos = slice(None) if ids is None else self.id_index(ids)
+        frames = slice(None) if frames is None else frames
+        if fields is None:
+            fields = self.fields
+        return Trajectory(
+            self.ids[pos],
+            self.timesteps[frames],
+            {field: self.get_field(field)[frames][:, pos] for field in fields}
+        )
+
+    def get_positions(self, ids=None, frames=None, fields=None) -> np.ndarray:
+        """
+        Method to get the positions as a single <frames> x <particles> x <dimensions> array
+            - `ids` : the particle IDs to keep (e.g. a `Selection`), every particle by default
+            - `frames` : the frames to keep, as an index, slice or array
+            - `fields` : the position fields, the ones of `POSITIONS` in the trajectory by default
+        """
+        if fields is None:
+            fields = [field for field in POSITIONS if field in self.columns]
+        pos = slice(None) if ids is None else self.id_index(np.fromiter(ids, dtype=np.int64))
+        frames = slice(None) if frames is None else frames
+        return np.stack([self.get_field(field)[frames][..., pos] for field in fields], axis=-1)
+
+    def get_displacement(self, reference: int = 0, ids=None, fields=None) -> np.ndarray:
+        """
+        Method to get the displacement of the particles from their position at the frame
+        `reference`, as a <frames> x <particles> x <dimensions> array
+        """
+        positions = self.get_positions(ids=ids, fields=fields)
+        return positions - positions[reference]
+
+    def get_travel(self, ids=None, fields=None) -> np.ndarray:
+        """
+        Method to get the cumulative distance travelled by the particles up to every frame,
+        as a <frames> x <particles> array (see `cumulative_travel`)
+        """
+        return cumulative_travel(self.get_positions(ids=ids, fields=fields))
+
+    def get_msd(self, ids=None, fields=None, max_lag: int = None,
+                per_particle: bool = False) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Method to get the mean squared displacement of the particles over every lag time,
+        see `mean_squared_displacement`
+            - Returns : the lag times in the units of `timesteps`, and the MSD values
+        """
+        lags, msd = mean_squared_displacement(self.get_positions(ids=ids, fields=fields),
+                                              max_lag=max_lag, per_particle=per_particle)
+        if self.num_frames > 1:
+            lags = lags * (self.timesteps[1] - self.timesteps[0])
+        return lags, msd
+
+    def get_d2min(self, reference: int, current: int, cutoff: float, ids=None, fields=None) -> np.ndarray:
+        """
+        Method to get the non-affine motion D2min of every particle between two frames,
+        see `d2min`
+        """
+        positions = self.get_positions(ids=ids, frames=[reference, current], fields=fields)
+        return d2min(positions[0], positions[1], cutoff)
+
+    def get_frame(self, idx: int, fields=None) -> dict[str, np.ndarray]:
+        """
+        Method to get the data of every particle at a single frame, by field name
+        """
+        if fields is None:
+            fields = self.fields
+        return {field: self.get_field(field)[idx] for field in fields}
+
+    def to_snap(self, idx: int, include_only=None) -> dict:
+        """
+        Method to get a single frame in the `p_ID : { field : value }` form used by `Bed`
+        """
+        ids = self.ids
+        frame = self.get_frame(idx)
+        if include_only is not None:
+            keep = np.isin(ids, np.fromiter(include_only, dtype=np.int64))
+            ids = ids[keep]
+            frame = {field: values[keep] for field, values in frame.items()}
+
+        values = np.column_stack([frame[field] for field in frame]).tolist()
+        return {
+            p_ID: dict(zip(frame, p_values))
+            for p_ID, p_values in zip(ids.tolist(), values)
+        }
+
+
+def stencil_reach(method: str = "central", window: int = 7) -> int:
+    """
+    Function to get how many frames away from a frame `differentiate` looks to get its
+    velocity and acceleration
+    """
+    if method == "savgol":
+        return window // 2
+    return 2
+
+
+def differentiate(values, time, method: str = "central", window: int = 7,
+                  order: int = 2) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function to get the first and second time derivatives of an array along its first
+    (frame) axis
+        - Arguments:
+            - `values` : array with one row per frame, e.g. <frames> x <particles>
+            - `time` : the time value of every frame, which can be non-uniformly spaced
+            - `method` : the stencil to use
+                - `'central'` : second order central differences (`np.gradient`), the
+                  acceleration being the gradient of the velocity
+                - `'fourth'` : fourth order central differences over 5 frames
+                - `'savgol'` : Savitzky-Golay smoothing, fitting a polynomial of degree
+                  `order` over `window` frames
+            - `window`, `order` : only used by `'savgol'`
+        - Returns : the (velocity, acceleration) arrays, with the shape of `values`
+
+    The `'fourth'` and `'savgol'` stencils need uniformly spaced time values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    time = np.asarray(time, dtype=np.float64)
+    num_frames = len(time)
+    if values.shape[0] != num_frames:
+        raise ValueError(f"Got {values.shape[0]} frames of values for {num_frames} time values.")
+    if num_frames < 2:
+        raise ValueError("At least 2 frames are needed to differentiate.")
+    if method not in METHODS:
+        raise ValueError(f"Unknown method \"{method}\", expected one of {METHODS}.")
+
+    if method == "central":
+        v = np.gradient(values, time, axis=0)
+        return v, np.gradient(v, time, axis=0)
+
+    steps = np.diff(time)
+    h = steps.mean()
+    if not np.allclose(steps, h, rtol=1e-9, atol=0):
+        raise ValueError(f"The \"{method}\" stencil needs uniformly spaced time values.")
+
+    if method == "fourth":
+        if num_frames < 5:
+            v = np.gradient(values, h, axis=0)
+            return v, np.gradient(v, h, axis=0)
+        # second order one sided differences for the first and last 2 frames
+        v = np.gradient(values, h, axis=0, edge_order=2)
+        a = np.gradient(v, h, axis=0, edge_order=2)
+        x = [values[i:num_frames - 4 + i] for i in range(5)]
+        v[2:-2] = (x[0] - 8 * x[1] + 8 * x[3] - x[4]) / (12 * h)
+        a[2:-2] = (-x[0] + 16 * x[1] - 30 * x[2] + 16 * x[3] - x[4]) / (12 * h ** 2)
+        return v, a
+
+    # Savitzky-Golay
+    if window % 2 == 0 or window <= order:
+        raise ValueError("The savgol window has to be odd and larger than the polynomial order.")
+    if num_frames < window:
+        raise ValueError(f"The savgol window ({window}) is longer than the {num_frames} frames.")
+    half = window // 2
+    v = np.empty_like(values)
+    a = np.empty_like(values)
+    for deriv, out in ((1, v), (2, a)):
+        centre = _savgol_weights(np.zeros(1), half, order, deriv)[0] / h ** deriv
+        out[half:num_frames - half] = np.lib.stride_tricks.sliding_window_view(values, window, axis=0) @ centre
+
+        # the first and last frames use the polynomial fitted over the first and last windows
+        edges = _savgol_weights(np.arange(-half, 0), half, order, deriv) / h ** deriv
+        out[:half] = np.tensordot(edges, values[:window], axes=([1], [0]))
+        edges = _savgol_weights(np.arange(1, half + 1), half, order, deriv) / h ** deriv
+        out[num_frames - half:] = np.tensordot(edges, values[-window:], axes=([1], [0]))
+    return v, a
+
+
+def _savgol_weights(positions, half: int, order: int, deriv: int) -> np.ndarray:
+    """
+    Function to get the weights that give the `deriv`-th derivative, at the positions passed
+    in, of the polynomial fitted over a window of 2 * `half` + 1 unit spaced samples
+    """
+    window = np.arange(-half, half + 1, dtype=np.float64)
+    powers = np.arange(order + 1)
+    fit = np.linalg.pinv(window[:, None] ** powers)
+
+    # derivative of every monomial evaluated at the positions
+    factor = np.array([np.prod(np.arange(p - deriv + 1, p + 1)) if p >= deriv else 0 for p in powers],
+                      dtype=np.float64)
+    positions = np.asarray(positions, dtype=np.float64)
+    evaluated = factor * positions[:, None] ** np.clip(powers - deriv, 0, None)
+    return evaluated @ fit
+
+
+def cumulative_travel(positions) -> np.ndarray:
+    """
+    Function to get the cumulative path length of every particle, summing the distance
+    moved between consecutive frames
+        - `positions` : a <frames> x <particles> x <dimensions> array
+        - Returns : a <frames> x <particles> array, 0 at the first frame
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    steps = np.linalg.norm(np.diff(positions, axis=0), axis=-1)
+    travel = np.zeros(positions.shape[:2])
+    np.cumsum(steps, axis=0, out=travel[1:])
+    return travel
+
+
+def mean_squared_displacement(positions, max_lag: int = None,
+                              per_particle: bool = False) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Function to get the mean squared displacement over every lag time, averaged over all
+    the time origins, with the FFT based algorithm (O(frames log frames) per particle)
+        - Arguments:
+            - `positions` : a <frames> x <particles> x <dimensions> array of uniformly spaced frames
+            - `max_lag` : the largest lag, in frames, the number of frames - 1 by default
+            - `per_particle` : keep the MSD of every particle instead of their mean
+        - Returns : the lags in frames, and the MSD as a <lags> array, or <lags> x <particles>
+          with `per_particle`. Particles with a NaN position in any frame are left out of the
+          mean (and are NaN with `per_particle`).
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    num_frames = positions.shape[0]
+    if max_lag is None:
+        max_lag = num_frames - 1
+    lags = np.arange(min(max_lag, num_frames - 1) + 1)
+    counts = (num_frames - lags)[:, None]
+
+    # S1(m) = sum over the origins k of |r(k)|^2 + |r(k + m)|^2
+    squared = (positions ** 2).sum(axis=-1)
+    cumulative = np.concatenate([np.zeros((1,) + squared.shape[1:]), np.cumsum(squared, axis=0)])
+    s1 = cumulative[num_frames - lags] + cumulative[-1] - cumulative[lags]
+
+    # S2(m) = sum over the origins k of r(k) . r(k + m), as an autocorrelation
+    size = 2 * num_frames
+    spectrum = np.fft.rfft(positions, n=size, axis=0)
+    s2 = np.fft.irfft(spectrum * spectrum.conj(), n=size, axis=0)[:len(lags)].sum(axis=-1)
+
+    msd = (s1 - 2 * s2) / counts
+    msd[0] = 0
+    if per_particle:
+        return lags, msd
+    valid = ~np.isnan(msd).any(axis=0)
+    return lags, msd[:, valid].mean(axis=1) if valid.any() else np.full(len(lags), np.nan)
+
+
+def d2min(reference, current, cutoff: float) -> np.ndarray:
+    """
+    Function to get the non-affine motion D2min (Falk & Langer) of every particle between
+    two frames, i.e. the smallest squared deviation of the moves of its neighbours from a
+    locally affine deformation
+        - Arguments:
+            - `reference`, `current` : <particles> x <dimensions> positions at the two frames
+            - `cutoff` : the neighbours are the particles closer than this in `reference`
+        - Returns : the D2min of every particle, NaN for the particles with a NaN position
+          or without neighbours
+    """
+    reference = np.asarray(reference, dtype=np.float64)
+    current = np.asarray(current, dtype=np.float64)
+    num_particles, dims = reference.shape
+    out = np.full(num_particles, np.nan)
+    valid = np.flatnonzero(~np.isnan(reference).any(axis=1) & ~np.isnan(current).any(axis=1))
+    if len(valid) == 0:
+        return out
+
+    cells = CellList(reference[valid], cell_size=cutoff)
+    i, j, _ = cells.query_radius(reference[valid], cutoff)
+    keep = i != j
+    i, j = valid[i[keep]], valid[j[keep]]
+    before = reference[j] - reference[i]
+    after = current[j] - current[i]
+
+    # with X = sum of after before^T and Y = sum of before before^T over the neighbours,
+    # the best affine map is X Y^-1 and D2min = sum |after|^2 - tr(X Y^-1 X^T)
+    def __sum(values) -> np.ndarray:
+        flat = values.reshape(len(i), -1)
+        return np.stack([np.bincount(i, weights=flat[:, k], minlength=num_particles)
+                         for k in range(flat.shape[1])], axis=1).reshape((num_particles,) + values.shape[1:])
+
+    x = __sum(after[:, :, None] * before[:, None, :])
+    y = __sum(before[:, :, None] * before[:, None, :])
+    total = __sum((after ** 2).sum(axis=1)[:, None])[:, 0]
+    has_neighbours = np.bincount(i, minlength=num_particles) > 0
+
+    rows = np.flatnonzero(has_neighbours)
+    fitted = np.einsum("nij,njk,nlk->nil", x[rows], np.linalg.pinv(y[rows]), x[rows])
+    out[rows] = total[rows] - np.trace(fitted, axis1=1, axis2=2)
+    return out